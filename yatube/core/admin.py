@@ -0,0 +1,18 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Task
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'name', 'status', 'priority', 'attempts',
+                    'run_at', 'created')
+    list_filter = ('status', 'name')
+    readonly_fields = ('last_error',)
+    actions = ('retry',)
+
+    def retry(self, request, queryset):
+        queryset.update(status=Task.QUEUED, locked_at=None,
+                        run_at=timezone.now())
+    retry.short_description = 'Повторить выбранные задачи'
@@ -0,0 +1,190 @@
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.core.cache import cache as default_cache
+from django.utils.cache import (get_cache_key, learn_cache_key,
+                                patch_response_headers)
+
+# Сколько секунд после истечения срока можно отдавать устаревшее значение,
+# пока один из запросов пересчитывает его.
+STALE_TTL = 60
+# Время жизни блокировки пересчёта: если пересчитывающий процесс упал,
+# блокировка освободится сама.
+LOCK_TIMEOUT = 10
+# Коэффициент вероятностного досрочного истечения (XFetch): чем больше,
+# тем раньше начинается пересчёт.
+XFETCH_BETA = 1.0
+# Сколько ждать чужого пересчёта, если отдать вообще нечего.
+WAIT_TIMEOUT = 2
+WAIT_STEP = 0.05
+
+_local = threading.local()
+
+
+@contextmanager
+def bypass():
+    """Внутри блока кешированные значения не читаются, а считаются заново.
+
+    Нужен тем, кто рендерит страницы для других (``prerender --watch``):
+    их результат не должен зависеть от того, что кеш ещё не сброшен.
+    """
+    previous = getattr(_local, 'bypass', False)
+    _local.bypass = True
+    try:
+        yield
+    finally:
+        _local.bypass = previous
+
+
+def bypassed():
+    return getattr(_local, 'bypass', False)
+
+
+def _lock_key(key):
+    return f'{key}:lock'
+
+
+def _should_refresh(delta, expires, now, beta):
+    """XFetch: чем дороже пересчёт и ближе срок, тем вероятнее обновление."""
+    if expires is None:
+        return False
+    return now - delta * beta * math.log(1.0 - random.random()) >= expires
+
+
+def _store(key, value, delta, timeout, cache, stale_ttl):
+    if timeout is None:
+        cache.set(key, (value, delta, None), None)
+    else:
+        cache.set(
+            key, (value, delta, time.time() + timeout), timeout + stale_ttl
+        )
+
+
+def _recompute(key, timeout, recompute, cache, stale_ttl, should_store):
+    start = time.monotonic()
+    value = recompute()
+    delta = time.monotonic() - start
+    if should_store(value):
+        _store(key, value, delta, timeout, cache, stale_ttl)
+    return value
+
+
+def _wait_for(key, cache, wait_timeout):
+    deadline = time.monotonic() + wait_timeout
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def get_or_recompute(key, timeout, recompute, cache=None,
+                     stale_ttl=STALE_TTL, lock_timeout=LOCK_TIMEOUT,
+                     beta=XFETCH_BETA, wait_timeout=WAIT_TIMEOUT,
+                     should_store=lambda value: True):
+    """Достаёт значение из кеша, защищая пересчёт от «набега» запросов.
+
+    Пересчитывает значение только тот запрос, которому удалось взять
+    блокировку; остальные получают устаревшее значение (stale-while-
+    revalidate), а если его нет — недолго ждут результата. Срок жизни
+    вероятностно сокращается (XFetch), поэтому пересчёт обычно начинается
+    до того, как значение истечёт у всех одновременно.
+    """
+    cache = cache or default_cache
+    if bypassed():
+        # Свежее значение заодно обновляет кеш для остальных.
+        return _recompute(
+            key, timeout, recompute, cache, stale_ttl, should_store
+        )
+    entry = cache.get(key)
+    if entry is not None:
+        value, delta, expires = entry
+        if not _should_refresh(delta, expires, time.time(), beta):
+            return value
+        if not cache.add(_lock_key(key), 1, lock_timeout):
+            return value
+    elif not cache.add(_lock_key(key), 1, lock_timeout):
+        entry = _wait_for(key, cache, wait_timeout)
+        if entry is not None:
+            return entry[0]
+        return _recompute(
+            key, timeout, recompute, cache, stale_ttl, should_store
+        )
+    try:
+        return _recompute(
+            key, timeout, recompute, cache, stale_ttl, should_store
+        )
+    finally:
+        cache.delete(_lock_key(key))
+
+
+def _response_cacheable(response):
+    # Те же правила, что у UpdateCacheMiddleware, только строже с куками:
+    # ответ с Set-Cookie не должен достаться другому посетителю.
+    return (response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and 'private' not in response.get('Cache-Control', ()))
+
+
+def _render(response):
+    if hasattr(response, 'render') and callable(response.render):
+        response.render()
+    return response
+
+
+def stampede_cache_page(timeout, key_prefix='stampede_page', cache=None,
+                        **options):
+    """Кеширует страницу целиком для анонимных GET-запросов.
+
+    В отличие от ``cache_page`` пересчёт страницы выполняет один запрос,
+    а остальные получают предыдущую версию. Ключ и заголовки ответа
+    строятся средствами ``django.utils.cache``, так что учитывается Vary;
+    потоковые ответы и ответы с куками не кешируются.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD')
+                    or request.user.is_authenticated):
+                return view_func(request, *args, **kwargs)
+            page_cache = cache or default_cache
+            stale_ttl = options.get('stale_ttl', STALE_TTL)
+            # Список Vary живёт столько же, сколько устаревшая страница.
+            headers_timeout = None if timeout is None else timeout + stale_ttl
+
+            def recompute():
+                response = _render(view_func(request, *args, **kwargs))
+                if _response_cacheable(response):
+                    patch_response_headers(response, timeout)
+                    if request.method == 'GET':
+                        learn_cache_key(request, response, headers_timeout,
+                                        key_prefix, page_cache)
+                return response
+
+            key = get_cache_key(request, key_prefix, 'GET', page_cache)
+            if key is None:
+                # Заголовки Vary страницы ещё неизвестны: их запоминает
+                # первый полный GET, по ним же строится ключ.
+                start = time.monotonic()
+                response = recompute()
+                key = get_cache_key(request, key_prefix, 'GET', page_cache)
+                if key is not None and _response_cacheable(response):
+                    _store(key, response, time.monotonic() - start,
+                           timeout, page_cache, stale_ttl)
+                return response
+            return get_or_recompute(
+                key,
+                timeout,
+                recompute,
+                cache=page_cache,
+                should_store=_response_cacheable,
+                **options,
+            )
+        return _wrapped_view
+    return decorator
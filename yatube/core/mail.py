@@ -0,0 +1,74 @@
+import base64
+from email.mime.base import MIMEBase
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+
+from .tasks import HIGH, task
+
+
+def _encode_attachment(attachment):
+    filename, content, mimetype = attachment
+    if isinstance(content, str):
+        return [filename, content, mimetype, False]
+    return [filename, base64.b64encode(content).decode(), mimetype, True]
+
+
+def _decode_attachment(filename, content, mimetype, is_binary):
+    if is_binary:
+        content = base64.b64decode(content)
+    return filename, content, mimetype
+
+
+@task(priority=HIGH, max_retries=3)
+def send_email(data):
+    message = EmailMultiAlternatives(
+        subject=data['subject'],
+        body=data['body'],
+        from_email=data['from_email'],
+        to=data['to'],
+        cc=data['cc'],
+        bcc=data['bcc'],
+        reply_to=data['reply_to'],
+        headers=data['headers'],
+        alternatives=[tuple(a) for a in data['alternatives']],
+        attachments=[_decode_attachment(*a) for a in data['attachments']],
+    )
+    connection = get_connection(settings.QUEUED_EMAIL_BACKEND,
+                                fail_silently=False)
+    connection.send_messages([message])
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """Ставит письма в очередь фоновых задач вместо отправки.
+
+    Отправляет их исполнитель через QUEUED_EMAIL_BACKEND, так что
+    запрос не ждёт ни SMTP, ни диска.
+    """
+
+    def send_messages(self, email_messages):
+        for message in email_messages:
+            if any(isinstance(a, MIMEBase) for a in message.attachments):
+                # Готовые MIME-части в JSON не сохранить — шлём сразу.
+                get_connection(settings.QUEUED_EMAIL_BACKEND).send_messages(
+                    [message]
+                )
+                continue
+            send_email.delay({
+                'subject': str(message.subject),
+                'body': str(message.body),
+                'from_email': message.from_email,
+                'to': list(message.to),
+                'cc': list(message.cc),
+                'bcc': list(message.bcc),
+                'reply_to': list(message.reply_to),
+                'headers': dict(message.extra_headers),
+                'alternatives': [
+                    list(a) for a in getattr(message, 'alternatives', [])
+                ],
+                'attachments': [
+                    _encode_attachment(a) for a in message.attachments
+                ],
+            })
+        return len(email_messages)
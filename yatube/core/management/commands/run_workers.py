@@ -0,0 +1,71 @@
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.tasks import run_pending, work
+
+
+def _worker(poll_interval):
+    # Соединение родителя после fork использовать нельзя.
+    connections.close_all()
+    stop = threading.Event()
+    # По SIGTERM исполнитель доделывает текущую задачу и выходит.
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    work(poll_interval, stop)
+
+
+class Command(BaseCommand):
+    help = 'Запускает процессы, выполняющие фоновые задачи из очереди.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count(),
+            help='Сколько процессов-исполнителей держать.'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Пауза при пустой очереди, секунд.'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи в этом процессе и выйти.'
+        )
+
+    def handle(self, *args, **options):
+        if options['once']:
+            done = run_pending()
+            self.stdout.write(self.style.SUCCESS(f'Выполнено задач: {done}'))
+            return
+        connections.close_all()
+        processes = {}
+        stopping = False
+
+        def stop(signum, frame):
+            nonlocal stopping
+            stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        self.stdout.write(f'Исполнителей: {options["processes"]}')
+        while not stopping:
+            # Упавший исполнитель заменяем новым.
+            for index in range(options['processes']):
+                process = processes.get(index)
+                if process is None or not process.is_alive():
+                    process = multiprocessing.Process(
+                        target=_worker, args=(options['poll_interval'],),
+                        name=f'task-worker-{index}', daemon=True,
+                    )
+                    process.start()
+                    processes[index] = process
+            time.sleep(1)
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
@@ -0,0 +1,47 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from .warmup import PROCESS_STARTED, WARMUP_HEADER
+
+logger = logging.getLogger(__name__)
+
+# Замер один на процесс, а не на экземпляр middleware: обработчик (и
+# вместе с ним middleware) может создаваться в процессе не один раз.
+_requests = 0
+_measured = None
+_lock = threading.Lock()
+
+
+class FirstFastRequestMiddleware:
+    """Замеряет, через сколько после старта процесс отдал быстрый ответ.
+
+    Быстрым считается запрос короче FAST_REQUEST_THRESHOLD секунд;
+    результат пишется в лог один раз за жизнь процесса.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = settings.FAST_REQUEST_THRESHOLD
+
+    def __call__(self, request):
+        global _requests, _measured
+        if _measured is not None or WARMUP_HEADER in request.META:
+            return self.get_response(request)
+        start = time.monotonic()
+        response = self.get_response(request)
+        finished = time.monotonic()
+        with _lock:
+            if _measured is not None:
+                return response
+            _requests += 1
+            if finished - start >= self.threshold:
+                return response
+            _measured = finished - PROCESS_STARTED
+        logger.info(
+            'First fast request after %.3fs (%d requests since start)',
+            _measured, _requests,
+        )
+        return response
@@ -0,0 +1,208 @@
+import heapq
+import itertools
+import logging
+import threading
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Page, Paginator
+from django.db import connection
+from django.db.models import Max, QuerySet
+from django.utils.functional import cached_property
+
+from .querycache import cacheable, query_fingerprint, query_generations
+
+logger = logging.getLogger(__name__)
+
+# До скольких строк считаем точно; дальше — оценка.
+EXACT_COUNT_LIMIT = 10000
+# Сколько номеров страниц показывать по обе стороны от текущей.
+PAGE_WINDOW = 2
+COUNT_KEY = 'count:{}'
+COUNT_LOCK_TIMEOUT = 60
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор без полного COUNT(*) по большим таблицам.
+
+    Без фильтров число строк оценивается по MAX(pk) — это один проход
+    по первичному ключу. Оценка верна, только пока ключи идут подряд:
+    если среди последних exact_count_limit значений ключа занята меньше
+    половины (например, id из шардов — это числа порядка 2**62), она
+    не годится. Тогда, как и с фильтрами, считается не больше
+    EXACT_COUNT_LIMIT строк, а дальние страницы просто недоступны.
+    """
+
+    exact_count_limit = EXACT_COUNT_LIMIT
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by()
+        if not queryset.query.where:
+            estimate = queryset.aggregate(max_pk=Max('pk'))['max_pk'] or 0
+            if (estimate > self.exact_count_limit
+                    and self._dense_below(queryset, estimate)):
+                return estimate
+        return queryset[:self.exact_count_limit].count()
+
+    def _dense_below(self, queryset, max_pk):
+        window = self.exact_count_limit
+        recent = queryset.filter(pk__gt=max_pk - window).count()
+        return recent * 2 >= window
+
+
+def _refresh_count(queryset, key, lock_key):
+    try:
+        generations = query_generations(queryset)
+        cache.set(key, (queryset.count(), generations), None)
+    except Exception:
+        logger.exception('Failed to refresh count %s', key)
+    finally:
+        cache.delete(lock_key)
+        connection.close()
+
+
+def cached_count(queryset):
+    """Число строк запроса из кеша.
+
+    Пока в затронутые модели никто не писал, значение точное. После
+    записи отдаётся прежнее число, а пересчёт запускается в фоновом
+    потоке (один на все процессы, которые делят кеш).
+    """
+    queryset = queryset.order_by()
+    if not cacheable(queryset):
+        return queryset.count()
+    try:
+        key = COUNT_KEY.format(query_fingerprint('count', queryset))
+    except EmptyResultSet:
+        return 0
+    entry = cache.get(key)
+    if entry is None:
+        count = queryset.count()
+        cache.set(key, (count, query_generations(queryset)), None)
+        return count
+    count, generations = entry
+    lock_key = f'{key}:lock'
+    if (generations != query_generations(queryset)
+            and cache.add(lock_key, 1, COUNT_LOCK_TIMEOUT)):
+        threading.Thread(
+            target=_refresh_count,
+            args=(queryset.all(), key, lock_key),
+            daemon=True,
+        ).start()
+    return count
+
+
+def refresh_count(queryset):
+    """Пересчитывает закешированное число строк запроса прямо сейчас."""
+    queryset = queryset.order_by()
+    try:
+        key = COUNT_KEY.format(query_fingerprint('count', queryset))
+    except EmptyResultSet:
+        return 0
+    # Поколения читаем до подсчёта: запись между ними даст лишний
+    # пересчёт, а не устаревшее число.
+    generations = query_generations(queryset)
+    count = queryset.count()
+    cache.set(key, (count, generations), None)
+    return count
+
+
+class ChainedSequence:
+    """Несколько запросов подряд как один список для пагинатора.
+
+    Срез читает только те запросы, в которые попадает, — например,
+    горячую таблицу и, когда она кончилась, архив.
+    """
+
+    def __init__(self, *querysets):
+        self.querysets = querysets
+
+    def count(self):
+        return sum(cached_count(queryset) for queryset in self.querysets)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        result = []
+        for queryset in self.querysets:
+            if stop is not None and stop <= 0:
+                break
+            rows = list(queryset[start:stop])
+            result += rows
+            if stop is not None and len(rows) == stop - start:
+                break
+            # Запрос кончился. Сдвиг для следующего считаем по прочитанным
+            # строкам, а не по cached_count: после записи тот отстаёт, и
+            # страницы перекрывались бы. COUNT нужен, только если срез
+            # целиком за концом запроса.
+            if rows or not start:
+                size = start + len(rows)
+            else:
+                size = queryset.count()
+            start = max(0, start - size)
+            stop = None if stop is None else stop - size
+        return result
+
+
+class MergedSequence:
+    """Слияние одинаково упорядоченных запросов к разным базам.
+
+    Для страницы ``[start:stop]`` из каждой базы читаются первые ``stop``
+    строк, и они сливаются по ключу сортировки: глубокие страницы
+    дороже, но каждая база отдаёт строки по своему индексу.
+    """
+
+    def __init__(self, querysets, key, reverse=True):
+        self.querysets = querysets
+        self.key = key
+        self.reverse = reverse
+
+    def count(self):
+        return sum(cached_count(queryset) for queryset in self.querysets)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        if stop is None:
+            stop = self.count()
+        merged = heapq.merge(
+            *(list(queryset[:stop]) for queryset in self.querysets),
+            key=self.key, reverse=self.reverse,
+        )
+        return list(itertools.islice(merged, start, stop))
+
+
+class WindowedPage(Page):
+    @property
+    def page_window(self):
+        """Номера страниц вокруг текущей."""
+        return range(
+            max(1, self.number - PAGE_WINDOW),
+            min(self.paginator.num_pages, self.number + PAGE_WINDOW) + 1,
+        )
+
+
+class CachedCountPaginator(Paginator):
+    """Пагинатор с кешированным числом строк и окном номеров страниц.
+
+    Навигация выводит только соседние страницы, поэтому её отрисовка
+    не зависит от числа страниц.
+    """
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            return cached_count(self.object_list)
+        return super().count
+
+    def _get_page(self, *args, **kwargs):
+        return WindowedPage(*args, **kwargs)
@@ -0,0 +1,146 @@
+import hashlib
+import time
+from functools import lru_cache
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.http import Http404
+from django.shortcuts import _get_queryset
+
+from .cache import bypassed
+
+TIMEOUT = 300
+GENERATION_KEY = 'querycache:gen:{}'
+# Маркер закешированного «ничего не найдено».
+NOT_FOUND = 'querycache:not-found'
+
+
+@lru_cache(maxsize=None)
+def _models_by_table():
+    return {model._meta.db_table: model for model in apps.get_models(
+        include_auto_created=True
+    )}
+
+
+def _touched_models(queryset):
+    """Модели всех таблиц, которые участвуют в запросе."""
+    tables = {queryset.model._meta.db_table}
+    tables.update(
+        join.table_name for join in queryset.query.alias_map.values()
+    )
+    models = _models_by_table()
+    return sorted(models[table]._meta.label for table in tables
+                  if table in models)
+
+
+def _generations(labels):
+    keys = [GENERATION_KEY.format(label) for label in labels]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, time.time_ns(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def query_fingerprint(kind, queryset):
+    """Хеш SQL запроса; может бросить EmptyResultSet."""
+    sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    raw = f'{kind}|{queryset.db}|{sql}|{params!r}'
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def query_generations(queryset):
+    """Поколения моделей запроса: меняются при любой записи в них."""
+    return _generations(_touched_models(queryset))
+
+
+def _cache_key(kind, queryset):
+    fingerprint = query_fingerprint(kind, queryset)
+    raw = f'{fingerprint}|{query_generations(queryset)}'
+    return f'querycache:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def cacheable(queryset):
+    # Внутри транзакции запрос может видеть незафиксированные данные,
+    # которые нельзя показывать остальным.
+    return (not bypassed()
+            and not transaction.get_connection(queryset.db).in_atomic_block)
+
+
+def _cached(kind, queryset, evaluate, timeout):
+    if not cacheable(queryset):
+        return evaluate()
+    try:
+        key = _cache_key(kind, queryset)
+    except EmptyResultSet:
+        return evaluate()
+    return cache.get_or_set(key, evaluate, timeout)
+
+
+def cached_get(queryset, *args, timeout=TIMEOUT, **kwargs):
+    """``queryset.get()`` с кешированием результата.
+
+    Кеш сбрасывается при сохранении или удалении любой модели, таблицы
+    которой участвуют в запросе. Массовые ``update()`` и ``bulk_create()``
+    сигналов не шлют — после них нужно вызвать ``invalidate()``.
+    """
+    queryset = _get_queryset(queryset).filter(*args, **kwargs)
+
+    def evaluate():
+        try:
+            return queryset.get()
+        except queryset.model.DoesNotExist:
+            return NOT_FOUND
+
+    result = _cached('get', queryset, evaluate, timeout)
+    if result == NOT_FOUND:
+        raise queryset.model.DoesNotExist(
+            f'{queryset.model._meta.object_name} matching query '
+            f'does not exist.'
+        )
+    return result
+
+
+def cached_exists(queryset, timeout=TIMEOUT):
+    """``queryset.exists()`` с кешированием результата."""
+    return _cached('exists', queryset, queryset.exists, timeout)
+
+
+def get_object_or_404_cached(klass, *args, **kwargs):
+    queryset = _get_queryset(klass)
+    try:
+        return cached_get(queryset, *args, **kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(
+            f'No {queryset.model._meta.object_name} matches the given query.'
+        )
+
+
+def invalidate(*models):
+    for model in models:
+        key = GENERATION_KEY.format(model._meta.label)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_on_change(sender, **kwargs):
+    invalidate(sender)
+    if transaction.get_connection(kwargs.get('using')).in_atomic_block:
+        # Чтение между записью и фиксацией могло закешировать старые данные.
+        transaction.on_commit(lambda: invalidate(sender),
+                              using=kwargs.get('using'))
+
+
+@receiver(m2m_changed)
+def invalidate_on_m2m_change(sender, action, **kwargs):
+    if action.startswith('post_'):
+        invalidate(sender)
@@ -0,0 +1,157 @@
+"""Ограничение частоты записи и сброс нагрузки.
+
+Каждый пользователь и каждый IP получают ведро токенов на действие
+(RATE_LIMITS): ведро вмещает N токенов и пополняется на N за период.
+Ведро хранится в кеше одним числом — моментом, когда оно снова станет
+полным (алгоритм GCRA), — и списывается ``cache.incr``, без чтения и
+блокировок. Атомарен incr только в memcached (см. CACHES).
+
+Отдельно число одновременных запросов на запись во всех процессах
+машины ограничено WRITE_CONCURRENCY: место — это flock на одном из
+файлов в WRITE_SLOTS_DIR, и его освобождает ОС, даже если процесс упал.
+Лишние запросы ждут не дольше SHED_TIMEOUT и получают 503, а не встают
+в очередь за блокировкой SQLite.
+"""
+import fcntl
+import math
+import os
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .views import too_many_requests
+
+KEY = 'ratelimit:{}:{}'
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+# Один IP может быть у многих пользователей (NAT, общежитие).
+IP_FACTOR = 4
+SHED_RETRY_AFTER = 1
+# Как часто проверять, не освободилось ли место для записи, секунд.
+SLOT_POLL = 0.01
+
+
+def parse_rate(rate):
+    """'10/m' -> (10 токенов, 60 секунд)."""
+    count, _, period = rate.partition('/')
+    return int(count), PERIODS[period]
+
+
+def take(key, capacity, period):
+    """Списывает токен; возвращает 0 или сколько секунд ждать."""
+    interval = period * 1000 // capacity
+    now = int(time.time() * 1000)
+    timeout = period + 1
+    # Значение — момент (мс), когда ведро снова станет полным.
+    cache.add(key, now, timeout)
+    try:
+        full_at = cache.incr(key, interval)
+    except ValueError:
+        # Ключ вытеснили между add и incr.
+        full_at = now + interval
+        cache.set(key, full_at, timeout)
+    if full_at - interval < now:
+        # Ведро простояло полным: накопленное сверх ёмкости сгорает.
+        cache.set(key, now + interval, timeout)
+        return 0
+    excess = full_at - now - capacity * interval
+    if excess <= 0:
+        cache.touch(key, timeout)
+        return 0
+    cache.decr(key, interval)
+    return math.ceil(excess / 1000)
+
+
+def client_ip(request):
+    """IP клиента; за доверенным прокси — из его заголовка.
+
+    Цепочку X-Forwarded-For читаем справа налево: первый адрес, который
+    дописал не наш прокси, и есть клиент. Левее него — что угодно.
+    """
+    trusted = settings.RATELIMIT_TRUSTED_PROXIES
+    address = request.META.get('REMOTE_ADDR', '')
+    if address not in trusted:
+        return address
+    forwarded = request.META.get(settings.RATELIMIT_PROXY_HEADER, '')
+    for hop in reversed(forwarded.split(',')):
+        hop = hop.strip()
+        if not hop:
+            continue
+        address = hop
+        if address not in trusted:
+            break
+    return address
+
+
+def check(request, scope):
+    """Секунды до следующей попытки или 0, если запрос можно пустить."""
+    if not settings.RATELIMIT_ENABLED:
+        return 0
+    capacity, period = parse_rate(settings.RATE_LIMITS[scope])
+    buckets = [(KEY.format(scope, f'ip:{client_ip(request)}'),
+                capacity * IP_FACTOR)]
+    if request.user.is_authenticated:
+        buckets.append((KEY.format(scope, f'user:{request.user.pk}'),
+                        capacity))
+    return max(take(key, size, period) for key, size in buckets)
+
+
+def _try_slot(number):
+    path = os.path.join(settings.WRITE_SLOTS_DIR, f'slot-{number}.lock')
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def acquire_slot(timeout):
+    """Занимает место для записи; None, если за timeout не освободилось."""
+    os.makedirs(settings.WRITE_SLOTS_DIR, exist_ok=True)
+    slots = settings.WRITE_CONCURRENCY
+    deadline = time.monotonic() + timeout
+    while True:
+        # С случайного места, чтобы не толкаться всем у первого файла.
+        first = random.randrange(slots)
+        for offset in range(slots):
+            fd = _try_slot((first + offset) % slots)
+            if fd is not None:
+                return fd
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(SLOT_POLL)
+
+
+def release_slot(fd):
+    # Закрытие файла снимает flock.
+    os.close(fd)
+
+
+def ratelimit(scope, methods=('POST',)):
+    """Декоратор представления: ведро токенов scope и общий лимит записи.
+
+    Ограничиваются только запросы с методами из methods; остальные
+    (например, GET формы) проходят как есть.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return view(request, *args, **kwargs)
+            retry_after = check(request, scope)
+            if retry_after:
+                return too_many_requests(request, retry_after)
+            slot = acquire_slot(settings.SHED_TIMEOUT)
+            if slot is None:
+                return too_many_requests(request, SHED_RETRY_AFTER,
+                                         status=503)
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                release_slot(slot)
+        return wrapper
+    return decorator
@@ -0,0 +1,140 @@
+import gzip
+import json
+import mimetypes
+import os
+import posixpath
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = (
+    '.css', '.js', '.svg', '.txt', '.html', '.json', '.ico', '.map',
+)
+# Сжимать мелочь нет смысла: заголовки съедят выигрыш.
+MIN_COMPRESS_SIZE = 256
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=60'
+
+
+def _compressors():
+    yield '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+    if brotli is not None:
+        yield '.br', lambda data: brotli.compress(data, quality=11)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Хеширует имена статики и заранее сжимает её в gzip и Brotli.
+
+    Brotli включается, если установлен пакет ``brotli``. Пока manifest
+    не собран (разработка, тесты), файлы отдаются под исходными именами.
+    Ссылка на отсутствующий файл тоже остаётся как есть и даёт 404, а не
+    ошибку рендеринга всей страницы.
+    """
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            if not name.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            with self.open(name) as file:
+                data = file.read()
+            if len(data) < MIN_COMPRESS_SIZE:
+                continue
+            for suffix, compress in _compressors():
+                compressed = compress(data)
+                if len(compressed) >= len(data):
+                    continue
+                if self.exists(name + suffix):
+                    self.delete(name + suffix)
+                self._save(name + suffix, ContentFile(compressed))
+                yield name, name + suffix, True
+
+
+def _accepted_encodings(header):
+    encodings = set()
+    for item in header.split(','):
+        encoding, _, params = item.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00'):
+            continue
+        encodings.add(encoding.strip().lower())
+    return encodings
+
+
+class PrecompressedStaticFiles:
+    """WSGI-обёртка, которая отдаёт собранную статику без Django.
+
+    Выбирает заранее сжатый вариант по Accept-Encoding, а файлам с
+    хешем в имени ставит вечный immutable-кеш: браузер больше не
+    перепроверяет их при повторных визитах.
+    """
+
+    encodings = (('br', '.br'), ('gzip', '.gz'))
+
+    def __init__(self, application, root=None, prefix=None):
+        self.application = application
+        self.root = root or settings.STATIC_ROOT
+        self.prefix = prefix or settings.STATIC_URL
+        self.hashed = self._load_hashed_names()
+
+    def _load_hashed_names(self):
+        path = os.path.join(self.root or '', 'staticfiles.json')
+        try:
+            with open(path) as manifest:
+                return set(json.load(manifest).get('paths', {}).values())
+        except (OSError, ValueError):
+            return set()
+
+    def _resolve(self, path_info):
+        if not self.root or not path_info.startswith(self.prefix):
+            return None
+        name = posixpath.normpath(path_info[len(self.prefix):]).lstrip('/')
+        if name.startswith('..') or name in ('', '.'):
+            return None
+        full_path = os.path.join(self.root, *name.split('/'))
+        return name, full_path if os.path.isfile(full_path) else None
+
+    def __call__(self, environ, start_response):
+        resolved = None
+        if environ.get('REQUEST_METHOD') in ('GET', 'HEAD'):
+            resolved = self._resolve(environ.get('PATH_INFO', ''))
+        if resolved is None or resolved[1] is None:
+            return self.application(environ, start_response)
+        name, full_path = resolved
+        headers = [('Vary', 'Accept-Encoding')]
+        accepted = _accepted_encodings(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        for encoding, suffix in self.encodings:
+            if encoding in accepted and os.path.isfile(full_path + suffix):
+                full_path += suffix
+                headers.append(('Content-Encoding', encoding))
+                break
+        content_type, _ = mimetypes.guess_type(name)
+        headers += [
+            ('Content-Type', content_type or 'application/octet-stream'),
+            ('Content-Length', str(os.path.getsize(full_path))),
+            ('Cache-Control', IMMUTABLE_CACHE_CONTROL
+             if name in self.hashed else DEFAULT_CACHE_CONTROL),
+        ]
+        start_response('200 OK', headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        file = open(full_path, 'rb')
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            return file_wrapper(file)
+        return iter(lambda: file.read(64 * 1024), b'')
@@ -0,0 +1,178 @@
+"""Потоковый рендеринг страниц, наследующих base.html.
+
+Шаблон отдаётся по верхнеуровневым узлам: ``{% extends %}`` и
+``{% block %}`` разворачиваются на лету, а ``{% for %}`` по QuerySet
+выдаёт разметку по мере того, как ``iterator()`` читает строки. Перед
+циклом накопленное (``<head>`` и шапка) отправляется клиенту, так что
+браузер начинает грузить CSS, пока идут запросы ленты.
+"""
+from django.conf import settings
+from django.core.paginator import Page
+from django.db.models.query import QuerySet
+from django.http import StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.shortcuts import render
+from django.template import loader
+from django.template.base import TextNode
+from django.template.context import make_context
+from django.template.defaulttags import ForNode
+from django.template.loader_tags import (BLOCK_CONTEXT_KEY, BlockContext,
+                                         BlockNode, ExtendsNode)
+from django.utils.cache import patch_vary_headers
+
+# Сколько байт копить перед отправкой очередного куска.
+CHUNK_SIZE = 8 * 1024
+ITERATOR_CHUNK_SIZE = 100
+# Маркер «отправить накопленное сейчас».
+FLUSH = object()
+
+
+def _iter_extends(node, context):
+    # Повторяет ExtendsNode.render, но не склеивает результат.
+    compiled_parent = node.get_parent(context)
+    if BLOCK_CONTEXT_KEY not in context.render_context:
+        context.render_context[BLOCK_CONTEXT_KEY] = BlockContext()
+    block_context = context.render_context[BLOCK_CONTEXT_KEY]
+    block_context.add_blocks(node.blocks)
+    for parent_node in compiled_parent.nodelist:
+        if not isinstance(parent_node, TextNode):
+            if not isinstance(parent_node, ExtendsNode):
+                block_context.add_blocks({
+                    n.name: n for n in
+                    compiled_parent.nodelist.get_nodes_by_type(BlockNode)
+                })
+            break
+    with context.render_context.push_state(compiled_parent,
+                                           isolated_context=False):
+        yield from iter_nodes(compiled_parent.nodelist, context)
+
+
+def _iter_block(node, context):
+    # Повторяет BlockNode.render.
+    block_context = context.render_context.get(BLOCK_CONTEXT_KEY)
+    with context.push():
+        if block_context is None:
+            context['block'] = node
+            yield from iter_nodes(node.nodelist, context)
+            return
+        push = block = block_context.pop(node.name)
+        if block is None:
+            block = node
+        block = type(node)(block.name, block.nodelist)
+        block.context = context
+        context['block'] = block
+        yield from iter_nodes(block.nodelist, context)
+        if push is not None:
+            block_context.push(node.name, push)
+
+
+def _with_last(iterable):
+    """Пары (элемент, последний ли он) без знания длины заранее."""
+    iterator = iter(iterable)
+    try:
+        previous = next(iterator)
+    except StopIteration:
+        return
+    for item in iterator:
+        yield previous, False
+        previous = item
+    yield previous, True
+
+
+def _iter_for(node, context):
+    # Повторяет ForNode.render для цикла с одной переменной.
+    parentloop = context['forloop'] if 'forloop' in context else {}
+    with context.push():
+        values = node.sequence.resolve(context, ignore_failures=True)
+        if isinstance(values, Page):
+            values = values.object_list
+        if isinstance(values, QuerySet) and values._result_cache is None:
+            length = None
+            values = values.iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+        else:
+            values = list(values or [])
+            length = len(values)
+        yield FLUSH
+        loop_dict = context['forloop'] = {'parentloop': parentloop}
+        empty = True
+        for i, (item, last) in enumerate(_with_last(values)):
+            empty = False
+            loop_dict['counter0'] = i
+            loop_dict['counter'] = i + 1
+            if length is not None:
+                loop_dict['revcounter'] = length - i
+                loop_dict['revcounter0'] = length - i - 1
+            loop_dict['first'] = i == 0
+            loop_dict['last'] = last
+            context[node.loopvars[0]] = item
+            yield from iter_nodes(node.nodelist_loop, context)
+        if empty:
+            yield from iter_nodes(node.nodelist_empty, context)
+
+
+def iter_nodes(nodelist, context):
+    for node in nodelist:
+        if isinstance(node, ExtendsNode):
+            yield from _iter_extends(node, context)
+        elif isinstance(node, BlockNode):
+            yield from _iter_block(node, context)
+        elif (isinstance(node, ForNode) and not node.is_reversed
+                and len(node.loopvars) == 1):
+            yield from _iter_for(node, context)
+        else:
+            yield node.render_annotated(context)
+
+
+def _chunks(pieces, chunk_size=CHUNK_SIZE):
+    buffer = []
+    size = 0
+    for piece in pieces:
+        if piece is FLUSH:
+            if buffer:
+                yield ''.join(buffer)
+                buffer, size = [], 0
+            continue
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_template(template_name, context=None, request=None):
+    """Генератор кусков HTML; рендеринг идёт по мере чтения."""
+    template = loader.get_template(template_name).template
+    context = make_context(context, request,
+                           autoescape=template.engine.autoescape)
+
+    def pieces():
+        with context.render_context.push_state(template):
+            with context.bind_template(template):
+                context.template_name = template.name
+                yield from iter_nodes(template.nodelist, context)
+
+    return _chunks(pieces())
+
+
+def render_streaming(request, template_name, context=None):
+    """Аналог ``render()``, отдающий страницу потоком.
+
+    Включается настройкой STREAMING_RESPONSES; без неё это обычный
+    ``render()``, у ответа которого есть ``content`` и ``context``.
+    Ошибка шаблона посреди потока уже не превратится в страницу 500:
+    заголовки к этому времени отправлены.
+    """
+    if not settings.STREAMING_RESPONSES:
+        return render(request, template_name, context)
+    # Cookie и заголовки уходят до рендеринга, поэтому всё, что шаблон
+    # может в них потребовать, делаем заранее: обращение к пользователю
+    # читает сессию (Vary: Cookie), а формы есть только у вошедших.
+    if request.user.is_authenticated:
+        get_token(request)
+    response = StreamingHttpResponse(
+        stream_template(template_name, context, request)
+    )
+    patch_vary_headers(response, ('Cookie',))
+    return response
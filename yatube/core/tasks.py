@@ -0,0 +1,155 @@
+"""Очередь фоновых задач в базе данных.
+
+Задача объявляется декоратором ``@task`` и ставится в очередь вызовом
+``.delay()``; выполняют её процессы ``manage.py run_workers``. Постановка
+— это одна вставка строки, поэтому она идёт в той же транзакции, что и
+запрос: откат транзакции отменяет и задачу.
+"""
+import json
+import logging
+import os
+import threading
+import traceback
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules, import_string
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+HIGH = 10
+NORMAL = 0
+LOW = -10
+# Задержка перед повтором: BACKOFF_BASE * 2 ** (попытка - 1) секунд.
+BACKOFF_BASE = 5
+MAX_BACKOFF = 3600
+# Задачу, которую выполняют дольше этого, считаем брошенной упавшим
+# процессом и возвращаем в очередь.
+LOCK_TIMEOUT = 600
+# Сколько раз пытаться перехватить задачу у соседних процессов.
+CLAIM_ATTEMPTS = 5
+
+_registry = {}
+
+
+def task(priority=NORMAL, max_retries=0):
+    """Регистрирует функцию как фоновую задачу.
+
+    Функция остаётся обычной и вызывается напрямую, а ``func.delay()``
+    ставит её в очередь. Аргументы должны сериализоваться в JSON.
+    """
+    def decorator(func):
+        name = f'{func.__module__}.{func.__qualname__}'
+        _registry[name] = func
+
+        @wraps(func)
+        def delay(*args, **kwargs):
+            return enqueue(name, args, kwargs, priority=priority,
+                           max_attempts=max_retries + 1)
+
+        func.task_name = name
+        func.delay = delay
+        return func
+    return decorator
+
+
+def enqueue(name, args=(), kwargs=None, priority=NORMAL, max_attempts=1,
+            countdown=0):
+    if settings.TASKS_EAGER:
+        _registry[name](*args, **(kwargs or {}))
+        return None
+    return Task.objects.create(
+        name=name,
+        args=json.dumps(list(args), cls=DjangoJSONEncoder),
+        kwargs=json.dumps(kwargs or {}, cls=DjangoJSONEncoder),
+        priority=priority,
+        max_attempts=max_attempts,
+        run_at=timezone.now() + timedelta(seconds=countdown),
+    )
+
+
+def requeue_stale():
+    """Возвращает в очередь задачи, брошенные упавшими процессами."""
+    deadline = timezone.now() - timedelta(seconds=LOCK_TIMEOUT)
+    return Task.objects.filter(
+        status=Task.RUNNING, locked_at__lt=deadline
+    ).update(status=Task.QUEUED, locked_at=None)
+
+
+def claim():
+    """Забирает самую приоритетную готовую задачу или возвращает None."""
+    for _ in range(CLAIM_ATTEMPTS):
+        now = timezone.now()
+        candidate = Task.objects.filter(
+            status=Task.QUEUED, run_at__lte=now
+        ).order_by('-priority', 'run_at', 'pk').first()
+        if candidate is None:
+            return None
+        # Условный UPDATE атомарен: задачу получит ровно один процесс.
+        claimed = Task.objects.filter(
+            pk=candidate.pk, status=Task.QUEUED
+        ).update(status=Task.RUNNING, locked_at=now,
+                 attempts=candidate.attempts + 1)
+        if claimed:
+            candidate.status = Task.RUNNING
+            candidate.attempts += 1
+            return candidate
+    return None
+
+
+def execute(task_row):
+    """Выполняет задачу; успешная удаляется, упавшая ждёт повтора."""
+    try:
+        # Модуль задачи мог ещё не импортироваться в этом процессе.
+        func = _registry.get(task_row.name) or import_string(task_row.name)
+        func(*json.loads(task_row.args), **json.loads(task_row.kwargs))
+    except Exception:
+        error = traceback.format_exc()
+        if task_row.attempts < task_row.max_attempts:
+            backoff = min(BACKOFF_BASE * 2 ** (task_row.attempts - 1),
+                          MAX_BACKOFF)
+            logger.warning('Task %s failed, retry in %ss',
+                           task_row.name, backoff)
+            Task.objects.filter(pk=task_row.pk).update(
+                status=Task.QUEUED, locked_at=None, last_error=error,
+                run_at=timezone.now() + timedelta(seconds=backoff),
+            )
+        else:
+            logger.error('Task %s failed for good:\n%s',
+                         task_row.name, error)
+            Task.objects.filter(pk=task_row.pk).update(
+                status=Task.FAILED, locked_at=None, last_error=error
+            )
+        return False
+    Task.objects.filter(pk=task_row.pk).delete()
+    return True
+
+
+def run_pending(limit=None, stop=None):
+    """Выполняет готовые задачи в текущем процессе, возвращает число."""
+    autodiscover_modules('tasks')
+    done = 0
+    while ((limit is None or done < limit)
+           and (stop is None or not stop.is_set())):
+        task_row = claim()
+        if task_row is None:
+            break
+        execute(task_row)
+        done += 1
+    return done
+
+
+def work(poll_interval=1.0, stop=None):
+    """Цикл процесса-исполнителя."""
+    autodiscover_modules('tasks')
+    stop = stop or threading.Event()
+    logger.info('Task worker %d started', os.getpid())
+    while not stop.is_set():
+        requeue_stale()
+        if not run_pending(stop=stop):
+            stop.wait(poll_interval)
@@ -0,0 +1,79 @@
+from django import template
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.templatetags.cache import CacheNode
+
+from core.cache import get_or_recompute
+
+register = template.Library()
+
+
+class StampedeCacheNode(CacheNode):
+    def render(self, context):
+        try:
+            expire_time = self.expire_time_var.resolve(context)
+        except template.VariableDoesNotExist:
+            raise template.TemplateSyntaxError(
+                f'"stampede_cache" tag got an unknown variable: '
+                f'{self.expire_time_var.var!r}'
+            )
+        if expire_time is not None:
+            try:
+                expire_time = int(expire_time)
+            except (ValueError, TypeError):
+                raise template.TemplateSyntaxError(
+                    f'"stampede_cache" tag got a non-integer timeout value: '
+                    f'{expire_time!r}'
+                )
+        if self.cache_name:
+            try:
+                fragment_cache = caches[self.cache_name.resolve(context)]
+            except (template.VariableDoesNotExist, InvalidCacheBackendError):
+                raise template.TemplateSyntaxError(
+                    'Invalid cache name specified for stampede_cache tag'
+                )
+        else:
+            try:
+                fragment_cache = caches['template_fragments']
+            except InvalidCacheBackendError:
+                fragment_cache = caches['default']
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        cache_key = make_template_fragment_key(self.fragment_name, vary_on)
+        return get_or_recompute(
+            cache_key,
+            expire_time,
+            lambda: self.nodelist.render(context),
+            cache=fragment_cache,
+        )
+
+
+@register.tag('stampede_cache')
+def do_stampede_cache(parser, token):
+    """Замена ``{% cache %}`` с защитой от одновременного пересчёта.
+
+    Синтаксис тот же::
+
+        {% load stampede %}
+        {% stampede_cache 20 index_page page_obj.number %}
+            ...
+        {% endstampede_cache %}
+    """
+    nodelist = parser.parse(('endstampede_cache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise template.TemplateSyntaxError(
+            f'{tokens[0]!r} tag requires at least 2 arguments.'
+        )
+    if len(tokens) > 3 and tokens[-1].startswith('using='):
+        cache_name = parser.compile_filter(tokens[-1][len('using='):])
+        tokens = tokens[:-1]
+    else:
+        cache_name = None
+    return StampedeCacheNode(
+        nodelist,
+        parser.compile_filter(tokens[1]),
+        tokens[2],
+        [parser.compile_filter(t) for t in tokens[3:]],
+        cache_name,
+    )
@@ -1,4 +1,53 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core import mail
+from django.core.cache.utils import make_template_fragment_key
+from django.core.management import call_command
+from django.core.handlers.wsgi import WSGIHandler
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template import Context, Template
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+
+from . import middleware, ratelimit
+from .cache import _lock_key, get_or_recompute, stampede_cache_page
+from .paginator import (CachedCountPaginator, ChainedSequence, MergedSequence,
+                        cached_count)
+from .middleware import FirstFastRequestMiddleware
+from .models import Task
+from .querycache import cached_exists, cached_get
+from .staticfiles import PrecompressedStaticFiles
+from .streaming import stream_template
+from .tasks import HIGH, LOW, run_pending, task
+from .warmup import prefill_pages, warm_up
+
+User = get_user_model()
+
+executed = []
+
+
+@task(priority=LOW)
+def low_task(value):
+    executed.append(value)
+
+
+@task(priority=HIGH)
+def high_task(value):
+    executed.append(value)
+
+
+@task(max_retries=1)
+def failing_task():
+    raise RuntimeError('не получилось')
 
 
 class ViewTestClass(TestCase):
@@ -6,3 +55,453 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, 404)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class StampedeCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def recompute(self):
+        self.calls += 1
+        return f'value {self.calls}'
+
+    def test_fresh_value_is_not_recomputed(self):
+        """Свежее значение берётся из кеша без пересчёта."""
+        get_or_recompute('key', 60, self.recompute)
+        self.assertEqual(get_or_recompute('key', 60, self.recompute),
+                         'value 1')
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_value_served_while_other_recomputes(self):
+        """Пока пересчёт заблокирован, отдаётся устаревшее значение."""
+        get_or_recompute('key', 60, self.recompute)
+        cache.add(_lock_key('key'), 1)
+        with mock.patch('core.cache._should_refresh', return_value=True):
+            value = get_or_recompute('key', 60, self.recompute)
+        self.assertEqual(value, 'value 1')
+        self.assertEqual(self.calls, 1)
+
+    def test_expired_value_recomputed_by_lock_holder(self):
+        """Истёкшее значение пересчитывает тот, кто взял блокировку."""
+        get_or_recompute('key', 60, self.recompute)
+        with mock.patch('core.cache._should_refresh', return_value=True):
+            value = get_or_recompute('key', 60, self.recompute)
+        self.assertEqual(value, 'value 2')
+        self.assertIsNone(cache.get(_lock_key('key')))
+
+    def test_template_tag_caches_fragment(self):
+        template = Template(
+            '{% load stampede %}'
+            '{% stampede_cache 20 fragment %}{{ value }}'
+            '{% endstampede_cache %}'
+        )
+        self.assertEqual(template.render(Context({'value': 1})), '1')
+        self.assertEqual(template.render(Context({'value': 2})), '1')
+
+    def test_page_decorator_caches_anonymous_get(self):
+        view = stampede_cache_page(60)(
+            lambda request: HttpResponse(self.recompute())
+        )
+        request = RequestFactory().get('/page/')
+        request.user = AnonymousUser()
+        view(request)
+        response = view(request)
+        self.assertEqual(response.content, b'value 1')
+        self.assertEqual(self.calls, 1)
+        self.assertIn('max-age=60', response['Cache-Control'])
+
+    def page_request(self, **headers):
+        request = RequestFactory().get('/page/', **headers)
+        request.user = AnonymousUser()
+        return request
+
+    def test_page_decorator_respects_vary(self):
+        """Ответы с разным значением заголовка из Vary кешируются порознь."""
+        def page(request):
+            response = HttpResponse(
+                f'{request.META["HTTP_X_THEME"]} {self.recompute()}'
+            )
+            response['Vary'] = 'X-Theme'
+            return response
+
+        view = stampede_cache_page(60)(page)
+        for _ in range(2):
+            dark = view(self.page_request(HTTP_X_THEME='dark'))
+            light = view(self.page_request(HTTP_X_THEME='light'))
+        self.assertEqual(dark.content, b'dark value 1')
+        self.assertEqual(light.content, b'light value 2')
+        self.assertEqual(self.calls, 2)
+
+    def test_page_decorator_skips_streaming_and_cookies(self):
+        """Потоковые ответы и ответы с куками не попадают в кеш."""
+        def streaming(request):
+            return StreamingHttpResponse(iter([self.recompute()]))
+
+        def with_cookie(request):
+            response = HttpResponse(self.recompute())
+            response.set_cookie('visitor', 'id')
+            return response
+
+        for page in (streaming, with_cookie):
+            with self.subTest(page=page.__name__):
+                view = stampede_cache_page(60, key_prefix=page.__name__)(
+                    page
+                )
+                calls = self.calls
+                view(self.page_request())
+                view(self.page_request())
+                self.assertEqual(self.calls, calls + 2)
+
+
+class QueryCacheTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+
+    def test_repeated_lookup_skips_database(self):
+        cached_get(User, username='auth')
+        with self.assertNumQueries(0):
+            user = cached_get(User, username='auth')
+        self.assertEqual(user, self.user)
+
+    def test_save_invalidates_lookup(self):
+        """Сохранение модели сбрасывает закешированные запросы к ней."""
+        cached_get(User, username='auth')
+        self.user.first_name = 'Лев'
+        self.user.save()
+        self.assertEqual(cached_get(User, username='auth').first_name, 'Лев')
+
+    def test_missing_object_cached_until_created(self):
+        queryset = User.objects.filter(username='new')
+        self.assertFalse(cached_exists(queryset))
+        with self.assertNumQueries(0):
+            self.assertFalse(cached_exists(queryset))
+        with self.assertRaises(User.DoesNotExist):
+            cached_get(User, username='new')
+        User.objects.create_user(username='new')
+        self.assertTrue(cached_exists(queryset))
+        self.assertEqual(cached_get(User, username='new').username, 'new')
+
+
+class WarmUpTests(TestCase):
+    def test_warm_up_runs_all_steps(self):
+        """Прогрев проходит все этапы и заполняет кеш главной страницы."""
+        cache.clear()
+        timings = warm_up(WSGIHandler())
+        self.assertEqual(
+            set(timings), {'templates', 'urls', 'images', 'pages'}
+        )
+        self.assertIsNotNone(
+            cache.get(make_template_fragment_key('index_page', [1]))
+        )
+
+    def test_failed_page_not_counted(self):
+        """Страница с ошибкой не считается прогретой и попадает в лог."""
+        application = mock.Mock()
+        application.get_response.return_value = HttpResponse(status=500)
+        with self.assertLogs('core.warmup', 'WARNING') as logs:
+            self.assertEqual(prefill_pages(application), 0)
+        self.assertIn('returned 500', logs.output[0])
+
+    def test_first_fast_request_logged_once_per_process(self):
+        """Замер общий для всех экземпляров middleware в процессе."""
+        request = RequestFactory().get('/')
+        with mock.patch.multiple(middleware, _requests=0, _measured=None), \
+                self.assertLogs('core.middleware', 'INFO') as logs:
+            for _ in range(3):
+                FirstFastRequestMiddleware(
+                    lambda request: HttpResponse()
+                )(request)
+        self.assertEqual(len(logs.records), 1)
+
+
+class CachedCountPaginatorTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        for number in range(3):
+            User.objects.create_user(username=f'user{number}')
+
+    def test_page_window_is_bounded(self):
+        """Навигация показывает только соседние страницы."""
+        for number in range(3, 40):
+            User.objects.create_user(username=f'user{number}')
+        paginator = CachedCountPaginator(User.objects.order_by('pk'), 1)
+        self.assertEqual(list(paginator.page(20).page_window),
+                         [18, 19, 20, 21, 22])
+        self.assertEqual(list(paginator.page(1).page_window), [1, 2, 3])
+
+    def test_stale_count_refreshed_in_background(self):
+        """После записи отдаётся старое число, пока идёт пересчёт."""
+        queryset = User.objects.all()
+        self.assertEqual(cached_count(queryset), 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(cached_count(queryset), 3)
+        User.objects.create_user(username='new')
+        self.assertEqual(cached_count(queryset), 3)
+        deadline = time.monotonic() + 5
+        while cached_count(queryset) != 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(cached_count(queryset), 4)
+
+    def test_chained_sequence_ignores_stale_counts(self):
+        """Страницы цепочки не перекрываются, даже если число устарело."""
+        for number in range(3, 10):
+            User.objects.create_user(username=f'user{number}')
+        users = User.objects.order_by('pk')
+        pks = list(users.values_list('pk', flat=True))
+        chained = ChainedSequence(users.filter(pk__in=pks[:5]),
+                                  users.exclude(pk__in=pks[:5]))
+        with mock.patch('core.paginator.cached_count', return_value=3):
+            pages = [[user.pk for user in chained[start:start + 3]]
+                     for start in range(0, 10, 3)]
+        self.assertEqual(sum(pages, []), pks)
+
+    def test_merged_sequence_interleaves_querysets(self):
+        """Слияние запросов отдаёт срез общего порядка."""
+        for number in range(3, 10):
+            User.objects.create_user(username=f'user{number}')
+        users = User.objects.order_by('-pk')
+        even = list(users.values_list('pk', flat=True))[::2]
+        merged = MergedSequence(
+            [users.filter(pk__in=even), users.exclude(pk__in=even)],
+            key=lambda user: user.pk,
+        )
+        self.assertEqual(len(merged), 10)
+        self.assertEqual([user.pk for user in merged[3:7]],
+                         [user.pk for user in users[3:7]])
+
+
+class PrecompressedStaticTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(STATIC_ROOT=cls.static_root)
+        cls.settings_override.enable()
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(cls.static_root, 'staticfiles.json')) as f:
+            cls.css = json.load(f)['paths']['css/bootstrap.min.css']
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.static_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def request(self, path, accept_encoding=''):
+        def fallback(environ, start_response):
+            start_response('404 Not Found', [])
+            return [b'django']
+
+        captured = {}
+
+        def start_response(status, headers):
+            captured['status'] = status
+            captured['headers'] = dict(headers)
+
+        application = PrecompressedStaticFiles(fallback)
+        body = b''.join(application({
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'HTTP_ACCEPT_ENCODING': accept_encoding,
+        }, start_response))
+        return captured['status'], captured['headers'], body
+
+    def test_collectstatic_precompresses_hashed_files(self):
+        """collectstatic кладёт рядом с хешированным CSS его gzip-копию."""
+        path = os.path.join(self.static_root, self.css)
+        with open(path, 'rb') as original, \
+                gzip.open(path + '.gz') as compressed:
+            self.assertEqual(compressed.read(), original.read())
+
+    def test_gzip_variant_served_with_immutable_cache(self):
+        """Хешированный файл отдаётся сжатым и с вечным кешем."""
+        status, headers, body = self.request(
+            f'/static/{self.css}', 'br;q=0, gzip, deflate'
+        )
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Content-Type'], 'text/css')
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertIn('immutable', headers['Cache-Control'])
+        self.assertEqual(int(headers['Content-Length']), len(body))
+        self.assertIn(b'bootstrap', gzip.decompress(body))
+
+    def test_plain_variant_and_fallthrough(self):
+        """Без Accept-Encoding — исходный файл, чужие пути — в Django."""
+        _, headers, _ = self.request('/static/css/bootstrap.min.css')
+        self.assertNotIn('Content-Encoding', headers)
+        self.assertNotIn('immutable', headers['Cache-Control'])
+        for path in ('/static/../manage.py', '/static/missing.css', '/'):
+            with self.subTest(path=path):
+                self.assertEqual(self.request(path)[2], b'django')
+
+
+class StreamingRenderTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from posts.models import Comment, Post
+
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.user, text=f'Комментарий {i}')
+            for i in range(30)
+        )
+
+    def test_stream_matches_render(self):
+        """Поток даёт ту же разметку, что и обычный render()."""
+        cache.clear()
+        expected = self.client.get('/').content.decode()
+        cache.clear()
+        with override_settings(STREAMING_RESPONSES=True):
+            response = self.client.get('/')
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            b''.join(response.streaming_content).decode(), expected
+        )
+
+    def test_header_flushed_before_comments(self):
+        """Шапка уходит отдельным куском до чтения комментариев."""
+        from posts.models import Comment
+
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        chunks = list(stream_template('posts/post_detail.html', {
+            'post': self.post,
+            'author': self.user,
+            'comments': Comment.objects.order_by('-created'),
+        }, request))
+        self.assertIn('</header>', chunks[0])
+        self.assertNotIn('Комментарий', chunks[0])
+        page = ''.join(chunks)
+        self.assertEqual(page.count('Комментарий'), 30)
+        self.assertEqual(page.count('<hr>'), 29)
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        executed.clear()
+
+    def test_high_priority_runs_first(self):
+        """Задачи выполняются по приоритету, а не по порядку постановки."""
+        low_task.delay('low')
+        high_task.delay('high')
+        run_pending(limit=1)
+        self.assertEqual(executed, ['high'])
+        run_pending()
+        self.assertEqual(executed, ['high', 'low'])
+        self.assertFalse(Task.objects.exists())
+
+    def test_failed_task_retried_with_backoff(self):
+        """Упавшая задача откладывается, а после всех попыток — ошибка."""
+        failing_task.delay()
+        run_pending()
+        task_row = Task.objects.get()
+        self.assertEqual(task_row.status, Task.QUEUED)
+        self.assertEqual(task_row.attempts, 1)
+        self.assertIn('не получилось', task_row.last_error)
+        self.assertEqual(run_pending(), 0)
+
+        Task.objects.update(run_at=task_row.created)
+        run_pending()
+        task_row.refresh_from_db()
+        self.assertEqual(task_row.status, Task.FAILED)
+        self.assertEqual(task_row.attempts, 2)
+
+    @override_settings(
+        EMAIL_BACKEND='core.mail.QueuedEmailBackend',
+        QUEUED_EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    )
+    def test_email_sent_by_worker(self):
+        """Письмо уходит только при выполнении задачи."""
+        mail.send_mail('Тема', 'Текст', None, ['new@yatube.ru'])
+        self.assertEqual(len(mail.outbox), 0)
+        run_pending()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['new@yatube.ru'])
+
+
+@override_settings(RATE_LIMITS={'post': '2/m', 'signup': '1/m'},
+                   SHED_TIMEOUT=0)
+class RateLimitTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='writer')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def create_post(self, client=None):
+        return (client or self.client).post('/create/', {'text': 'Текст'})
+
+    def test_user_bucket_rejects_with_retry_after(self):
+        """Сверх ёмкости ведра — 429 с Retry-After, пост не создаётся."""
+        for _ in range(2):
+            self.assertEqual(self.create_post().status_code, 302)
+        response = self.create_post()
+        self.assertEqual(response.status_code, 429)
+        self.assertTemplateUsed(response, 'core/429.html')
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(self.user.posts.count(), 2)
+
+    def test_form_page_not_limited(self):
+        """GET формы не расходует токены."""
+        for _ in range(3):
+            self.assertEqual(self.client.get('/create/').status_code, 200)
+        self.assertEqual(self.create_post().status_code, 302)
+
+    def test_bucket_refills(self):
+        """Через интервал пополнения появляется новый токен."""
+        now = time.time()
+        with mock.patch.object(ratelimit.time, 'time', return_value=now):
+            self.create_post()
+            self.create_post()
+            self.assertEqual(self.create_post().status_code, 429)
+        with mock.patch.object(ratelimit.time, 'time',
+                               return_value=now + 30):
+            self.assertEqual(self.create_post().status_code, 302)
+            self.assertEqual(self.create_post().status_code, 429)
+
+    def test_ip_bucket_shared_by_users(self):
+        """Анонимные регистрации с одного IP упираются в ведро IP."""
+        self.client.logout()
+        statuses = [
+            self.client.post('/auth/signup/', {}).status_code
+            for _ in range(ratelimit.IP_FACTOR + 1)
+        ]
+        self.assertEqual(statuses[:-1], [200] * ratelimit.IP_FACTOR)
+        self.assertEqual(statuses[-1], 429)
+
+    @override_settings(RATELIMIT_TRUSTED_PROXIES=['10.0.0.1'])
+    def test_client_ip_behind_trusted_proxy(self):
+        """За доверенным прокси IP берётся из X-Forwarded-For."""
+        factory = RequestFactory()
+        cases = (
+            ('10.0.0.1', '6.6.6.6, 1.2.3.4', '1.2.3.4'),
+            ('10.0.0.1', '1.2.3.4, 10.0.0.1', '1.2.3.4'),
+            ('10.0.0.1', '', '10.0.0.1'),
+            ('5.6.7.8', '1.2.3.4', '5.6.7.8'),
+        )
+        for remote, forwarded, expected in cases:
+            with self.subTest(remote=remote, forwarded=forwarded):
+                request = factory.get('/', REMOTE_ADDR=remote,
+                                      HTTP_X_FORWARDED_FOR=forwarded)
+                self.assertEqual(ratelimit.client_ip(request), expected)
+
+    def test_sheds_writes_over_concurrency(self):
+        """Без свободного места для записи — сразу 503."""
+        with override_settings(WRITE_CONCURRENCY=1):
+            # Место держит «другой процесс»: flock на своём дескрипторе.
+            slot = ratelimit.acquire_slot(0)
+            try:
+                response = self.create_post()
+            finally:
+                ratelimit.release_slot(slot)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(self.user.posts.exists())
@@ -0,0 +1,116 @@
+import logging
+import os
+import time
+
+from django.template import engines
+from django.test import RequestFactory
+from django.urls import URLResolver, get_resolver, reverse
+
+logger = logging.getLogger(__name__)
+
+# Момент старта процесса: от него считается время до первого быстрого
+# запроса (см. core.middleware.FirstFastRequestMiddleware).
+PROCESS_STARTED = time.monotonic()
+WARMUP_GROUPS = 20
+WARMUP_HEADER = 'HTTP_X_YATUBE_WARMUP'
+
+
+def compile_templates():
+    """Компилирует все шаблоны из каталогов TEMPLATES['DIRS'].
+
+    Вне DEBUG Django использует кеширующий загрузчик, и скомпилированные
+    шаблоны остаются в памяти процесса.
+    """
+    count = 0
+    for engine in engines.all():
+        for directory in engine.engine.dirs:
+            for root, _, files in os.walk(directory):
+                for filename in files:
+                    if not filename.endswith('.html'):
+                        continue
+                    name = os.path.relpath(
+                        os.path.join(root, filename), directory
+                    )
+                    engine.get_template(name.replace(os.sep, '/'))
+                    count += 1
+    return count
+
+
+def resolve_urls(resolver=None):
+    """Строит таблицы reverse() для корневого и вложенных URLResolver."""
+    resolver = resolver or get_resolver()
+    resolver.reverse_dict
+    count = 0
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            count += resolve_urls(pattern)
+        else:
+            count += 1
+    return count
+
+
+def import_image_stack():
+    from PIL import Image
+    from sorl.thumbnail import default
+
+    Image.init()
+    for lazy in (default.backend, default.engine, default.kvstore,
+                 default.storage):
+        # LazyObject создаёт объект при первом обращении к атрибуту.
+        lazy.__class__
+    return len(Image.OPEN)
+
+
+def prefill_pages(application):
+    """Прогоняет первые страницы ленты и групп через весь стек Django.
+
+    Возвращает число страниц, ответивших 200: ошибка при прогреве не
+    считается прогретой страницей.
+    """
+    from posts.models import Group
+
+    paths = [reverse('posts:index')]
+    paths += [
+        reverse('posts:group_posts', kwargs={'slug': slug})
+        for slug in Group.objects.values_list(
+            'slug', flat=True
+        )[:WARMUP_GROUPS]
+    ]
+    factory = RequestFactory()
+    warmed = 0
+    for path in paths:
+        response = application.get_response(
+            factory.get(path, REMOTE_ADDR='', **{WARMUP_HEADER: '1'})
+        )
+        if response.streaming:
+            # Потоковая страница рендерится только при чтении.
+            b''.join(response.streaming_content)
+        response.close()
+        if response.status_code != 200:
+            logger.warning('Warm-up of %s returned %d',
+                           path, response.status_code)
+            continue
+        warmed += 1
+    return warmed
+
+
+def warm_up(application):
+    """Прогревает процесс до первого запроса и возвращает время этапов."""
+    timings = {}
+    steps = (
+        ('templates', compile_templates),
+        ('urls', resolve_urls),
+        ('images', import_image_stack),
+        ('pages', lambda: prefill_pages(application)),
+    )
+    for name, step in steps:
+        start = time.monotonic()
+        try:
+            count = step()
+        except Exception:
+            logger.exception('Warm-up step %s failed', name)
+            continue
+        timings[name] = time.monotonic() - start
+        logger.info('Warm-up %s: %d items in %.3fs',
+                    name, count, timings[name])
+    return timings
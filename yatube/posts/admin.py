@@ -1,15 +1,192 @@
+from django import forms
 from django.contrib import admin
-from .models import Post, Group, Follow
+from django.contrib.admin.widgets import AutocompleteSelect
 
+from core.paginator import EstimatedCountPaginator
 
-class PostAdmin(admin.ModelAdmin):
-    list_display = ('pk', 'text', 'pub_date', 'author', 'group')
+from .deletion import cascaded_models, delete_post
+from .models import (Comment, DeletionJob, Follow, Group, Post,
+                     PostFingerprint)
+
+
+class LoadedAutocompleteSelect(AutocompleteSelect):
+    """Автокомплит, который берёт выбранный объект из строки списка.
+
+    Обычный AutocompleteSelect делает по запросу на каждый виджет, и
+    list_editable превращается в N+1. Здесь выбранные объекты уже
+    загружены через list_select_related.
+    """
+
+    loaded = ()
+
+    def optgroups(self, name, value, attr=None):
+        selected = {str(v) for v in value
+                    if str(v) not in self.choices.field.empty_values}
+        loaded = {str(obj.pk): obj for obj in self.loaded}
+        if not selected <= loaded.keys():
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        for pk in selected:
+            options.append(self.create_option(
+                name,
+                pk,
+                self.choices.field.label_from_instance(loaded[pk]),
+                True,
+                len(options),
+            ))
+        return [(None, options, 0)]
+
+
+class LoadedRelatedForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name, field in self.fields.items():
+            widget = getattr(field.widget, 'widget', field.widget)
+            model_field = self.instance._meta.get_field(name)
+            if (isinstance(widget, LoadedAutocompleteSelect)
+                    and model_field.is_cached(self.instance)):
+                related = getattr(self.instance, name)
+                widget.loaded = [related] if related is not None else []
+
+
+class BackgroundDeleteMixin:
+    """Удаление через фоновую задачу вместо каскада в одной транзакции."""
+
+    delete_function = None
+    deletion_kind = None
+
+    def get_deleted_objects(self, objs, request):
+        # Полный обход каскада для страницы подтверждения — это тот же
+        # тяжёлый запрос, от которого мы уходим. Права на удаление
+        # зависимых моделей проверяем всё равно, как это делает каскад.
+        perms_needed = set()
+        for model in cascaded_models(self.deletion_kind):
+            model_admin = self.admin_site._registry.get(model)
+            if (model_admin is not None
+                    and not model_admin.has_delete_permission(request)):
+                perms_needed.add(model._meta.verbose_name)
+        return [str(obj) for obj in objs], {}, perms_needed, []
+
+    def delete_model(self, request, obj):
+        self.delete_function(obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            self.delete_function(obj)
+
+
+class LoadedAutocompleteMixin:
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.get_autocomplete_fields(request):
+            kwargs['widget'] = LoadedAutocompleteSelect(
+                db_field.remote_field,
+                self.admin_site,
+                using=kwargs.get('using'),
+            )
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def get_changelist_form(self, request, **kwargs):
+        kwargs.setdefault('form', LoadedRelatedForm)
+        return super().get_changelist_form(request, **kwargs)
+
+
+class PostAdmin(BackgroundDeleteMixin, LoadedAutocompleteMixin,
+                admin.ModelAdmin):
+    delete_function = staticmethod(delete_post)
+    deletion_kind = DeletionJob.POST
+    list_display = ('pk', 'text', 'pub_date', 'author', 'group', 'views',
+                    'is_deleted')
     list_editable = ('group', )
+    list_select_related = ('author', 'group')
+    autocomplete_fields = ('author', 'group')
     search_fields = ('text', )
-    list_filter = ('pub_date', )
+    list_filter = ('pub_date', 'group')
     empty_value_display = '-пусто-'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # Админка видит и удаляемые посты; без фильтра по is_deleted
+        # число строк по-прежнему оценивается по MAX(pk).
+        queryset = Post.all_objects.get_queryset()
+        ordering = self.get_ordering(request)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        return queryset
+
+
+class GroupAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'title', 'slug')
+    search_fields = ('title', 'slug')
+    prepopulated_fields = {'slug': ('title', )}
+
+
+class CommentAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'text', 'created', 'author', 'post')
+    list_select_related = ('author', 'post')
+    autocomplete_fields = ('author', 'post')
+    list_filter = ('created', )
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class FollowAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'user', 'author')
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class DeletionJobAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'kind', 'label', 'status', 'progress',
+                    'deleted', 'total', 'created', 'updated')
+    list_filter = ('status', 'kind')
+
+    def progress(self, obj):
+        return f'{obj.progress}%'
+    progress.short_description = 'Готово'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class DuplicateFilter(admin.SimpleListFilter):
+    title = 'Почти дубликат'
+    parameter_name = 'duplicate'
+
+    def lookups(self, request, model_admin):
+        return (('yes', 'Да'), ('no', 'Нет'))
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.exclude(duplicate_of=None)
+        if self.value() == 'no':
+            return queryset.filter(duplicate_of=None)
+        return queryset
+
+
+class PostFingerprintAdmin(admin.ModelAdmin):
+    list_display = ('post_id', 'duplicate_of', 'created')
+    list_filter = (DuplicateFilter, )
+    search_fields = ('=post_id', '=duplicate_of')
+    readonly_fields = ('post_id', 'simhash', 'band0', 'band1', 'band2',
+                       'band3', 'created')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
 
 
 admin.site.register(Post, PostAdmin)
-admin.site.register(Group)
-admin.site.register(Follow)
+admin.site.register(Group, GroupAdmin)
+admin.site.register(Comment, CommentAdmin)
+admin.site.register(Follow, FollowAdmin)
+admin.site.register(DeletionJob, DeletionJobAdmin)
+admin.site.register(PostFingerprint, PostFingerprintAdmin)
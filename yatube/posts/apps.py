@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from . import (duplicates, graph, groupstats,  # noqa: F401
+                       prerender, signals, trending)
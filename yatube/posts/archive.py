@@ -0,0 +1,58 @@
+"""Перенос старых постов в архивные таблицы.
+
+Горячая таблица posts_post и её индексы остаются маленькими: ленты
+читают только её, а страница поста и профиль дочитывают архив. Архив
+поста лежит в том же шарде, что и пост (см. posts.sharding).
+"""
+from django.db import transaction
+
+from core.querycache import invalidate
+
+from .models import ArchivedComment, ArchivedPost, Comment, ImageBlob, Post
+from .sharding import shards
+
+BATCH_SIZE = 200
+
+
+def _copy(model, source):
+    return model(**{
+        field: getattr(source, field) for field in model.copied_fields
+    })
+
+
+def _archive_shard(alias, cutoff, batch_size):
+    with transaction.atomic(using=alias):
+        posts = list(
+            Post.objects.using(alias).filter(pub_date__lt=cutoff)
+            .order_by('pk').only(*ArchivedPost.copied_fields)[:batch_size]
+        )
+        if not posts:
+            return 0
+        pks = [post.pk for post in posts]
+        comments = Comment.objects.using(alias).filter(
+            post_id__in=pks
+        ).only(*ArchivedComment.copied_fields)
+        ArchivedPost.objects.using(alias).bulk_create(
+            _copy(ArchivedPost, post) for post in posts
+        )
+        ArchivedComment.objects.using(alias).bulk_create(
+            _copy(ArchivedComment, comment) for comment in comments
+        )
+        # Удаление поста снимает ссылку на картинку — архивная копия
+        # берёт свою раньше, чтобы файл не удалился.
+        for post in posts:
+            if post.image:
+                ImageBlob.acquire(post.image.name)
+        Comment.objects.using(alias).filter(post_id__in=pks).delete()
+        Post.all_objects.using(alias).filter(pk__in=pks).delete()
+    return len(posts)
+
+
+def archive_batch(cutoff, batch_size=BATCH_SIZE):
+    """Переносит пачку постов старше cutoff; возвращает их число."""
+    for alias in shards():
+        moved = _archive_shard(alias, cutoff, batch_size)
+        if moved:
+            invalidate(ArchivedPost, ArchivedComment)
+            return moved
+    return 0
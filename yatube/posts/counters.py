@@ -0,0 +1,109 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+
+from core.querycache import invalidate
+
+from .models import Post
+from .sharding import shards
+
+logger = logging.getLogger(__name__)
+
+# Не реже этого (в секундах) накопленные просмотры пишутся в базу.
+# Это же граница потерь при аварийном завершении процесса.
+FLUSH_INTERVAL = 10
+# Сколько просмотров можно накопить, прежде чем сбросить их досрочно.
+FLUSH_THRESHOLD = 1000
+
+
+class ViewCounter:
+    """Счётчик просмотров постов в памяти процесса.
+
+    Просмотры копятся в памяти и сбрасываются в базу одним запросом
+    ``UPDATE ... SET views = views + CASE id WHEN ... END``. Сбрасывает
+    их фоновый поток раз в interval секунд, даже если новых просмотров
+    нет, а при штатной остановке процесса остаток сбрасывается через
+    atexit.
+    """
+
+    def __init__(self, interval=FLUSH_INTERVAL):
+        self.interval = interval
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._thread = None
+        atexit.register(self.flush)
+
+    def _ensure_flusher(self):
+        # После fork потока в дочернем процессе нет — запускаем заново.
+        if not settings.VIEW_FLUSH_THREAD:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='view-flush', daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            finally:
+                # Соединение потока не держим открытым между сбросами.
+                connection.close()
+
+    def increment(self, post_id):
+        self._ensure_flusher()
+        with self._lock:
+            self._pending[post_id] += 1
+            due = (
+                time.monotonic() - self._last_flush >= self.interval
+                or sum(self._pending.values()) >= FLUSH_THRESHOLD
+            )
+        if due:
+            self.flush()
+
+    def pending(self, post_id):
+        """Просмотры поста, ещё не записанные в базу."""
+        return self._pending.get(post_id, 0)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            self.write(pending)
+        except DatabaseError:
+            logger.exception('Failed to flush %d post views', len(pending))
+            with self._lock:
+                self._pending.update(pending)
+
+    def write(self, pending):
+        """Записывает накопленное {post_id: просмотры} в базу."""
+        increments = Case(
+            *[When(pk=pk, then=Value(count))
+              for pk, count in pending.items()],
+            output_field=PositiveIntegerField(),
+        )
+        # Пост лежит в одном из шардов, в остальных UPDATE ничего
+        # не найдёт.
+        for alias in shards():
+            Post.objects.using(alias).filter(pk__in=pending).update(
+                views=F('views') + increments
+            )
+        invalidate(Post)
+
+
+view_counter = ViewCounter()
@@ -0,0 +1,163 @@
+"""Удаление пользователей и постов без долгой блокировки базы.
+
+Каскад ``on_delete=CASCADE`` удаляет всё одной транзакцией, и на время
+удаления автора с тысячами постов SQLite не пускает ни одной записи.
+Здесь объект сразу скрывается, а строки удаляет фоновая задача
+пачками по ``BATCH_SIZE``, каждая в своей короткой транзакции. Картинки
+удалённых постов освобождаются через счётчики ImageBlob, а уведомления,
+тренды и отпечатки, у которых вместо внешнего ключа id поста,
+удаляются вместе с пачкой постов. Посты и комментарии ищутся во всех
+шардах (см. posts.sharding).
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+
+from core.querycache import invalidate
+from core.tasks import LOW, task
+
+from . import groupstats
+from .models import (ArchivedComment, ArchivedPost, Comment, DeletionJob,
+                     Follow, GroupAuthor, Notification, Post,
+                     PostFingerprint, Trend)
+from .notifications import forget_posts
+from .sharding import on_shards
+
+User = get_user_model()
+
+BATCH_SIZE = 200
+# Сколько секунд задача удаляет за один заход, прежде чем уступить
+# исполнителя другим задачам и поставить себя в очередь снова.
+TIME_BUDGET = 5
+
+
+def _hide_posts(queryset):
+    """Помечает посты удалёнными пачками во всех шардах."""
+    for shard_queryset in on_shards(queryset.filter(is_deleted=False)):
+        while True:
+            with transaction.atomic(using=shard_queryset.db):
+                pks = list(shard_queryset.values_list(
+                    'pk', flat=True
+                )[:BATCH_SIZE])
+                if not pks:
+                    break
+                hidden = Post.all_objects.using(shard_queryset.db).filter(
+                    pk__in=pks
+                )
+                summary = groupstats.summarize(hidden)
+                hidden.update(is_deleted=True)
+                groupstats.forget(summary)
+    invalidate(Post)
+
+
+def _dependents(job):
+    """Запросы зависимых строк в порядке удаления: сначала листья."""
+    if job.kind == DeletionJob.POST:
+        return on_shards(Comment.objects.filter(post_id=job.object_id))
+    querysets = [
+        Comment.objects.filter(post__author_id=job.object_id),
+        Comment.objects.filter(author_id=job.object_id),
+        Follow.objects.filter(user_id=job.object_id),
+        Follow.objects.filter(author_id=job.object_id),
+        Notification.objects.filter(recipient_id=job.object_id),
+        Notification.objects.filter(author_id=job.object_id),
+        ArchivedComment.objects.filter(post__author_id=job.object_id),
+        ArchivedComment.objects.filter(author_id=job.object_id),
+        ArchivedPost.objects.filter(author_id=job.object_id),
+        Post.all_objects.filter(author_id=job.object_id),
+        # После постов: их удаление ещё обновляет эти строки.
+        GroupAuthor.objects.filter(author_id=job.object_id),
+    ]
+    # Автор мог комментировать посты в любом шарде.
+    return [shard_queryset for queryset in querysets
+            for shard_queryset in on_shards(queryset)]
+
+
+def cascaded_models(kind):
+    """Модели, строки которых задача удаляет вместе с объектом."""
+    job = DeletionJob(kind=kind, object_id=0)
+    return {queryset.model for queryset in _dependents(job)}
+
+
+def _forget_posts(post_ids):
+    """Строки, ссылающиеся на посты по id, а не внешним ключом."""
+    forget_posts(post_ids)
+    Trend.objects.filter(kind=Trend.POST, object_id__in=post_ids).delete()
+    PostFingerprint.objects.filter(post_id__in=post_ids).delete()
+
+
+def _targets(job):
+    if job.kind == DeletionJob.POST:
+        return on_shards(Post.all_objects.filter(pk=job.object_id))
+    return [User.objects.filter(pk=job.object_id)]
+
+
+def _start(kind, obj, label):
+    job = DeletionJob.objects.create(kind=kind, object_id=obj.pk,
+                                     label=label)
+    job.total = sum(qs.count() for qs in _dependents(job)) + 1
+    job.save(update_fields=['total'])
+    # Задача пишется в ту же транзакцию: откат отменит и её.
+    run_deletion_job.delay(job.pk)
+    return job
+
+
+def delete_post(post):
+    """Скрывает пост и ставит его удаление в очередь."""
+    _hide_posts(Post.all_objects.filter(pk=post.pk))
+    return _start(DeletionJob.POST, post, str(post))
+
+
+def delete_user(user):
+    """Блокирует пользователя, скрывает его посты и ставит удаление."""
+    User.objects.filter(pk=user.pk).update(is_active=False)
+    invalidate(User)
+    _hide_posts(Post.all_objects.filter(author_id=user.pk))
+    return _start(DeletionJob.USER, user, user.get_username())
+
+
+def delete_batch(job):
+    """Удаляет одну пачку; возвращает False, когда удалять больше нечего."""
+    for queryset in _dependents(job):
+        pks = list(queryset.values_list('pk', flat=True)[:BATCH_SIZE])
+        if pks:
+            # Прогресс в default фиксируется вместе с пачкой, если она
+            # тоже в default.
+            with transaction.atomic(using=queryset.db), \
+                    transaction.atomic():
+                deleted, _ = queryset.model._base_manager.using(
+                    queryset.db
+                ).filter(pk__in=pks).delete()
+                if queryset.model in (Post, ArchivedPost):
+                    _forget_posts(pks)
+                DeletionJob.objects.filter(pk=job.pk).update(
+                    deleted=F('deleted') + deleted
+                )
+            return True
+    with transaction.atomic():
+        deleted = 0
+        for queryset in _targets(job):
+            with transaction.atomic(using=queryset.db):
+                deleted += queryset.delete()[0]
+        if job.kind == DeletionJob.POST:
+            _forget_posts([job.object_id])
+        DeletionJob.objects.filter(pk=job.pk).update(
+            deleted=F('deleted') + deleted, status=DeletionJob.DONE
+        )
+    return False
+
+
+@task(priority=LOW, max_retries=5)
+def run_deletion_job(job_id, time_budget=TIME_BUDGET):
+    job = DeletionJob.objects.filter(
+        pk=job_id, status=DeletionJob.RUNNING
+    ).first()
+    if job is None:
+        return
+    deadline = time.monotonic() + time_budget
+    while delete_batch(job):
+        if time.monotonic() >= deadline:
+            run_deletion_job.delay(job_id)
+            return
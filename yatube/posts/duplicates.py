@@ -0,0 +1,155 @@
+"""Поиск почти одинаковых постов по SimHash.
+
+Отпечаток текста — 64-битный SimHash по словам с весом по числу
+повторов: у текстов, отличающихся парой слов, отпечатки расходятся
+в нескольких битах. Тройки слов на коротких постах почти не дают
+совпадений: замена одного слова меняет три признака из десятка.
+Отпечаток хранится четырьмя 16-битными полосами с индексом на каждой.
+Если два отпечатка различаются не больше чем в MAX_DISTANCE = 3 битах,
+хотя бы одна полоса у них совпадает целиком. Поэтому кандидаты ищутся
+четырьмя точными совпадениями по индексам, а не перебором всех постов.
+"""
+import hashlib
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Post, PostFingerprint
+from .sharding import shards
+
+BITS = 64
+BANDS = 4
+BAND_BITS = BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+MAX_DISTANCE = BANDS - 1
+# Короче этого текст слишком шумный, чтобы судить о сходстве.
+MIN_WORDS = 5
+# Столько последних кандидатов сверяем, если полоса слишком популярна.
+CANDIDATE_LIMIT = 1000
+REJECT = 'reject'
+FLAG = 'flag'
+
+WORD_RE = re.compile(r'\w+')
+
+
+def _word_hash(word):
+    digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def simhash(text):
+    """Отпечаток текста или None, если текст слишком короткий."""
+    words = WORD_RE.findall(text.lower())
+    if len(words) < MIN_WORDS:
+        return None
+    weights = [0] * BITS
+    for word, count in Counter(words).items():
+        value = _word_hash(word)
+        for bit in range(BITS):
+            weights[bit] += count if value >> bit & 1 else -count
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    if fingerprint >> (BITS - 1):
+        # BigIntegerField знаковый.
+        fingerprint -= 1 << BITS
+    return fingerprint
+
+
+def bands(fingerprint):
+    return [fingerprint >> (band * BAND_BITS) & BAND_MASK
+            for band in range(BANDS)]
+
+
+def distance(first, second):
+    return bin((first ^ second) & ((1 << BITS) - 1)).count('1')
+
+
+def find_duplicate(fingerprint, exclude_post_id=None):
+    """id ближайшего из почти одинаковых постов или None."""
+    if fingerprint is None:
+        return None
+    lookup = Q()
+    for band, value in enumerate(bands(fingerprint)):
+        lookup |= Q(**{f'band{band}': value})
+    candidates = PostFingerprint.objects.filter(lookup)
+    if exclude_post_id is not None:
+        candidates = candidates.exclude(post_id=exclude_post_id)
+    best = None
+    for post_id, other in candidates.order_by('-post_id').values_list(
+        'post_id', 'simhash'
+    )[:CANDIDATE_LIMIT]:
+        current = distance(fingerprint, other)
+        if current <= MAX_DISTANCE and (best is None or current < best[0]):
+            best = current, post_id
+    return best and best[1]
+
+
+def action():
+    """Что делать с почти дубликатом: REJECT, FLAG или None."""
+    return settings.DUPLICATE_POSTS
+
+
+def _fields(fingerprint, duplicate_of):
+    fields = {'simhash': fingerprint, 'duplicate_of': duplicate_of}
+    for band, value in enumerate(bands(fingerprint)):
+        fields[f'band{band}'] = value
+    return fields
+
+
+def remember(post, fingerprint, duplicate_of=None):
+    """Сохраняет отпечаток поста после создания или правки."""
+    if fingerprint is None:
+        PostFingerprint.objects.filter(post_id=post.pk).delete()
+        return
+    PostFingerprint.objects.update_or_create(
+        post_id=post.pk, defaults=_fields(fingerprint, duplicate_of)
+    )
+
+
+def backfill(batch_size=500):
+    """Отпечатки постов, у которых их ещё нет; дубликаты помечаются.
+
+    Возвращает пары (обработано постов, помечено) после каждой пачки.
+    """
+    processed = flagged = 0
+    for alias in shards():
+        last_pk = 0
+        while True:
+            batch = list(Post.objects.using(alias).filter(
+                pk__gt=last_pk
+            ).order_by('pk').values_list('pk', 'text')[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            known = set(PostFingerprint.objects.filter(
+                post_id__in=[pk for pk, _ in batch]
+            ).values_list('post_id', flat=True))
+            rows = []
+            for pk, text in batch:
+                fingerprint = None if pk in known else simhash(text)
+                if fingerprint is None:
+                    continue
+                # Сверяем и с уже сохранёнными постами этой пачки.
+                duplicate_of = find_duplicate(fingerprint) or next(
+                    (row.post_id for row in rows
+                     if distance(row.simhash, fingerprint) <= MAX_DISTANCE),
+                    None,
+                )
+                flagged += duplicate_of is not None
+                rows.append(PostFingerprint(
+                    post_id=pk, **_fields(fingerprint, duplicate_of)
+                ))
+            PostFingerprint.objects.bulk_create(rows, ignore_conflicts=True)
+            processed += len(batch)
+            yield processed, flagged
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    PostFingerprint.objects.filter(post_id=instance.pk).delete()
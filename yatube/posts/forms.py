@@ -1,9 +1,14 @@
 from django import forms
 
+from . import duplicates
 from .models import Post, Comment
 
 
 class PostForm(forms.ModelForm):
+    # Заполняются при проверке текста, сохраняет их представление.
+    fingerprint = None
+    duplicate_of = None
+
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
@@ -29,6 +34,21 @@ class PostForm(forms.ModelForm):
             'group': ('Выберите группу поста (опционально)')
         }
 
+    def clean_text(self):
+        text = self.cleaned_data['text']
+        self.fingerprint = duplicates.simhash(text)
+        if duplicates.action() is None:
+            return text
+        self.duplicate_of = duplicates.find_duplicate(
+            self.fingerprint, exclude_post_id=self.instance.pk
+        )
+        if (self.duplicate_of is not None
+                and duplicates.action() == duplicates.REJECT):
+            raise forms.ValidationError(
+                'Почти такой же пост уже опубликован.'
+            )
+        return text
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
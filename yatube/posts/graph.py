@@ -0,0 +1,418 @@
+"""Граф подписок в памяти процесса.
+
+Подписки хранятся в CSR-виде: для пользователя ``u`` отсортированные id
+тех, на кого он подписан, лежат в ``targets[offsets[u]:offsets[u + 1]]``;
+подписчики — во втором таком же графе. Новые подписки и отписки копятся
+поверх массивов и вливаются в них пачкой.
+
+Граф сверяется с таблицей подписок, когда меняется поколение модели
+Follow в кеше (см. core.querycache): дочитываются подписки с id больше
+последнего известного и отписки из журнала FollowRemoval. Заново граф
+строится, только если число подписок после этого не сошлось с таблицей.
+Снимок на диске (``snapshot_follow_graph``) избавляет новый процесс от
+чтения всей таблицы.
+"""
+import heapq
+import logging
+import os
+import struct
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.querycache import query_generations
+
+from .models import Follow, FollowRemoval
+
+logger = logging.getLogger(__name__)
+
+# Сколько отложенных изменений держать поверх массивов.
+COMPACT_THRESHOLD = 1000
+# Сколько подписок каждого друга учитывать в рекомендациях.
+MAX_FANOUT = 500
+RECOMMENDATIONS = 5
+# Сколько отписок проверять по таблице подписок одним запросом.
+REMOVALS_BATCH = 500
+# Сколько хранить журнал отписок: отставший сильнее процесс перестроит
+# граф по несошедшемуся числу подписок.
+REMOVALS_TTL = timedelta(days=1)
+SNAPSHOT_MAGIC = b'YFG2'
+# magic, число подписок, максимальный id подписки и отписки, длины
+# четырёх массивов.
+SNAPSHOT_HEADER = struct.Struct('<4sqqqqqqq')
+OFFSET_TYPE = 'q'
+NODE_TYPE = 'i'
+
+
+class Adjacency:
+    """Списки смежности в CSR с отложенными изменениями поверх."""
+
+    def __init__(self, offsets=None, targets=None):
+        self.offsets = offsets if offsets is not None else array(
+            OFFSET_TYPE, [0]
+        )
+        self.targets = targets if targets is not None else array(NODE_TYPE)
+        self.added = defaultdict(set)
+        self.removed = defaultdict(set)
+        self.pending = 0
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """Строит CSR из пар (откуда, куда), отсортированных по парам."""
+        offsets = array(OFFSET_TYPE, [0])
+        targets = array(NODE_TYPE)
+        for source, target in pairs:
+            while len(offsets) <= source:
+                offsets.append(len(targets))
+            targets.append(target)
+        offsets.append(len(targets))
+        return cls(offsets, targets)
+
+    def _base(self, node):
+        if node + 1 >= len(self.offsets):
+            return self.targets[0:0]
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def _in_base(self, source, target):
+        base = self._base(source)
+        index = bisect_left(base, target)
+        return index < len(base) and base[index] == target
+
+    def neighbours(self, node):
+        """Отсортированные соседи вершины."""
+        base = self._base(node)
+        if node not in self.added and node not in self.removed:
+            return base
+        merged = set(base) - self.removed.get(node, set())
+        return sorted(merged | self.added.get(node, set()))
+
+    def degree(self, node):
+        """Число соседей вершины без сборки их списка."""
+        # Отложенные добавления не пересекаются с массивом, а удаления
+        # в нём всегда есть (см. add и remove).
+        return (len(self._base(node)) + len(self.added.get(node, ()))
+                - len(self.removed.get(node, ())))
+
+    def __contains__(self, edge):
+        source, target = edge
+        if target in self.added.get(source, ()):
+            return True
+        if target in self.removed.get(source, ()):
+            return False
+        return self._in_base(source, target)
+
+    def add(self, source, target):
+        if (source, target) in self:
+            return False
+        if target in self.removed.get(source, ()):
+            self.removed[source].discard(target)
+        else:
+            self.added[source].add(target)
+        self.pending += 1
+        return True
+
+    def remove(self, source, target):
+        if (source, target) not in self:
+            return False
+        if target in self.added.get(source, ()):
+            self.added[source].discard(target)
+        else:
+            self.removed[source].add(target)
+        self.pending += 1
+        return True
+
+    def compact(self):
+        """Вливает отложенные изменения в массивы."""
+        if not self.pending:
+            return self
+        last = max([len(self.offsets) - 2, *self.added], default=-1)
+        return Adjacency.from_pairs(
+            (node, target) for node in range(last + 1)
+            for target in self.neighbours(node)
+        )
+
+
+def _pairs(*order):
+    return Follow.objects.order_by(*order).values_list(
+        *order
+    ).iterator(chunk_size=10000)
+
+
+def _fingerprint():
+    row = Follow.objects.aggregate(count=Count('pk'), max_pk=Max('pk'))
+    return row['count'], row['max_pk'] or 0
+
+
+def _removal_pk():
+    return FollowRemoval.objects.aggregate(Max('pk'))['pk__max'] or 0
+
+
+def _still_followed(pairs):
+    """Пары из журнала отписок, на которые снова подписались."""
+    pairs = sorted(pairs)
+    existing = set()
+    for start in range(0, len(pairs), REMOVALS_BATCH):
+        batch = pairs[start:start + REMOVALS_BATCH]
+        existing.update(Follow.objects.filter(
+            user_id__in={user_id for user_id, _ in batch},
+            author_id__in={author_id for _, author_id in batch},
+        ).values_list('user_id', 'author_id'))
+    return existing
+
+
+def _generation():
+    return query_generations(Follow.objects.all())
+
+
+def prune_removals(ttl=REMOVALS_TTL):
+    """Удаляет из журнала отписки старше ttl."""
+    return FollowRemoval.objects.filter(
+        created__lt=timezone.now() - ttl
+    ).delete()[0]
+
+
+class FollowGraph:
+    """Подписки и подписчики всех пользователей в памяти процесса."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._following = None
+        self._followers = None
+        self._count = 0
+        self._max_pk = 0
+        self._removal_pk = 0
+        self._generation = None
+
+    def build(self):
+        """Читает таблицу подписок целиком."""
+        with self._lock:
+            self._generation = _generation()
+            # Журнал читается первым: отписки во время чтения таблицы
+            # сверка применит ещё раз, а повтор безвреден.
+            self._removal_pk = _removal_pk()
+            self._count, self._max_pk = _fingerprint()
+            self._following = Adjacency.from_pairs(
+                _pairs('user_id', 'author_id')
+            )
+            self._followers = Adjacency.from_pairs(
+                _pairs('author_id', 'user_id')
+            )
+
+    def _apply(self, user_id, author_id, follow, pk=0):
+        if follow:
+            changed = self._following.add(user_id, author_id)
+            self._followers.add(author_id, user_id)
+        else:
+            changed = self._following.remove(user_id, author_id)
+            self._followers.remove(author_id, user_id)
+        # Строка, уже учтённая сверкой, не должна сдвинуть счётчик.
+        if changed:
+            self._count += 1 if follow else -1
+        self._max_pk = max(self._max_pk, pk)
+        if self._following.pending >= COMPACT_THRESHOLD:
+            self._following = self._following.compact()
+            self._followers = self._followers.compact()
+
+    def apply(self, user_id, author_id, follow, pk=0):
+        """Подписка (follow=True) или отписка, сделанная этим процессом."""
+        with self._lock:
+            if self._following is not None:
+                self._apply(user_id, author_id, follow, pk)
+
+    def _sync(self):
+        if self._following is None and not self.load():
+            self.build()
+            return
+        generation = _generation()
+        if generation == self._generation:
+            return
+        count, max_pk = _fingerprint()
+        removals = list(FollowRemoval.objects.filter(
+            pk__gt=self._removal_pk
+        ).order_by('pk').values_list('pk', 'user_id', 'author_id'))
+        if not removals and (count, max_pk) == (self._count, self._max_pk):
+            self._generation = generation
+            return
+        if removals:
+            self._removal_pk = removals[-1][0]
+            pairs = {(user_id, author_id)
+                     for _, user_id, author_id in removals}
+            for user_id, author_id in pairs - _still_followed(pairs):
+                self._apply(user_id, author_id, False)
+        # Отписки применены раньше: повторная подписка после отписки
+        # пришла новой строкой и вернёт ребро.
+        for pk, user_id, author_id in Follow.objects.filter(
+            pk__gt=self._max_pk
+        ).values_list('pk', 'user_id', 'author_id').iterator():
+            self._apply(user_id, author_id, True, pk)
+        if self._count != count:
+            # Отписка выпала из журнала по сроку или строки удалены в
+            # обход сигналов: тогда граф строится заново.
+            self.build()
+            return
+        self._max_pk = max(self._max_pk, max_pk)
+        self._generation = generation
+
+    def following(self, user_id):
+        with self._lock:
+            self._sync()
+            return list(self._following.neighbours(user_id))
+
+    def followers(self, author_id):
+        with self._lock:
+            self._sync()
+            return list(self._followers.neighbours(author_id))
+
+    def following_count(self, user_id):
+        with self._lock:
+            self._sync()
+            return self._following.degree(user_id)
+
+    def follower_count(self, author_id):
+        with self._lock:
+            self._sync()
+            return self._followers.degree(author_id)
+
+    def recommend(self, user_id, limit=RECOMMENDATIONS):
+        """Авторы, на которых чаще всего подписаны те, кого читает user."""
+        with self._lock:
+            self._sync()
+            following = self._following.neighbours(user_id)
+            scores = Counter()
+            for friend in following:
+                scores.update(
+                    self._following.neighbours(friend)[:MAX_FANOUT]
+                )
+        for author_id in (user_id, *following):
+            scores.pop(author_id, None)
+        return heapq.nlargest(
+            limit, scores, key=lambda author_id: (scores[author_id],
+                                                  -author_id)
+        )
+
+    def save(self, path):
+        """Пишет снимок графа атомарной заменой файла."""
+        with self._lock:
+            self._sync()
+            following = self._following = self._following.compact()
+            followers = self._followers = self._followers.compact()
+            header = SNAPSHOT_HEADER.pack(
+                SNAPSHOT_MAGIC, self._count, self._max_pk, self._removal_pk,
+                len(following.offsets), len(following.targets),
+                len(followers.offsets), len(followers.targets),
+            )
+            directory = os.path.dirname(path) or '.'
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as file:
+                file.write(header)
+                for values in (following.offsets, following.targets,
+                               followers.offsets, followers.targets):
+                    values.tofile(file)
+            os.replace(tmp_path, path)
+
+    def load(self, path=None):
+        """Читает снимок; новые подписки дочитает первая сверка."""
+        path = path or settings.FOLLOW_GRAPH_SNAPSHOT
+        try:
+            with open(path, 'rb') as file:
+                (magic, count, max_pk, removal_pk,
+                 *sizes) = SNAPSHOT_HEADER.unpack(
+                    file.read(SNAPSHOT_HEADER.size)
+                )
+                if magic != SNAPSHOT_MAGIC:
+                    return False
+                arrays = []
+                for size, typecode in zip(sizes, (OFFSET_TYPE, NODE_TYPE,
+                                                  OFFSET_TYPE, NODE_TYPE)):
+                    values = array(typecode)
+                    values.fromfile(file, size)
+                    arrays.append(values)
+        except (OSError, EOFError, struct.error):
+            return False
+        with self._lock:
+            self._following = Adjacency(*arrays[:2])
+            self._followers = Adjacency(*arrays[2:])
+            self._count, self._max_pk = count, max_pk
+            self._removal_pk = removal_pk
+            self._generation = None
+        logger.info('Follow graph loaded from %s', path)
+        return True
+
+
+follow_graph = FollowGraph()
+
+
+def _in_transaction():
+    # Незафиксированные подписки в общий граф попасть не должны.
+    return transaction.get_connection().in_atomic_block
+
+
+def following_ids(user_id):
+    if _in_transaction():
+        return list(Follow.objects.filter(user_id=user_id).order_by(
+            'author_id'
+        ).values_list('author_id', flat=True))
+    return follow_graph.following(user_id)
+
+
+def follower_ids(author_id):
+    if _in_transaction():
+        return list(Follow.objects.filter(author_id=author_id).order_by(
+            'user_id'
+        ).values_list('user_id', flat=True))
+    return follow_graph.followers(author_id)
+
+
+def following_count(user_id):
+    if _in_transaction():
+        return Follow.objects.filter(user_id=user_id).count()
+    return follow_graph.following_count(user_id)
+
+
+def follower_count(author_id):
+    if _in_transaction():
+        return Follow.objects.filter(author_id=author_id).count()
+    return follow_graph.follower_count(author_id)
+
+
+def recommended_ids(user_id, limit=RECOMMENDATIONS):
+    if not _in_transaction():
+        return follow_graph.recommend(user_id, limit)
+    following = Follow.objects.filter(user_id=user_id).values('author_id')
+    return list(Follow.objects.filter(user_id__in=following).exclude(
+        author_id__in=following
+    ).exclude(author_id=user_id).values('author_id').annotate(
+        score=Count('pk')
+    ).order_by('-score', 'author_id').values_list(
+        'author_id', flat=True
+    )[:limit])
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: follow_graph.apply(
+            instance.user_id, instance.author_id, True, instance.pk
+        ))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    user_id, author_id = instance.user_id, instance.author_id
+    # В той же транзакции, что и удаление: откат отменит и запись.
+    FollowRemoval.objects.using(instance._state.db).create(
+        user_id=user_id, author_id=author_id
+    )
+    transaction.on_commit(
+        lambda: follow_graph.apply(user_id, author_id, False)
+    )
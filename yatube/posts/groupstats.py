@@ -0,0 +1,154 @@
+"""Сводки по группам для каталога.
+
+Число постов, время последнего поста и самые активные авторы хранятся
+в GroupStats и GroupAuthor и меняются на единицу при сохранении или
+удалении поста, поэтому каталог читает их одним запросом. Операции без
+сигналов (``update()``, ``bulk_create()``, перенос между шардами)
+поправляет ``reconcile()`` — её запускает ``reconcile_group_stats``.
+"""
+import json
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.querycache import invalidate
+
+from .models import GroupAuthor, GroupStats, Post
+from .sharding import shards
+
+TOP_AUTHORS = 3
+
+
+def _refresh_top(group_id):
+    top = GroupAuthor.objects.filter(
+        group_id=group_id, post_count__gt=0
+    ).order_by('-post_count', 'author_id').values_list(
+        'author__username', 'post_count'
+    )[:TOP_AUTHORS]
+    GroupStats.objects.filter(group_id=group_id).update(
+        top_authors=json.dumps(list(top), ensure_ascii=False)
+    )
+
+
+def _last_activity(group_id):
+    dates = [
+        Post.objects.using(alias).filter(group_id=group_id).aggregate(
+            last=Max('pub_date')
+        )['last'] for alias in shards()
+    ]
+    return max(filter(None, dates), default=None)
+
+
+def change(group_id, author_id, delta, pub_date):
+    """Учитывает появление (delta=1) или исчезновение поста в группе."""
+    with transaction.atomic():
+        GroupStats.objects.get_or_create(group_id=group_id)
+        GroupAuthor.objects.get_or_create(group_id=group_id,
+                                          author_id=author_id)
+        # Строки, созданные до первой сверки, могут отставать от постов:
+        # счётчик не уходит ниже нуля.
+        GroupStats.objects.filter(group_id=group_id).update(
+            post_count=Greatest(F('post_count') + delta, Value(0))
+        )
+        GroupAuthor.objects.filter(
+            group_id=group_id, author_id=author_id
+        ).update(post_count=Greatest(F('post_count') + delta, Value(0)))
+        if delta > 0:
+            GroupStats.objects.filter(
+                Q(last_activity__isnull=True)
+                | Q(last_activity__lt=pub_date),
+                group_id=group_id,
+            ).update(last_activity=pub_date)
+        elif GroupStats.objects.filter(group_id=group_id,
+                                       last_activity__lte=pub_date).exists():
+            # Исчез самый свежий пост: ищем следующий.
+            GroupStats.objects.filter(group_id=group_id).update(
+                last_activity=_last_activity(group_id)
+            )
+        _refresh_top(group_id)
+    invalidate(GroupStats)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        old_group_id = None
+    elif hasattr(instance, '_saved_group_id'):
+        old_group_id = instance._saved_group_id
+    else:
+        # Пост загружен без группы: переезд не отследить, поправит сверка.
+        return
+    if old_group_id == instance.group_id:
+        return
+    if old_group_id is not None:
+        change(old_group_id, instance.author_id, -1, instance.pub_date)
+    if instance.group_id is not None:
+        change(instance.group_id, instance.author_id, 1, instance.pub_date)
+    instance._saved_group_id = instance.group_id
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    # Скрытый пост ушёл из сводок, когда его скрыли (см. forget).
+    if instance.group_id is not None and not instance.is_deleted:
+        change(instance.group_id, instance.author_id, -1, instance.pub_date)
+
+
+def summarize(queryset):
+    """Посты queryset по группам и авторам: сколько и когда последний."""
+    return list(queryset.exclude(group_id=None).values(
+        'group_id', 'author_id'
+    ).annotate(posts=Count('pk'), last=Max('pub_date')).order_by())
+
+
+def forget(summary):
+    """Убирает из сводок посты, скрытые до фонового удаления."""
+    for row in summary:
+        change(row['group_id'], row['author_id'], -row['posts'],
+               row['last'])
+
+
+def reconcile():
+    """Пересчитывает все сводки по постам из всех шардов.
+
+    Скрытые посты, которые ещё удаляет фоновая задача, не учитываются.
+    """
+    counts = {}
+    last = {}
+    for alias in shards():
+        rows = Post.objects.using(alias).exclude(
+            group_id=None
+        ).values('group_id', 'author_id').annotate(
+            posts=Count('pk'), last=Max('pub_date')
+        ).order_by()
+        for row in rows.iterator():
+            key = row['group_id'], row['author_id']
+            counts[key] = counts.get(key, 0) + row['posts']
+            group_last = last.get(row['group_id'])
+            if group_last is None or row['last'] > group_last:
+                last[row['group_id']] = row['last']
+    totals = {}
+    for (group_id, _), posts in counts.items():
+        totals[group_id] = totals.get(group_id, 0) + posts
+    with transaction.atomic():
+        GroupAuthor.objects.all().delete()
+        GroupAuthor.objects.bulk_create(
+            GroupAuthor(group_id=group_id, author_id=author_id,
+                        post_count=posts)
+            for (group_id, author_id), posts in counts.items()
+        )
+        GroupStats.objects.exclude(group_id__in=totals).update(
+            post_count=0, last_activity=None, top_authors='[]'
+        )
+        for group_id, posts in totals.items():
+            GroupStats.objects.update_or_create(
+                group_id=group_id,
+                defaults={'post_count': posts,
+                          'last_activity': last[group_id]},
+            )
+            _refresh_top(group_id)
+    invalidate(GroupStats, GroupAuthor)
+    return len(totals)
@@ -0,0 +1,45 @@
+from PIL import Image
+from sorl.thumbnail.parsers import parse_geometry
+
+# До какого размера уменьшать картинку перед подсчётом цвета:
+# JPEG декодируется сразу в уменьшенном виде.
+DRAFT_SIZE = (64, 64)
+
+# Миниатюра в ленте и на странице поста.
+THUMBNAIL_GEOMETRY = '350x350'
+THUMBNAIL_OPTIONS = {'crop': 'center', 'upscale': True}
+
+
+def read_image_metadata(file):
+    """Размеры и средний цвет картинки в виде '#rrggbb'."""
+    file.seek(0)
+    with Image.open(file) as image:
+        width, height = image.size
+        image.draft('RGB', DRAFT_SIZE)
+        red, green, blue = image.convert('RGB').resize(
+            (1, 1), Image.BOX
+        ).getpixel((0, 0))
+    file.seek(0)
+    return width, height, f'#{red:02x}{green:02x}{blue:02x}'
+
+
+def _scale(number):
+    # Округление как у sorl (helpers.toint): не меньше одного пикселя.
+    return max(int(round(number)), 1)
+
+
+def thumbnail_size(width, height, geometry=THUMBNAIL_GEOMETRY,
+                   options=THUMBNAIL_OPTIONS):
+    """Размер миниатюры по сохранённым размерам оригинала.
+
+    Повторяет расчёт sorl: масштаб под рамку (с crop — по большей
+    стороне), затем обрезка до рамки.
+    """
+    box_width, box_height = parse_geometry(geometry, width / height)
+    factors = (box_width / width, box_height / height)
+    factor = max(factors) if options.get('crop') else min(factors)
+    if factor < 1 or options.get('upscale'):
+        width, height = _scale(width * factor), _scale(height * factor)
+    if options.get('crop'):
+        width, height = min(width, box_width), min(height, box_height)
+    return width, height
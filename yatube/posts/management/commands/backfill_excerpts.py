@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.querycache import invalidate
+from posts.models import Post, make_excerpt
+
+
+class Command(BaseCommand):
+    help = 'Заполняет анонсы постов, созданных до появления поля excerpt.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--pause', type=float, default=0.1,
+            help='Пауза между пачками, секунд: даёт пройти другим записям.'
+        )
+
+    def handle(self, *args, **options):
+        last_pk = 0
+        updated = 0
+        while True:
+            batch = list(
+                Post.objects.filter(pk__gt=last_pk, excerpt='')
+                .exclude(text='')
+                .order_by('pk')
+                .only('pk', 'text')[:options['batch_size']]
+            )
+            if not batch:
+                break
+            for post in batch:
+                post.excerpt, post.has_more = make_excerpt(post.text)
+            with transaction.atomic():
+                Post.objects.bulk_update(batch, ['excerpt', 'has_more'])
+            last_pk = batch[-1].pk
+            updated += len(batch)
+            self.stdout.write(f'Обновлено постов: {updated}')
+            time.sleep(options['pause'])
+        invalidate(Post)
+        self.stdout.write(self.style.SUCCESS(f'Готово, постов: {updated}'))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.duplicates import backfill
+
+
+class Command(BaseCommand):
+    help = (
+        'Считает SimHash-отпечатки постов, у которых их нет, и помечает '
+        'почти дубликаты для админки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--pause', type=float, default=0.1,
+            help='Пауза между пачками, секунд: даёт пройти другим записям.'
+        )
+
+    def handle(self, *args, **options):
+        processed = flagged = 0
+        for processed, flagged in backfill(options['batch_size']):
+            self.stdout.write(f'Просмотрено постов: {processed}')
+            time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово, постов: {processed}, почти дубликатов: {flagged}'
+        ))
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.querycache import invalidate
+from posts.images import read_image_metadata
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Заполняет размеры и цвет-заглушку для уже загруженных картинок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--pause', type=float, default=0.1)
+
+    def handle(self, *args, **options):
+        last_pk = 0
+        updated = missing = 0
+        while True:
+            batch = list(
+                Post.objects.filter(pk__gt=last_pk, image_width__isnull=True)
+                .exclude(image='')
+                .order_by('pk')
+                .only('pk', 'image')[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            changed = []
+            for post in batch:
+                try:
+                    with post.image.open('rb') as file:
+                        (post.image_width, post.image_height,
+                         post.image_color) = read_image_metadata(file)
+                except (OSError, ValueError):
+                    missing += 1
+                    continue
+                changed.append(post)
+            with transaction.atomic():
+                Post.objects.bulk_update(
+                    changed, ['image_width', 'image_height', 'image_color']
+                )
+            updated += len(changed)
+            self.stdout.write(f'Обновлено: {updated}, без файла: {missing}')
+            time.sleep(options['pause'])
+        invalidate(Post)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово, обновлено: {updated}, без файла: {missing}'
+        ))
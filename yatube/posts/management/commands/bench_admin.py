@@ -0,0 +1,92 @@
+import time
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_databases, teardown_databases)
+from faker import Faker
+
+from posts.duplicates import backfill
+from posts.groupstats import reconcile
+from posts.models import Group, Post, make_excerpt
+
+User = get_user_model()
+
+BATCH_SIZE = 10000
+# Кеш запросов и счётчиков не должен ни читать рабочий кеш, ни писать
+# в него строки временной базы.
+BENCH_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bench_admin',
+    }
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет страницу списка постов в админке. Посты создаются во '
+        'временной тестовой базе с кешем в памяти процесса, рабочие база '
+        'и кеш не меняются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1000000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with override_settings(CACHES=BENCH_CACHES):
+            old_config = setup_databases(verbosity=0, interactive=False)
+            try:
+                self.bench(options['posts'], options['repeat'])
+            finally:
+                teardown_databases(old_config, verbosity=0)
+
+    def bench(self, total, repeat):
+        user = User.objects.create(
+            username='bench_admin', is_staff=True, is_superuser=True
+        )
+        group = Group.objects.create(
+            slug='bench-admin', title='Бенчмарк', description='Бенчмарк'
+        )
+        self.fill(total, user, group)
+
+        request = RequestFactory().get('/admin/posts/post/')
+        request.user = user
+        model_admin = admin.site._registry[Post]
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            with CaptureQueriesContext(connection) as queries:
+                model_admin.changelist_view(request).render()
+            timings.append(time.perf_counter() - start)
+        self.stdout.write(
+            f'Posts: {Post.objects.order_by().count()}, '
+            f'queries per page: {len(queries)}, '
+            f'best: {min(timings) * 1000:.1f} ms, '
+            f'worst: {max(timings) * 1000:.1f} ms'
+        )
+
+    def fill(self, total, user, group):
+        fake = Faker('ru_RU')
+        fake.seed_instance(0)
+        missing = total
+        while missing > 0:
+            size = min(missing, BATCH_SIZE)
+            posts = []
+            for _ in range(size):
+                # bulk_create минует save(): производные поля — вручную.
+                post = Post(text=fake.text(), author=user, group=group)
+                post.excerpt, post.has_more = make_excerpt(post.text)
+                posts.append(post)
+            Post.objects.bulk_create(posts)
+            missing -= size
+            self.stdout.write(f'Осталось создать: {missing}')
+        # Отпечатки и сводки групп — теми же проходами, что после
+        # массовых операций без сигналов.
+        for processed, _ in backfill(BATCH_SIZE):
+            self.stdout.write(f'Отпечатков посчитано: {processed}')
+        reconcile()
@@ -0,0 +1,52 @@
+import re
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.querycache import invalidate
+from posts.models import ImageBlob, Post
+
+DIGEST_NAME = re.compile(r'/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$')
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки, загруженные до дедупликации, в хранилище по '
+        'хешу содержимого. Старые файлы потом убирает gc_media.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        last_pk = 0
+        moved = missing = 0
+        while True:
+            batch = list(
+                Post.all_objects.filter(pk__gt=last_pk)
+                .exclude(image='')
+                .order_by('pk')
+                .only('pk', 'image')[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            for post in batch:
+                if DIGEST_NAME.search(post.image.name):
+                    continue
+                try:
+                    with storage.open(post.image.name) as file:
+                        name = storage.save(post.image.name, file)
+                except OSError:
+                    missing += 1
+                    continue
+                with transaction.atomic():
+                    Post.all_objects.filter(pk=post.pk).update(image=name)
+                    ImageBlob.acquire(name)
+                moved += 1
+            self.stdout.write(f'Перенесено: {moved}, без файла: {missing}')
+        invalidate(Post)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово, перенесено: {moved}, без файла: {missing}'
+        ))
@@ -0,0 +1,139 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+
+from posts.models import ArchivedPost, ImageBlob, Post
+from posts.sharding import shards
+
+
+def walk_kvstore(referenced):
+    """Делит записи sorl на живые миниатюры и записи осиротевших картинок."""
+    kvstore = default.kvstore
+    live_thumbnails = set()
+    orphan_sources = []
+    try:
+        for key in kvstore._find_keys(identity='thumbnails'):
+            source = kvstore._get(key)
+            thumbnail_keys = kvstore._get(key, identity='thumbnails') or []
+            thumbnails = [kvstore._get(k) for k in thumbnail_keys]
+            names = {t.name for t in thumbnails if t is not None}
+            if source is not None and source.name in referenced:
+                live_thumbnails |= names
+            elif source is not None:
+                orphan_sources.append(source)
+    finally:
+        connection.close()
+    return live_thumbnails, orphan_sources
+
+
+def walk_media(directories, min_age):
+    """Файлы в каталогах media старше min_age секунд: имя -> размер."""
+    files = {}
+    deadline = time.time() - min_age
+    for directory in directories:
+        root = os.path.join(settings.MEDIA_ROOT, directory)
+        for path, _, filenames in os.walk(root):
+            for filename in filenames:
+                full_path = os.path.join(path, filename)
+                stat = os.stat(full_path)
+                if stat.st_mtime > deadline:
+                    continue
+                name = os.path.relpath(full_path, settings.MEDIA_ROOT)
+                files[name.replace(os.sep, '/')] = stat.st_size
+    return files
+
+
+def is_fresh(path, min_age):
+    try:
+        return os.stat(path).st_mtime > time.time() - min_age
+    except FileNotFoundError:
+        return False
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из media картинки, на которые не ссылается ни один пост, '
+        'и миниатюры к ним.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument(
+            '--pause', type=float, default=0.5,
+            help='Пауза между пачками удалений, секунд.'
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Не трогать файлы моложе стольких секунд: их могут '
+                 'ещё загружать.'
+        )
+
+    def handle(self, *args, **options):
+        upload_dir = Post._meta.get_field('image').upload_to.strip('/')
+        thumbnail_dir = thumbnail_settings.THUMBNAIL_PREFIX.strip('/')
+        # Старые картинки без строки ImageBlob держит только ссылка из
+        # поста, поэтому смотрим посты и архив во всех шардах.
+        referenced = set()
+        for alias in shards():
+            for manager in (Post.all_objects, ArchivedPost.objects):
+                referenced.update(
+                    manager.using(alias).exclude(image='')
+                    .values_list('image', flat=True).iterator()
+                )
+        referenced |= set(
+            ImageBlob.objects.filter(refcount__gt=0)
+            .values_list('name', flat=True).iterator()
+        )
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            kv_future = executor.submit(walk_kvstore, referenced)
+            files_future = executor.submit(
+                walk_media, (upload_dir, thumbnail_dir), options['min_age']
+            )
+            live_thumbnails, orphan_sources = kv_future.result()
+            files = files_future.result()
+
+        orphans = sorted(
+            name for name in files
+            if name not in referenced and name not in live_thumbnails
+        )
+        reclaimed = sum(files[name] for name in orphans)
+        self.stdout.write(
+            f'Файлов: {len(files)}, сирот: {len(orphans)}, '
+            f'записей sorl без поста: {len(orphan_sources)}, '
+            f'освободится: {reclaimed} байт'
+        )
+        if options['dry_run']:
+            for name in orphans:
+                self.stdout.write(f'  {name}')
+            return
+
+        storage = Post._meta.get_field('image').storage
+        batch_size = options['batch_size']
+        deleted = freed = 0
+        for start in range(0, len(orphans), batch_size):
+            batch = []
+            for name in orphans[start:start + batch_size]:
+                # Пока шёл обход, файл могли загрузить заново: сохранение
+                # дубликата обновляет его mtime.
+                if is_fresh(storage.path(name), options['min_age']):
+                    continue
+                storage.delete(name)
+                batch.append(name)
+            ImageBlob.objects.filter(name__in=batch, refcount=0).delete()
+            deleted += len(batch)
+            freed += sum(files[name] for name in batch)
+            time.sleep(options['pause'])
+        for start in range(0, len(orphan_sources), batch_size):
+            for source in orphan_sources[start:start + batch_size]:
+                default.kvstore.delete(source)
+            time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено файлов: {deleted}, освобождено: {freed} байт'
+        ))
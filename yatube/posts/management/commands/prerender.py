@@ -0,0 +1,72 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.prerender import all_keys, render_key, take_dirty
+
+
+def _render_chunk(keys):
+    try:
+        return sum(render_key(key) for key in keys)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Пререндерит публичные страницы в PRERENDER_ROOT. Без флагов — '
+        'полная пересборка, с --watch — перерисовка изменённых страниц.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--jobs', type=int, default=os.cpu_count(),
+            help='Процессов для полной пересборки.'
+        )
+        parser.add_argument('--chunk-size', type=int, default=50)
+        parser.add_argument(
+            '--watch', action='store_true',
+            help='Не выходить, а перерисовывать страницы из очереди.'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Пауза между проверками очереди в режиме --watch, секунд.'
+        )
+
+    def handle(self, *args, **options):
+        if options['watch']:
+            while True:
+                self.process_dirty()
+                time.sleep(options['interval'])
+        else:
+            self.rebuild(options['jobs'], options['chunk_size'])
+
+    def process_dirty(self):
+        keys, work_path = take_dirty()
+        if work_path is None:
+            return 0
+        files = sum(render_key(key) for key in keys)
+        os.remove(work_path)
+        self.stdout.write(f'Перерисовано страниц: {len(keys)}, '
+                          f'файлов: {files}')
+        return len(keys)
+
+    def rebuild(self, jobs, chunk_size):
+        start = time.monotonic()
+        keys = list(all_keys())
+        chunks = [keys[i:i + chunk_size]
+                  for i in range(0, len(keys), chunk_size)]
+        if jobs > 1:
+            # Форкнутые процессы не должны делить соединение родителя.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                files = sum(executor.map(_render_chunk, chunks))
+        else:
+            files = sum(render_key(key) for key in keys)
+        self.stdout.write(self.style.SUCCESS(
+            f'Страниц: {len(keys)}, файлов: {files}, '
+            f'за {time.monotonic() - start:.1f} с'
+        ))
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.models import AuthorShard
+from posts.sharding import (MOVE_BATCH_SIZE, hashed_shard, move_author,
+                            pin_authors)
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит посты авторов в шарды, на которые указывает хеш. '
+        'С --pin только закрепляет авторов за текущими шардами — это '
+        'нужно сделать до добавления новой базы в POST_SHARDS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pin', action='store_true',
+            help='Закрепить авторов за шардами, где сейчас их посты.'
+        )
+        parser.add_argument('--batch-size', type=int,
+                            default=MOVE_BATCH_SIZE)
+        parser.add_argument(
+            '--pause', type=float, default=0.1,
+            help='Пауза между авторами, секунд.'
+        )
+
+    def handle(self, *args, **options):
+        if options['pin']:
+            pinned = pin_authors()
+            self.stdout.write(self.style.SUCCESS(
+                f'Закреплено авторов: {pinned}'
+            ))
+            return
+        authors = moved = 0
+        for pin in list(AuthorShard.objects.order_by('pk')):
+            target = hashed_shard(pin.author_id)
+            if pin.alias != target:
+                moved += move_author(pin.author_id, target,
+                                     options['batch_size'])
+                authors += 1
+                self.stdout.write(
+                    f'Автор {pin.author_id}: {pin.alias} -> {target}'
+                )
+                time.sleep(options['pause'])
+            # Хеш теперь указывает туда же, закрепление не нужно.
+            AuthorShard.objects.filter(pk=pin.pk).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово, перенесено авторов: {authors}, строк: {moved}'
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts.groupstats import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает сводки каталога групп по постам. Запускать по cron: '
+        'поправляет расхождения после массовых операций без сигналов.'
+    )
+
+    def handle(self, *args, **options):
+        groups = reconcile()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано групп с постами: {groups}'
+        ))
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.graph import FollowGraph, prune_removals
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит граф подписок по базе и сохраняет снимок, с которого '
+        'быстро стартуют новые процессы, и чистит старый журнал отписок. '
+        'Удобно запускать по cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=settings.FOLLOW_GRAPH_SNAPSHOT)
+
+    def handle(self, *args, **options):
+        graph = FollowGraph()
+        graph.build()
+        graph.save(options['path'])
+        pruned = prune_removals()
+        self.stdout.write(self.style.SUCCESS(
+            f'Снимок графа записан в {options["path"]}, '
+            f'старых отписок удалено: {pruned}'
+        ))
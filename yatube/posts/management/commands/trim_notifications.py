@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts.notifications import MAX_PER_USER, RETENTION_DAYS, trim
+
+
+class Command(BaseCommand):
+    help = (
+        f'Удаляет прочитанные уведомления старше {RETENTION_DAYS} дней и '
+        f'всё сверх {MAX_PER_USER} последних у каждого пользователя.'
+    )
+
+    def handle(self, *args, **options):
+        deleted = trim()
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено уведомлений: {deleted}'
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts.trending import trim
+
+
+class Command(BaseCommand):
+    help = 'Удаляет из рейтинга популярности давно затухшие записи.'
+
+    def handle(self, *args, **options):
+        deleted = trim()
+        self.stdout.write(self.style.SUCCESS(f'Удалено записей: {deleted}'))
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.16 on 2026-10-19 09:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_authorshard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Trend',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('post', 'Пост'), ('group', 'Группа')], max_length=5)),
+                ('object_id', models.PositiveIntegerField()),
+                ('rank', models.FloatField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='trend',
+            index=models.Index(fields=['kind', '-rank'], name='posts_trend_rank_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='trend',
+            unique_together={('kind', 'object_id')},
+        ),
+    ]
@@ -0,0 +1,72 @@
+import json
+
+from django.conf import settings
+from django.db import connections, migrations
+from django.db.models import Count, Max
+
+# Копия posts.groupstats.TOP_AUTHORS на момент миграции.
+TOP_AUTHORS = 3
+
+
+def backfill_group_stats(apps, schema_editor):
+    """Заполняет сводки групп по постам, написанным до их появления.
+
+    Агрегация повторяет posts.groupstats.reconcile, но на исторических
+    моделях: живой код может измениться после этой миграции.
+    """
+    if schema_editor.connection.alias != 'default':
+        return
+    Post = apps.get_model('posts', 'Post')
+    GroupStats = apps.get_model('posts', 'GroupStats')
+    GroupAuthor = apps.get_model('posts', 'GroupAuthor')
+    # Шарды, которые ещё не мигрированы, постов не содержат.
+    table = Post._meta.db_table
+    aliases = [alias for alias in settings.POST_SHARDS
+               if table in connections[alias].introspection.table_names()]
+    counts = {}
+    last = {}
+    for alias in aliases:
+        rows = Post.objects.using(alias).filter(
+            is_deleted=False, group__isnull=False
+        ).values('group_id', 'author_id').annotate(
+            posts=Count('pk'), last=Max('pub_date')
+        ).order_by()
+        for row in rows.iterator():
+            key = row['group_id'], row['author_id']
+            counts[key] = counts.get(key, 0) + row['posts']
+            group_last = last.get(row['group_id'])
+            if group_last is None or row['last'] > group_last:
+                last[row['group_id']] = row['last']
+    totals = {}
+    for (group_id, _), posts in counts.items():
+        totals[group_id] = totals.get(group_id, 0) + posts
+    GroupAuthor.objects.all().delete()
+    GroupAuthor.objects.bulk_create(
+        GroupAuthor(group_id=group_id, author_id=author_id, post_count=posts)
+        for (group_id, author_id), posts in counts.items()
+    )
+    for group_id, posts in totals.items():
+        top = GroupAuthor.objects.filter(
+            group_id=group_id, post_count__gt=0
+        ).order_by('-post_count', 'author_id').values_list(
+            'author__username', 'post_count'
+        )[:TOP_AUTHORS]
+        GroupStats.objects.update_or_create(
+            group_id=group_id,
+            defaults={
+                'post_count': posts,
+                'last_activity': last[group_id],
+                'top_authors': json.dumps(list(top), ensure_ascii=False),
+            },
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0024_postfingerprint'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_group_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.16 on 2026-10-19 09:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0025_backfill_groupstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdWorker',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pid', models.PositiveIntegerField()),
+                ('started', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
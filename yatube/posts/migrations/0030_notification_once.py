@@ -0,0 +1,36 @@
+# Generated by Django 2.2.16 on 2026-10-19 10:26
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def drop_duplicates(apps, schema_editor):
+    """Оставляет по одному уведомлению о посте на получателя."""
+    Notification = apps.get_model('posts', 'Notification')
+    db = schema_editor.connection.alias
+    duplicates = Notification.objects.using(db).values(
+        'recipient_id', 'post_id'
+    ).annotate(first=Min('pk'), total=Count('pk')).filter(
+        total__gt=1
+    ).order_by()
+    for row in duplicates.iterator():
+        Notification.objects.using(db).filter(
+            recipient_id=row['recipient_id'], post_id=row['post_id']
+        ).exclude(pk=row['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0029_follow_removal'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicates, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='notification',
+            unique_together={('recipient', 'post_id')},
+        ),
+    ]
@@ -1,8 +1,22 @@
+import json
+
 from django.db import models
+from django.db.models import F
 from django.contrib.auth import get_user_model
+from django.utils.text import Truncator
+
+from .images import read_image_metadata
+from .storage import ContentAddressedStorage
 
 User = get_user_model()
 
+EXCERPT_LENGTH = 300
+
+
+def make_excerpt(text):
+    excerpt = Truncator(text).chars(EXCERPT_LENGTH)
+    return excerpt, excerpt != text
+
 
 class Group(models.Model):
     title = models.CharField('Название сообщества', max_length=200)
@@ -13,7 +27,16 @@ class Group(models.Model):
         return self.title
 
 
+class VisiblePostManager(models.Manager):
+    """Посты без помеченных на удаление: их уже не видно нигде."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
+
 class Post(models.Model):
+    # id из шардов — 63-битные (см. posts.sharding).
+    id = models.BigAutoField(primary_key=True)
     text = models.TextField()
     pub_date = models.DateTimeField(auto_now_add=True, db_index=True)
     group = models.ForeignKey(
@@ -31,14 +54,105 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
-        blank=True
+        blank=True,
+        storage=ContentAddressedStorage()
+    )
+    image_width = models.PositiveIntegerField(
+        null=True, blank=True, editable=False
     )
+    image_height = models.PositiveIntegerField(
+        null=True, blank=True, editable=False
+    )
+    image_color = models.CharField(
+        'Цвет-заглушка',
+        max_length=7,
+        blank=True,
+        editable=False
+    )
+    # Готовая миниатюра (см. posts.tasks.generate_thumbnails); пусто,
+    # пока задача её не построила.
+    thumbnail = models.CharField(max_length=255, blank=True,
+                                 editable=False)
+    views = models.PositiveIntegerField('Просмотры', default=0)
+    excerpt = models.CharField(
+        'Анонс',
+        max_length=EXCERPT_LENGTH,
+        blank=True,
+        editable=False
+    )
+    has_more = models.BooleanField(default=False, editable=False)
+    is_deleted = models.BooleanField(
+        'Удаляется', default=False, editable=False
+    )
+
+    objects = VisiblePostManager()
+    all_objects = models.Manager()
 
     def __str__(self) -> str:
         return self.text[:15]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'image' not in instance.get_deferred_fields():
+            instance._saved_image = instance.image.name or ''
+        if 'group_id' in field_names:
+            instance._saved_group_id = instance.group_id
+        return instance
+
+    def save(self, *args, **kwargs):
+        from .sharding import assign_id
+
+        assign_id(self, kwargs)
+        # Производные поля пересчитываем, только если исходное загружено.
+        deferred = self.get_deferred_fields()
+        if 'text' not in deferred:
+            self.excerpt, self.has_more = make_excerpt(self.text)
+        if 'image' not in deferred:
+            self.update_image_metadata()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'text' in update_fields:
+                update_fields |= {'excerpt', 'has_more'}
+            if 'image' in update_fields:
+                update_fields |= {'image_width', 'image_height',
+                                  'image_color', 'thumbnail'}
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+        if 'image' not in deferred:
+            self.sync_image_refs()
+
+    def sync_image_refs(self):
+        """Переносит ссылку со старой картинки на новую."""
+        saved = getattr(self, '_saved_image', '')
+        current = self.image.name or ''
+        if current == saved:
+            return
+        if current:
+            ImageBlob.acquire(current)
+        if saved:
+            ImageBlob.release(saved)
+        self._saved_image = current
+
+    def update_image_metadata(self):
+        """Запоминает размеры и цвет только что загруженной картинки."""
+        if not self.image:
+            self.image_width = self.image_height = None
+            self.image_color = ''
+            self.thumbnail = ''
+        elif not self.image._committed:
+            self.thumbnail = ''
+            try:
+                (self.image_width, self.image_height,
+                 self.image_color) = read_image_metadata(self.image)
+            except (OSError, ValueError):
+                self.image_width = self.image_height = None
+                self.image_color = ''
+
 
 class Comment(models.Model):
+    id = models.BigAutoField(primary_key=True)
     post = models.ForeignKey(
         Post,
         related_name='comments',
@@ -50,7 +164,16 @@ class Comment(models.Model):
         related_name='comments'
     )
     text = models.TextField()
-    created = models.DateTimeField(auto_now_add=True)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self) -> str:
+        return self.text[:15]
+
+    def save(self, *args, **kwargs):
+        from .sharding import assign_id
+
+        assign_id(self, kwargs)
+        super().save(*args, **kwargs)
 
 
 class Follow(models.Model):
@@ -64,3 +187,328 @@ class Follow(models.Model):
         related_name='following',
         on_delete=models.CASCADE
     )
+
+
+class FollowRemoval(models.Model):
+    """Журнал отписок для графов подписок в других процессах.
+
+    Граф (posts.graph) дочитывает отписки по id так же, как новые
+    подписки, и не перечитывает ради них всю таблицу posts_follow.
+    Старые записи удаляет manage.py snapshot_follow_graph.
+    """
+
+    user_id = models.IntegerField()
+    author_id = models.IntegerField()
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+class ImageBlob(models.Model):
+    """Счётчик ссылок постов на файл картинки."""
+
+    name = models.CharField(max_length=100, unique=True)
+    refcount = models.PositiveIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return self.name
+
+    @classmethod
+    def acquire(cls, name):
+        blob, created = cls.objects.get_or_create(
+            name=name, defaults={'refcount': 1}
+        )
+        if not created:
+            cls.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1)
+
+    @classmethod
+    def release(cls, name):
+        """Снимает ссылку на файл.
+
+        Сам файл здесь не удаляется: между удалением строки и файла ту же
+        картинку может загрузить другой пост, и он останется без файла.
+        Файлы без ссылок убирает manage.py gc_media, который не трогает
+        недавно загруженные и переиспользованные файлы.
+        """
+        cls.objects.filter(name=name, refcount__gt=0).update(
+            refcount=F('refcount') - 1
+        )
+
+
+class ArchivedPost(models.Model):
+    """Старый пост, перенесённый из горячей таблицы posts_post.
+
+    Первичный ключ совпадает с исходным, поэтому ссылки на пост не
+    меняются. Ленты архив не читают, а страница поста и профиль
+    обращаются к нему, если в горячей таблице ничего нет.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    text = models.TextField()
+    pub_date = models.DateTimeField(db_index=True)
+    group = models.ForeignKey(
+        Group,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='archived_posts'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_posts'
+    )
+    image = models.ImageField(
+        'Картинка',
+        upload_to='posts/',
+        blank=True,
+        storage=ContentAddressedStorage()
+    )
+    image_width = models.PositiveIntegerField(null=True, blank=True)
+    image_height = models.PositiveIntegerField(null=True, blank=True)
+    image_color = models.CharField(max_length=7, blank=True)
+    thumbnail = models.CharField(max_length=255, blank=True)
+    views = models.PositiveIntegerField('Просмотры', default=0)
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True)
+    has_more = models.BooleanField(default=False)
+
+    # Поля, которые переносятся из Post как есть.
+    copied_fields = (
+        'id', 'text', 'pub_date', 'group_id', 'author_id', 'image',
+        'image_width', 'image_height', 'image_color', 'thumbnail', 'views',
+        'excerpt',
+        'has_more',
+    )
+
+    class Meta:
+        verbose_name = 'Архивный пост'
+        verbose_name_plural = 'Архивные посты'
+
+    def __str__(self) -> str:
+        return self.text[:15]
+
+
+class ArchivedComment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    post = models.ForeignKey(
+        ArchivedPost,
+        related_name='comments',
+        on_delete=models.CASCADE
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_comments'
+    )
+    text = models.TextField()
+    created = models.DateTimeField(db_index=True)
+
+    copied_fields = ('id', 'post_id', 'author_id', 'text', 'created')
+
+    def __str__(self) -> str:
+        return self.text[:15]
+
+
+class AuthorShard(models.Model):
+    """Закрепление автора за шардом на время перебалансировки.
+
+    Пока записи нет, шард автора определяется хешем (см. posts.sharding).
+    """
+
+    author_id = models.IntegerField(unique=True)
+    alias = models.CharField('База', max_length=100)
+
+    def __str__(self) -> str:
+        return f'{self.author_id} -> {self.alias}'
+
+
+class IdWorker(models.Model):
+    """Процесс, выдающий id постов и комментариев в шардах.
+
+    Каждый процесс добавляет строку при первом id; номер процесса в id —
+    её pk по модулю 2**WORKER_BITS (см. posts.sharding).
+    """
+
+    pid = models.PositiveIntegerField()
+    started = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f'{self.pk}: {self.pid}'
+
+
+class GroupStats(models.Model):
+    """Сводка по группе для каталога групп (см. posts.groupstats).
+
+    Обновляется при сохранении и удалении постов; массовые операции
+    без сигналов поправляет периодическая сверка.
+    """
+
+    group = models.OneToOneField(
+        Group,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='stats'
+    )
+    post_count = models.PositiveIntegerField('Постов', default=0)
+    last_activity = models.DateTimeField('Последний пост', null=True)
+    # JSON: [[username, постов], ...] самых активных авторов.
+    top_authors = models.TextField(default='[]')
+
+    def __str__(self) -> str:
+        return f'{self.group_id}: {self.post_count}'
+
+    @property
+    def authors(self):
+        return [{'username': username, 'posts': posts}
+                for username, posts in json.loads(self.top_authors)]
+
+
+class GroupAuthor(models.Model):
+    """Сколько постов автор написал в группе."""
+
+    group = models.ForeignKey(Group, on_delete=models.CASCADE,
+                              related_name='author_stats')
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name='group_stats')
+    post_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('group', 'author')
+        indexes = [
+            models.Index(fields=['group', '-post_count'],
+                         name='posts_groupauthor_top_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.group_id}/{self.author_id}: {self.post_count}'
+
+
+class Notification(models.Model):
+    """Новый пост автора, на которого подписан получатель.
+
+    Пост может лежать в другом шарде, поэтому вместо внешнего ключа —
+    id поста и копия анонса.
+    """
+
+    recipient = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='notifications'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    post_id = models.BigIntegerField()
+    excerpt = models.CharField(max_length=200, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    is_read = models.BooleanField(default=False)
+
+    class Meta:
+        verbose_name = 'Уведомление'
+        verbose_name_plural = 'Уведомления'
+        indexes = [
+            models.Index(fields=['recipient', 'is_read'],
+                         name='posts_notification_unread_idx'),
+            models.Index(fields=['recipient', '-id'],
+                         name='posts_notification_inbox_idx'),
+        ]
+        # Очередь задач доставляет пачку хотя бы раз: повтор не должен
+        # дублировать уведомления.
+        unique_together = ('recipient', 'post_id')
+
+    def __str__(self) -> str:
+        return f'{self.recipient_id}: {self.post_id}'
+
+
+class Trend(models.Model):
+    """Популярность поста или группы с экспоненциальным затуханием.
+
+    ``rank`` — натуральный логарифм суммы весов событий, каждый из
+    которых умножен на ``exp(λ·(t − EPOCH))`` (см. posts.trending).
+    Затухают все записи одинаково, поэтому порядок по ``rank`` и есть
+    порядок по текущей популярности, и пересчитывать его не нужно.
+    """
+
+    POST = 'post'
+    GROUP = 'group'
+    KIND_CHOICES = ((POST, 'Пост'), (GROUP, 'Группа'))
+
+    kind = models.CharField(max_length=5, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    rank = models.FloatField()
+
+    class Meta:
+        unique_together = ('kind', 'object_id')
+        indexes = [
+            models.Index(fields=['kind', '-rank'],
+                         name='posts_trend_rank_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.get_kind_display()} {self.object_id}'
+
+
+class PostFingerprint(models.Model):
+    """SimHash текста поста для поиска почти дубликатов.
+
+    Отпечаток разбит на четыре 16-битные полосы с индексом на каждой
+    (см. posts.duplicates). Пост может лежать в другом шарде, поэтому
+    вместо внешнего ключа — id поста.
+    """
+
+    post_id = models.BigIntegerField(unique=True)
+    simhash = models.BigIntegerField()
+    band0 = models.PositiveIntegerField(db_index=True)
+    band1 = models.PositiveIntegerField(db_index=True)
+    band2 = models.PositiveIntegerField(db_index=True)
+    band3 = models.PositiveIntegerField(db_index=True)
+    duplicate_of = models.BigIntegerField(
+        'Похож на пост', null=True, blank=True
+    )
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Отпечаток поста'
+        verbose_name_plural = 'Отпечатки постов'
+
+    def __str__(self) -> str:
+        return f'{self.post_id}: {self.simhash:x}'
+
+
+class DeletionJob(models.Model):
+    """Фоновое удаление пользователя или поста со всем, что от них зависит.
+
+    Объект сразу скрывается, а зависимые строки удаляются небольшими
+    транзакциями (см. posts.deletion), чтобы не держать блокировку базы.
+    """
+
+    USER = 'user'
+    POST = 'post'
+    KIND_CHOICES = ((USER, 'Пользователь'), (POST, 'Пост'))
+    RUNNING = 'running'
+    DONE = 'done'
+    STATUS_CHOICES = ((RUNNING, 'Идёт'), (DONE, 'Завершено'))
+
+    kind = models.CharField('Что удаляем', max_length=4,
+                            choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    label = models.CharField('Объект', max_length=200)
+    status = models.CharField('Статус', max_length=10,
+                              choices=STATUS_CHOICES, default=RUNNING)
+    total = models.PositiveIntegerField('Строк к удалению', default=0)
+    deleted = models.PositiveIntegerField('Удалено строк', default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Удаление'
+        verbose_name_plural = 'Удаления'
+
+    def __str__(self) -> str:
+        return f'{self.get_kind_display()} {self.label}'
+
+    @property
+    def progress(self):
+        if not self.total:
+            return 100 if self.status == self.DONE else 0
+        return min(100, self.deleted * 100 // self.total)
@@ -0,0 +1,128 @@
+"""Уведомления о новых постах авторов, на которых подписан пользователь.
+
+Рассылка идёт фоновой задачей пачками по FANOUT_BATCH подписчиков:
+каждая пачка — один ``bulk_create`` в своей короткой транзакции, так
+что автор с тысячами подписчиков не держит блокировку базы. Число
+непрочитанных для шапки хранится в кеше и сбрасывается при рассылке и
+прочтении.
+"""
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from core.tasks import task
+
+from .models import Follow, Notification, Post
+from .sharding import get_post
+
+FANOUT_BATCH = 500
+UNREAD_KEY = 'notifications:unread:{}'
+# Рассылка сбрасывает число в общем кеше; срок жизни страхует от
+# кеша, которого не видит процесс рассылки.
+UNREAD_TIMEOUT = 60
+# Прочитанные уведомления хранятся столько дней.
+RETENTION_DAYS = 30
+# Больше стольких уведомлений на пользователя не храним.
+MAX_PER_USER = 200
+TRIM_BATCH = 500
+EXCERPT_LENGTH = 200
+
+
+def unread_count(user_id):
+    key = UNREAD_KEY.format(user_id)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(
+            recipient_id=user_id, is_read=False
+        ).count()
+        cache.set(key, count, UNREAD_TIMEOUT)
+    return count
+
+
+def _forget_unread(user_ids):
+    cache.delete_many([UNREAD_KEY.format(user_id) for user_id in user_ids])
+
+
+@task(max_retries=3)
+def notify_followers(post_id, after_user_id=0):
+    """Рассылает уведомление о посте подписчикам автора пачками.
+
+    Каждая пачка ставит задачу на следующую, поэтому повтор после сбоя
+    начинает с недоставленной пачки, а не сначала.
+    """
+    try:
+        post = get_post(Post, post_id)
+    except Post.DoesNotExist:
+        return
+    user_ids = list(Follow.objects.filter(
+        author_id=post.author_id, user_id__gt=after_user_id
+    ).order_by('user_id').values_list('user_id', flat=True)[:FANOUT_BATCH])
+    if not user_ids:
+        return
+    excerpt = (post.excerpt or post.text)[:EXCERPT_LENGTH]
+    with transaction.atomic():
+        Notification.objects.bulk_create((
+            Notification(recipient_id=user_id, author_id=post.author_id,
+                         post_id=post.pk, excerpt=excerpt)
+            for user_id in user_ids
+        ), ignore_conflicts=True)
+        if len(user_ids) == FANOUT_BATCH:
+            notify_followers.delay(post_id, user_ids[-1])
+    _forget_unread(user_ids)
+
+
+def mark_read(user_id, up_to=None):
+    """Отмечает прочитанными уведомления с id не больше up_to."""
+    unread = Notification.objects.filter(recipient_id=user_id,
+                                         is_read=False)
+    if up_to is not None:
+        unread = unread.filter(pk__lte=up_to)
+    updated = unread.update(is_read=True)
+    _forget_unread([user_id])
+    return updated
+
+
+def forget_posts(post_ids):
+    """Удаляет уведомления об удалённых постах."""
+    notifications = Notification.objects.filter(post_id__in=post_ids)
+    user_ids = set(notifications.filter(is_read=False).values_list(
+        'recipient_id', flat=True
+    ))
+    notifications.delete()
+    _forget_unread(user_ids)
+
+
+def _delete_batches(queryset):
+    deleted = 0
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:TRIM_BATCH])
+        if not pks:
+            return deleted
+        with transaction.atomic():
+            deleted += Notification.objects.filter(
+                pk__in=pks
+            )._raw_delete(Notification.objects.db)
+
+
+def trim(now=None):
+    """Удаляет старые прочитанные и лишние уведомления пачками."""
+    now = now or timezone.now()
+    deleted = _delete_batches(Notification.objects.filter(
+        is_read=True, created__lt=now - timedelta(days=RETENTION_DAYS)
+    ))
+    crowded = list(Notification.objects.values('recipient_id').annotate(
+        total=Count('pk')
+    ).filter(total__gt=MAX_PER_USER).values_list('recipient_id', flat=True))
+    for user_id in crowded:
+        newest = Notification.objects.filter(
+            recipient_id=user_id
+        ).order_by('-pk').values_list('pk', flat=True)
+        boundary = newest[MAX_PER_USER - 1]
+        deleted += _delete_batches(Notification.objects.filter(
+            recipient_id=user_id, pk__lt=boundary
+        ))
+        _forget_unread([user_id])
+    return deleted
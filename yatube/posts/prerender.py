@@ -0,0 +1,216 @@
+"""Готовые HTML-файлы публичных страниц для отдачи веб-сервером.
+
+Страницы рендерятся так, как их видит аноним, и кладутся в
+``PRERENDER_ROOT``: первая страница списка — в ``<путь>/index.html``,
+следующие — в ``<путь>/page-<N>.html``. Пример для nginx::
+
+    location / {
+        if ($cookie_sessionid) { proxy_pass http://django; }
+        try_files /prerendered$uri/page-$arg_page.html
+                  /prerendered$uri/index.html @django;
+    }
+
+Изменения постов, комментариев и подписок складываются в файл-очередь,
+из которой затронутые страницы перерисовывает ``prerender --watch``.
+"""
+import math
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.test import RequestFactory
+from django.urls import reverse
+
+from core.cache import bypass
+
+from .models import Comment, Follow, Group, Post, User
+from .sharding import on_shards
+
+# Заголовок запросов пререндера: такие просмотры не засчитываются.
+PRERENDER_HEADER = 'HTTP_X_YATUBE_PRERENDER'
+SPOOL_NAME = '.dirty'
+
+_handler = None
+
+
+def spool_path():
+    return os.path.join(settings.PRERENDER_ROOT, SPOOL_NAME)
+
+
+def page_filename(page):
+    return 'index.html' if page == 1 else f'page-{page}.html'
+
+
+def output_dir(path):
+    return os.path.join(settings.PRERENDER_ROOT, *path.strip('/').split('/'))
+
+
+def resolve(key):
+    """Ключ страницы -> (URL, посты списка или None для поста)."""
+    kind, _, arg = key.partition(':')
+    if kind == 'index':
+        return reverse('posts:index'), Post.objects.all()
+    # Группы и авторы лежат в default: join из шарда невозможен.
+    if kind == 'group':
+        group_id = Group.objects.filter(slug=arg).values_list(
+            'pk', flat=True
+        ).first()
+        return (reverse('posts:group_posts', kwargs={'slug': arg}),
+                Post.objects.filter(group_id=group_id))
+    if kind == 'profile':
+        author_id = User.objects.filter(username=arg).values_list(
+            'pk', flat=True
+        ).first()
+        return (reverse('posts:profile', kwargs={'username': arg}),
+                Post.objects.filter(author_id=author_id))
+    if kind == 'post':
+        return reverse('posts:post_detail', kwargs={'post_id': arg}), None
+    raise ValueError(f'Unknown prerender key: {key}')
+
+
+def all_keys():
+    yield 'index'
+    yield from (f'group:{slug}' for slug in
+                Group.objects.values_list('slug', flat=True).iterator())
+    yield from (f'profile:{username}' for username in
+                User.objects.values_list('username', flat=True).iterator())
+    for posts in on_shards(Post.objects.all()):
+        yield from (f'post:{pk}' for pk in
+                    posts.values_list('pk', flat=True).iterator())
+
+
+def _write(path, content):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Веб-сервер не должен увидеть недописанный файл.
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as file:
+        file.write(content)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+
+def _remove_pages(directory, keep):
+    if not os.path.isdir(directory):
+        return
+    for filename in os.listdir(directory):
+        if (filename.endswith('.html') and filename not in keep
+                and (filename == 'index.html'
+                     or filename.startswith('page-'))):
+            os.remove(os.path.join(directory, filename))
+
+
+def render_key(key):
+    """Перерисовывает файлы одной страницы, возвращает их количество.
+
+    Кеши запросов и фрагментов не читаются: ``prerender --watch``
+    перерисовывает страницу сразу после записи, и кеш мог ещё не
+    сброситься.
+    """
+    with bypass():
+        return _render_key(key)
+
+
+def _render_key(key):
+    from .views import NUMBERS_OF_POST
+
+    global _handler
+    if _handler is None:
+        _handler = WSGIHandler()
+    path, posts = resolve(key)
+    pages = 1
+    if posts is not None:
+        total = sum(queryset.order_by().count()
+                    for queryset in on_shards(posts))
+        pages = min(settings.PRERENDER_PAGES, max(1, math.ceil(
+            total / NUMBERS_OF_POST
+        )))
+    directory = output_dir(path)
+    factory = RequestFactory()
+    written = []
+    for page in range(1, pages + 1):
+        response = _handler.get_response(factory.get(
+            path, {'page': page} if page > 1 else {},
+            REMOTE_ADDR='', **{PRERENDER_HEADER: '1'}
+        ))
+        if response.status_code != 200:
+            break
+        filename = page_filename(page)
+        content = (b''.join(response.streaming_content)
+                   if response.streaming else response.content)
+        _write(os.path.join(directory, filename), content)
+        written.append(filename)
+    _remove_pages(directory, written)
+    return len(written)
+
+
+def mark_dirty(*keys):
+    """Ставит страницы в очередь на перерисовку после фиксации."""
+    keys = [key for key in keys if key]
+
+    def spool():
+        os.makedirs(settings.PRERENDER_ROOT, exist_ok=True)
+        # Короткая дозапись в режиме O_APPEND не перемешивается с чужой.
+        with open(spool_path(), 'a') as file:
+            file.write(''.join(f'{key}\n' for key in keys))
+
+    if keys:
+        transaction.on_commit(spool)
+
+
+def take_dirty():
+    """Забирает накопленную очередь: (ключи, файл для удаления)."""
+    work_path = spool_path() + '.work'
+    # Оставшийся после сбоя .work доделываем раньше новой очереди.
+    if not os.path.exists(work_path):
+        try:
+            os.replace(spool_path(), work_path)
+        except FileNotFoundError:
+            return [], None
+    with open(work_path) as file:
+        keys = dict.fromkeys(line.strip() for line in file)
+    keys.pop('', None)
+    return list(keys), work_path
+
+
+def post_keys(post, group_ids=()):
+    group_ids = {post.group_id, *group_ids} - {None}
+    slugs = Group.objects.filter(pk__in=group_ids).values_list(
+        'slug', flat=True
+    )
+    return ['index', f'post:{post.pk}', f'profile:{post.author.username}',
+            *(f'group:{slug}' for slug in slugs)]
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_group(sender, instance, **kwargs):
+    if settings.PRERENDER_ENABLED and instance.pk:
+        instance._prerender_old_group_id = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_changed(sender, instance, **kwargs):
+    if settings.PRERENDER_ENABLED:
+        old_group_id = getattr(instance, '_prerender_old_group_id', None)
+        mark_dirty(*post_keys(instance, [old_group_id]))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    if settings.PRERENDER_ENABLED:
+        mark_dirty(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_changed(sender, instance, **kwargs):
+    if settings.PRERENDER_ENABLED:
+        mark_dirty(f'profile:{instance.author.username}')
@@ -0,0 +1,399 @@
+"""Шардирование постов и комментариев по автору.
+
+Посты автора (и комментарии к ним) живут в одной из баз ``POST_SHARDS``,
+выбранной по хешу ``author_id``. Пользователи, группы, подписки и всё
+остальное остаются в ``default``. Пока в ``POST_SHARDS`` одна база,
+роутер ничего не делает и запросы идут как раньше.
+
+Идентификаторы постов и комментариев в шардах глобально уникальны:
+в них зашиты время, номер процесса, номер шарда и счётчик процесса,
+поэтому ``/posts/<id>/`` находит шард без обращения к другим базам.
+Номер процесса выдаёт таблица IdWorker при первом id после запуска
+или fork, так что одинаковый счётчик у воркеров, унаследованный от
+мастера (gunicorn ``--preload``), не даёт одинаковых id.
+
+Подключение новой базы:
+
+1. ``manage.py rebalance_shards --pin`` — закрепить авторов за текущими
+   шардами;
+2. добавить базу в ``DATABASES`` и ``POST_SHARDS``, выполнить
+   ``manage.py migrate --database=<alias>``;
+3. ``manage.py rebalance_shards`` — перенести авторов, чей хеш теперь
+   указывает на другую базу.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import checks
+from django.core.cache import cache
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404
+
+from core.paginator import MergedSequence
+from core.querycache import cached_get, invalidate
+
+SHARDED_MODELS = {'post', 'comment', 'archivedpost', 'archivedcomment'}
+PIN_KEY = 'shard_pin:{}'
+PIN_TIMEOUT = 300
+MOVE_BATCH_SIZE = 500
+# Раскладка id (63 бита): миллисекунды с EPOCH_MS | номер процесса |
+# номер шарда | счётчик. На миллисекунды остаётся 41 бит — 69 лет.
+EPOCH_MS = 1600000000000
+WORKER_BITS = 8
+SHARD_BITS = 6
+SEQUENCE_BITS = 8
+# Меньшие id выданы базой до шардирования и лежат в первом шарде.
+MIN_SHARDED_ID = 1 << (WORKER_BITS + SHARD_BITS + SEQUENCE_BITS)
+
+_worker = {'pid': None, 'id': 0, 'millis': 0, 'sequence': 0}
+_worker_lock = threading.Lock()
+
+
+def shards():
+    return settings.POST_SHARDS
+
+
+def is_sharded():
+    return len(settings.POST_SHARDS) > 1
+
+
+def is_sharded_model(model):
+    return (model._meta.app_label == 'posts'
+            and model._meta.model_name in SHARDED_MODELS)
+
+
+def hashed_shard(author_id):
+    # hash() в Python зависит от процесса, md5 — нет.
+    digest = hashlib.md5(str(author_id).encode()).digest()
+    aliases = shards()
+    return aliases[int.from_bytes(digest[:4], 'big') % len(aliases)]
+
+
+def shard_for(author_id):
+    """База с постами автора: закрепление или хеш."""
+    if not is_sharded():
+        return shards()[0]
+    from .models import AuthorShard
+
+    key = PIN_KEY.format(author_id)
+    alias = cache.get(key)
+    if alias is None:
+        alias = AuthorShard.objects.filter(
+            author_id=author_id
+        ).values_list('alias', flat=True).first() or ''
+        cache.set(key, alias, PIN_TIMEOUT)
+    return alias or hashed_shard(author_id)
+
+
+def _next_worker_slot():
+    """(номер процесса, миллисекунда, счётчик) для очередного id."""
+    pid = os.getpid()
+    with _worker_lock:
+        if _worker['pid'] != pid:
+            from .models import IdWorker
+
+            # AUTOINCREMENT не выдаёт один номер дважды, даже после отката.
+            row = IdWorker.objects.create(pid=pid)
+            _worker.update(pid=pid, id=row.pk % (1 << WORKER_BITS),
+                           millis=0, sequence=0)
+        millis = int(time.time() * 1000) - EPOCH_MS
+        if millis > _worker['millis']:
+            _worker['millis'], _worker['sequence'] = millis, 0
+        else:
+            _worker['sequence'] += 1
+            if _worker['sequence'] >> SEQUENCE_BITS:
+                # Счётчик миллисекунды исчерпан: берём следующую.
+                _worker['millis'] += 1
+                _worker['sequence'] = 0
+        return _worker['id'], _worker['millis'], _worker['sequence']
+
+
+def next_id(alias):
+    worker, millis, sequence = _next_worker_slot()
+    shard_index = shards().index(alias)
+    return ((millis << (WORKER_BITS + SHARD_BITS + SEQUENCE_BITS))
+            | (worker << (SHARD_BITS + SEQUENCE_BITS))
+            | (shard_index << SEQUENCE_BITS) | sequence)
+
+
+def shard_of_id(pk):
+    """Шард, в котором запись была создана."""
+    if pk < MIN_SHARDED_ID:
+        return shards()[0]
+    index = (pk >> SEQUENCE_BITS) & ((1 << SHARD_BITS) - 1)
+    aliases = shards()
+    return aliases[index] if index < len(aliases) else aliases[0]
+
+
+def _instance_shard(instance):
+    # У новой записи _state.db мог проставить Django при присваивании
+    # внешнего ключа (например, группы из default) — ему не верим.
+    if not instance._state.adding and instance._state.db is not None:
+        return instance._state.db
+    if hasattr(instance, 'post_id'):
+        post = instance._meta.get_field('post').get_cached_value(
+            instance, None
+        )
+        if post is not None and post._state.db is not None:
+            return post._state.db
+        return shard_of_id(instance.post_id)
+    return shard_for(instance.author_id)
+
+
+def assign_id(instance, save_kwargs):
+    """Выдаёт новой записи глобально уникальный id до вставки."""
+    if not is_sharded() or instance.pk is not None:
+        return
+    alias = _instance_shard(instance)
+    instance.pk = next_id(alias)
+    # Без этого Django сначала попробует UPDATE по новому id.
+    save_kwargs['force_insert'] = True
+    # Менеджер (``objects.create``) передаёт using='default' сам — но id
+    # уже указывает на шард автора, и запись должна лежать там же.
+    save_kwargs['using'] = alias
+
+
+class ShardRouter:
+    """Направляет посты и комментарии в шард автора, остальное — в default.
+
+    Запросы без подсказки (``Post.objects.filter(...)``) роутер сам не
+    раскидывает: для них есть ``for_author``, ``scatter`` и ``get_post``.
+    """
+
+    def _route(self, model, hints):
+        if not is_sharded():
+            return None
+        if not is_sharded_model(model):
+            return 'default'
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        # request.user — ленивый объект, type() его не раскроет.
+        if is_sharded_model(instance.__class__):
+            return _instance_shard(instance)
+        if isinstance(instance, get_user_model()):
+            return shard_for(instance.pk)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if is_sharded():
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == 'default' or db not in shards():
+            return None
+        return app_label == 'posts' and model_name in SHARDED_MODELS
+
+
+@checks.register()
+def check_sharded_admin(app_configs, **kwargs):
+    if not is_sharded():
+        return []
+    return [checks.Warning(
+        'Админка показывает посты и комментарии только из первого шарда.',
+        hint=('Посты из других шардов правьте на сайте или в shell через '
+              '.using(shard_of_id(pk)).'),
+        id='posts.W001',
+    )]
+
+
+@receiver(connection_created)
+def disable_cross_shard_constraints(sender, connection, **kwargs):
+    # Внешние ключи шарда указывают на таблицы default, которых в этой
+    # базе нет; целостность между базами держит приложение. Проверку
+    # ключей после каждой миграции тоже отключаем: иначе миграция шарда
+    # с постами падает на авторах, которых в нём нет.
+    if (connection.alias != 'default' and connection.alias in shards()
+            and connection.vendor == 'sqlite'):
+        connection.cursor().execute('PRAGMA foreign_keys = OFF')
+        connection.check_constraints = lambda table_names=None: None
+
+
+def for_author(queryset, author_id):
+    """Запрос к шарду автора."""
+    if not is_sharded():
+        return queryset
+    return queryset.using(shard_for(author_id))
+
+
+def on_shards(queryset):
+    """Тот же запрос в каждом шарде; для моделей вне шардов — он сам."""
+    if not is_sharded() or not is_sharded_model(queryset.model):
+        return [queryset]
+    return [queryset.using(alias) for alias in shards()]
+
+
+def feed_key(post):
+    return post.pub_date, post.pk
+
+
+def scatter(queryset):
+    """Лента по всем шардам, слитая по (pub_date, pk) по убыванию."""
+    if not is_sharded():
+        return queryset
+    queryset = queryset.order_by('-pub_date', '-pk')
+    return MergedSequence(
+        [queryset.using(alias) for alias in shards()], key=feed_key
+    )
+
+
+def followed_posts(queryset, user):
+    """Посты авторов, на которых подписан user."""
+    from .models import Follow
+
+    if not is_sharded():
+        return queryset.filter(author__following__user=user)
+    by_shard = defaultdict(list)
+    for author_id in Follow.objects.filter(user=user).values_list(
+            'author_id', flat=True):
+        by_shard[shard_for(author_id)].append(author_id)
+    queryset = queryset.order_by('-pub_date', '-pk')
+    return MergedSequence(
+        [queryset.using(alias).filter(author_id__in=author_ids)
+         for alias, author_ids in by_shard.items()] or [queryset.none()],
+        key=feed_key,
+    )
+
+
+def get_post(model, pk):
+    """Пост по id: сначала из шарда, где он создан, потом из остальных."""
+    if not is_sharded():
+        return cached_get(model, pk=pk)
+    first = shard_of_id(pk)
+    for alias in [first] + [a for a in shards() if a != first]:
+        try:
+            return cached_get(model.objects.using(alias), pk=pk)
+        except model.DoesNotExist:
+            continue
+    raise model.DoesNotExist(
+        f'{model._meta.object_name} matching query does not exist.'
+    )
+
+
+def get_post_or_404(model, pk):
+    try:
+        return get_post(model, pk)
+    except model.DoesNotExist:
+        raise Http404(f'No {model._meta.object_name} matches the given query.')
+
+
+def visible_comments(post):
+    """Комментарии поста без удаляемых авторов."""
+    comments = post.comments.order_by('-created')
+    if not is_sharded():
+        return comments.filter(author__is_active=True).select_related(
+            'author'
+        )
+    # В шарде нет таблицы пользователей, join невозможен.
+    inactive = list(get_user_model().objects.filter(
+        is_active=False
+    ).values_list('pk', flat=True))
+    return comments.exclude(author_id__in=inactive).prefetch_related(
+        'author'
+    )
+
+
+def _author_rows(alias, author_id):
+    """Строки автора в шарде: родители раньше детей."""
+    from .models import ArchivedComment, ArchivedPost, Comment, Post
+
+    return [
+        Post._base_manager.using(alias).filter(author_id=author_id),
+        Comment._base_manager.using(alias).filter(
+            post__author_id=author_id
+        ),
+        ArchivedPost._base_manager.using(alias).filter(author_id=author_id),
+        ArchivedComment._base_manager.using(alias).filter(
+            post__author_id=author_id
+        ),
+    ]
+
+
+def _existing(manager, pks):
+    # Подзапрос между базами невозможен, сверяем списки id.
+    found = []
+    for start in range(0, len(pks), MOVE_BATCH_SIZE):
+        found += manager.filter(
+            pk__in=pks[start:start + MOVE_BATCH_SIZE]
+        ).values_list('pk', flat=True)
+    return found
+
+
+def _copy_missing(source, target, author_id, batch_size):
+    copied = 0
+    for queryset in _author_rows(source, author_id):
+        model = queryset.model
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True))
+        present = set(_existing(model._base_manager.using(target), pks))
+        pks = [pk for pk in pks if pk not in present]
+        for start in range(0, len(pks), batch_size):
+            rows = list(model._base_manager.using(source).filter(
+                pk__in=pks[start:start + batch_size]
+            ))
+            # id сохраняются: по ним строки находятся после переноса.
+            model._base_manager.using(target).bulk_create(rows)
+            copied += len(rows)
+    return copied
+
+
+def move_author(author_id, target, batch_size=MOVE_BATCH_SIZE):
+    """Переносит посты и комментарии автора в шард target.
+
+    Сначала строки копируются, затем закрепление переключается на
+    target, и дописываются строки, созданные в старом шарде за время
+    копирования. Правки уже скопированных строк в этом окне теряются,
+    поэтому переносить лучше в тихие часы. Из старого шарда строки
+    удаляются без сигналов: картинки остаются на месте и по-прежнему
+    нужны.
+    """
+    from .models import (ArchivedComment, ArchivedPost, AuthorShard,
+                         Comment, Post)
+
+    source = shard_for(author_id)
+    if source == target:
+        return 0
+    moved = _copy_missing(source, target, author_id, batch_size)
+    AuthorShard.objects.update_or_create(
+        author_id=author_id, defaults={'alias': target}
+    )
+    cache.delete(PIN_KEY.format(author_id))
+    moved += _copy_missing(source, target, author_id, batch_size)
+    with transaction.atomic(using=source):
+        # Дети раньше родителей: в default внешние ключи проверяются.
+        for queryset in reversed(_author_rows(source, author_id)):
+            queryset._raw_delete(source)
+    invalidate(Post, Comment, ArchivedPost, ArchivedComment)
+    return moved
+
+
+def pin_authors():
+    """Закрепляет всех авторов за шардами, где лежат их посты."""
+    from .models import ArchivedPost, AuthorShard, Post
+
+    pinned = set(AuthorShard.objects.values_list('author_id', flat=True))
+    pins = []
+    for alias in shards():
+        for model in (Post, ArchivedPost):
+            for author_id in model._base_manager.using(alias).values_list(
+                    'author_id', flat=True).distinct():
+                if author_id not in pinned:
+                    pinned.add(author_id)
+                    pins.append(AuthorShard(author_id=author_id,
+                                            alias=alias))
+    AuthorShard.objects.bulk_create(pins)
+    cache.delete_many([PIN_KEY.format(pin.author_id) for pin in pins])
+    return len(pins)
@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import ArchivedPost, ImageBlob, Post
+
+
+@receiver(post_delete, sender=Post)
+def release_post_image(sender, instance, **kwargs):
+    if instance.image:
+        ImageBlob.release(instance.image.name)
+
+
+@receiver(post_delete, sender=ArchivedPost)
+def release_archived_post_image(sender, instance, **kwargs):
+    if instance.image:
+        ImageBlob.release(instance.image.name)
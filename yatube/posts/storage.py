@@ -0,0 +1,59 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранит каждый файл один раз под его sha256.
+
+    Файл хешируется в том же проходе, в котором пишется на диск, и
+    переименовывается в ``<каталог>/ab/cd/<sha256><расширение>``. Если
+    такой файл уже есть, новая копия удаляется, а у старой обновляется
+время изменения: для gc_media файл снова «свежий» и не удалится, пока
+на него не успела появиться ссылка. Одинаковые
+    картинки получают одно имя, поэтому sorl переиспользует и их
+    миниатюры. Учёт ссылок — в posts.models.ImageBlob.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        directory = posixpath.dirname(name)
+        extension = posixpath.splitext(name)[1].lower()
+        os.makedirs(self.path(directory), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(
+            dir=self.path(directory), suffix='.part'
+        )
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+            digest = digest.hexdigest()
+            name = posixpath.join(
+                directory, digest[:2], digest[2:4], digest + extension
+            )
+            full_path = self.path(name)
+            try:
+                os.utime(full_path)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                os.replace(temp_path, full_path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+            else:
+                os.remove(temp_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
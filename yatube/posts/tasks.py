@@ -0,0 +1,54 @@
+from sorl.thumbnail import get_thumbnail
+
+from core.paginator import refresh_count
+from core.querycache import invalidate
+from core.tasks import LOW, task
+
+from .images import THUMBNAIL_GEOMETRY, THUMBNAIL_OPTIONS
+from .models import Post
+from .sharding import for_author, get_post, on_shards
+
+
+@task(max_retries=2)
+def generate_thumbnails(post_id):
+    """Готовит миниатюру заранее, чтобы её не строил первый читатель."""
+    try:
+        post = get_post(Post, post_id)
+    except Post.DoesNotExist:
+        return
+    if not post.image:
+        return
+    # Те же параметры, что у тега post_thumbnail.
+    thumbnail = get_thumbnail(post.image, THUMBNAIL_GEOMETRY,
+                              **THUMBNAIL_OPTIONS)
+    if not thumbnail.exists():
+        # Исходника нет: sorl вернул имя, но файла не построил.
+        return
+    # Пока строили, картинку могли заменить: тогда миниатюра не её.
+    Post.objects.using(post._state.db).filter(
+        pk=post_id, image=post.image.name
+    ).update(thumbnail=thumbnail.name)
+    invalidate(Post)
+
+
+@task(priority=LOW)
+def refresh_feed_counts(author_id, group_id=None):
+    """Пересчитывает счётчики лент, в которые попал пост.
+
+    Запросы повторяют те, что строят представления (index, profile,
+    group_posts), вплоть до шарда: ключ кеша — это хеш их SQL вместе
+    с базой. Кеш общий для процессов, поэтому пересчёт в исполнителе
+    виден веб-воркерам.
+    """
+    querysets = [
+        *on_shards(Post.objects.defer('text')),
+        for_author(Post.objects, author_id).filter(
+            author_id=author_id
+        ).defer('text'),
+    ]
+    if group_id is not None:
+        querysets += on_shards(
+            Post.objects.filter(group_id=group_id).defer('text')
+        )
+    for queryset in querysets:
+        refresh_count(queryset)
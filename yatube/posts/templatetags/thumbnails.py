@@ -0,0 +1,38 @@
+import logging
+
+from django import template
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import settings as thumbnail_settings
+
+from posts.images import THUMBNAIL_GEOMETRY, THUMBNAIL_OPTIONS, thumbnail_size
+
+logger = logging.getLogger(__name__)
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(post):
+    """Миниатюра картинки поста: url, width и height.
+
+    Когда задача generate_thumbnails построила миниатюру, её имя лежит
+    в посте, а размеры считаются по сохранённым размерам оригинала:
+    отрисовка не ходит ни в KV, ни в хранилище. До этого — обычный путь
+    sorl; если он падает, картинка, как и в теге {% thumbnail %}, просто
+    не выводится.
+    """
+    if post.thumbnail and post.image_width and post.image_height:
+        width, height = thumbnail_size(post.image_width, post.image_height)
+        return {
+            'url': default.storage.url(post.thumbnail),
+            'width': width,
+            'height': height,
+        }
+    try:
+        return get_thumbnail(post.image, THUMBNAIL_GEOMETRY,
+                             **THUMBNAIL_OPTIONS)
+    except Exception:
+        if thumbnail_settings.THUMBNAIL_DEBUG:
+            raise
+        logger.exception('Не удалось построить миниатюру %s', post.image)
+        return None
@@ -0,0 +1,17 @@
+from django import template
+
+from posts.trending import trending_groups, trending_posts
+
+register = template.Library()
+
+SIDEBAR_POSTS = 5
+SIDEBAR_GROUPS = 5
+
+
+@register.inclusion_tag('posts/includes/trending.html')
+def trending_sidebar():
+    """Врезка «В тренде»: первые строки рейтинга, без пересчёта."""
+    return {
+        'trending_posts': trending_posts(SIDEBAR_POSTS),
+        'trending_groups': trending_groups(SIDEBAR_GROUPS),
+    }
@@ -0,0 +1,83 @@
+from django.contrib.auth.models import Permission
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.paginator import EstimatedCountPaginator
+
+from ..models import Group, Post, User
+
+
+class PostAdminTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@yatube.ru', password='pass'
+        )
+        cls.group = Group.objects.create(
+            title='Название группы',
+            description='Тестовое описание',
+            slug='test-slug'
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:posts_post_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        """Число запросов списка постов не зависит от числа строк."""
+        Post.objects.create(author=self.admin, group=self.group, text='1')
+        few = self.changelist_queries()
+        for number in range(20):
+            Post.objects.create(
+                author=self.admin, group=self.group, text=str(number)
+            )
+        self.assertEqual(self.changelist_queries(), few)
+
+    def test_delete_needs_permission_on_cascaded_models(self):
+        """Без права удалять комментарии пост через админку не удалить."""
+        post = Post.objects.create(author=self.admin, text='Пост')
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        staff.user_permissions.set(Permission.objects.filter(
+            codename__in=['view_post', 'change_post', 'delete_post']
+        ))
+        self.client.force_login(staff)
+        url = reverse('admin:posts_post_delete', args=[post.pk])
+        response = self.client.get(url)
+        self.assertContains(response, 'comment')
+        response = self.client.post(url, {'post': 'yes'})
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(Post.objects.filter(pk=post.pk).exists())
+
+    def test_estimated_count_skips_full_count(self):
+        for number in range(5):
+            Post.objects.create(author=self.admin, text=str(number))
+        paginator = EstimatedCountPaginator(
+            Post.all_objects.order_by('-pk'), 2
+        )
+        paginator.exact_count_limit = 3
+        self.assertGreaterEqual(paginator.count, 5)
+        filtered = EstimatedCountPaginator(
+            Post.objects.filter(author=self.admin).order_by('-pk'), 2
+        )
+        filtered.exact_count_limit = 3
+        self.assertEqual(filtered.count, 3)
+
+    def test_sparse_ids_fall_back_to_capped_count(self):
+        """Id из шардов (порядка 2**62) не выдаются за число строк."""
+        for number in range(5):
+            Post.objects.create(author=self.admin, text=str(number))
+        Post.objects.create(pk=2 ** 62, author=self.admin, text='шард')
+        paginator = EstimatedCountPaginator(
+            Post.all_objects.order_by('-pk'), 2
+        )
+        paginator.exact_count_limit = 3
+        self.assertEqual(paginator.count, 3)
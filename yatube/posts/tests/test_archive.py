@@ -0,0 +1,80 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import (ArchivedComment, ArchivedPost, Comment, ImageBlob,
+                      Post, User)
+from .test_storage import SMALL_GIF
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ArchiveTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.old = Post(author=self.user, text='Старый пост')
+        self.old.image.save('old.gif', ContentFile(SMALL_GIF), save=False)
+        self.old.save()
+        Comment.objects.create(post=self.old, author=self.user, text='Ответ')
+        for number in range(11):
+            Post.objects.create(author=self.user, text=f'Новый {number}')
+        Post.objects.filter(pk=self.old.pk).update(
+            pub_date=timezone.now() - timedelta(days=400)
+        )
+        call_command('archive_posts', days=365, pause=0, stdout=StringIO())
+
+    def test_old_post_moved_with_comments(self):
+        """Старый пост и его комментарии переехали в архив."""
+        self.assertFalse(Post.all_objects.filter(pk=self.old.pk).exists())
+        archived = ArchivedPost.objects.get(pk=self.old.pk)
+        self.assertEqual(archived.text, 'Старый пост')
+        self.assertEqual(archived.image.name, self.old.image.name)
+        self.assertEqual(ArchivedComment.objects.get().post, archived)
+        self.assertEqual(
+            ImageBlob.objects.get(name=self.old.image.name).refcount, 1
+        )
+
+    def test_feeds_scan_only_hot_posts(self):
+        """Главная лента архив не читает."""
+        response = self.client.get(reverse('posts:index') + '?page=2')
+        self.assertNotIn(self.old.pk,
+                         [post.pk for post in response.context['page_obj']])
+
+    def test_detail_and_profile_fall_through_to_archive(self):
+        """Страница поста и профиль находят архивный пост."""
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.old.pk})
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['archived'])
+        self.assertEqual(len(response.context['comments']), 1)
+        self.assertEqual(response.context['post_count'], 12)
+
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'auth'}) + '?page=2'
+        )
+        self.assertEqual(response.context['post_count'], 12)
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            [Post.objects.order_by('pub_date').first().pk, self.old.pk]
+        )
@@ -0,0 +1,58 @@
+import threading
+from unittest import mock
+
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..counters import ViewCounter
+from ..models import Post, User
+
+
+class ViewCounterTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Первый пост')
+        cls.other_post = Post.objects.create(
+            author=cls.user, text='Второй пост'
+        )
+
+    def test_increments_are_buffered(self):
+        """Просмотры копятся в памяти без запросов к базе."""
+        counter = ViewCounter()
+        with self.assertNumQueries(0):
+            counter.increment(self.post.pk)
+            counter.increment(self.post.pk)
+        self.assertEqual(counter.pending(self.post.pk), 2)
+
+    def test_flush_is_single_update(self):
+        """Накопленные просмотры записываются одним UPDATE."""
+        counter = ViewCounter()
+        for _ in range(3):
+            counter.increment(self.post.pk)
+        counter.increment(self.other_post.pk)
+        with self.assertNumQueries(1):
+            counter.flush()
+        self.post.refresh_from_db()
+        self.other_post.refresh_from_db()
+        self.assertEqual(self.post.views, 3)
+        self.assertEqual(self.other_post.views, 1)
+        self.assertEqual(counter.pending(self.post.pk), 0)
+
+    @override_settings(VIEW_FLUSH_THREAD=True)
+    def test_idle_views_flushed_by_thread(self):
+        """Фоновый поток сбрасывает просмотры без новых запросов."""
+        counter = ViewCounter(interval=0.05)
+        written = threading.Event()
+        with mock.patch.object(counter, 'write',
+                               side_effect=lambda pending: written.set()):
+            counter.increment(self.post.pk)
+            self.assertTrue(written.wait(5))
+        self.assertEqual(counter.pending(self.post.pk), 0)
+
+    def test_post_detail_shows_views(self):
+        response = Client().get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        self.assertGreaterEqual(response.context['views'], 1)
@@ -0,0 +1,106 @@
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from core.tasks import run_pending
+
+from .. import deletion
+from ..deletion import delete_post, delete_user, run_deletion_job
+from ..models import (Comment, DeletionJob, Follow, GroupAuthor, Notification,
+                      Post, PostFingerprint, Trend, User)
+from ..trending import record_post
+
+
+class BackgroundDeletionTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def setUp(self):
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'Пост {i}') for i in range(5)
+        )
+        self.post = Post.objects.create(author=self.reader, text='Чужой')
+        for post in Post.objects.filter(author=self.author):
+            Comment.objects.create(post=post, author=self.reader, text='К')
+        Comment.objects.create(post=self.post, author=self.author, text='К')
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def test_deleted_user_hidden_immediately(self):
+        """Пользователь и его посты пропадают сразу, строки — потом."""
+        job = delete_user(self.author)
+        self.assertFalse(Post.objects.filter(author=self.author).exists())
+        self.assertEqual(
+            Post.all_objects.filter(author=self.author).count(), 5
+        )
+        response = Client().get(
+            reverse('posts:profile', kwargs={'username': 'author'})
+        )
+        self.assertEqual(response.status_code, 404)
+        response = Client().get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        self.assertEqual(len(response.context['comments']), 0)
+        self.assertEqual(job.total, 5 + 1 + 1 + 5 + 1)
+
+    def test_user_removed_in_batches(self):
+        """Фоновая задача удаляет всё пачками и ведёт прогресс."""
+        deletion.BATCH_SIZE, batch_size = 2, deletion.BATCH_SIZE
+        self.addCleanup(setattr, deletion, 'BATCH_SIZE', batch_size)
+        Notification.objects.bulk_create([
+            Notification(recipient=self.reader, author=self.author,
+                         post_id=self.post.pk),
+            Notification(recipient=self.author, author=self.reader,
+                         post_id=self.post.pk),
+        ])
+        job = delete_user(self.author)
+        run_deletion_job(job.pk, time_budget=0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.RUNNING)
+        self.assertEqual(job.deleted, 2)
+
+        run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.DONE)
+        self.assertEqual(job.progress, 100)
+        self.assertFalse(User.objects.filter(username='author').exists())
+        self.assertFalse(Comment.objects.filter(author=self.author).exists())
+        self.assertFalse(Follow.objects.exists())
+        self.assertFalse(Notification.objects.exists())
+        self.assertFalse(
+            GroupAuthor.objects.filter(author=self.author).exists()
+        )
+        self.assertTrue(Post.objects.filter(pk=self.post.pk).exists())
+
+    def test_delete_post(self):
+        """Удаляемый пост сразу даёт 404, а потом удаляется с комментариями."""
+        delete_post(self.post)
+        response = Client().get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        self.assertEqual(response.status_code, 404)
+        run_pending()
+        self.assertFalse(Post.all_objects.filter(pk=self.post.pk).exists())
+        self.assertFalse(Comment.objects.filter(post_id=self.post.pk).exists())
+
+    def test_rows_keyed_by_post_id_removed(self):
+        """Уведомления, тренды и отпечатки удалённых постов не остаются."""
+        posts = list(Post.objects.filter(author=self.author))
+        for post in posts:
+            record_post(post.pk, None, 1)
+            PostFingerprint.objects.create(
+                post_id=post.pk, simhash=0, band0=0, band1=0, band2=0,
+                band3=0
+            )
+        Notification.objects.create(recipient=self.author,
+                                    author=self.reader, post_id=posts[0].pk)
+        Notification.objects.create(recipient=self.reader,
+                                    author=self.reader, post_id=self.post.pk)
+        record_post(self.post.pk, None, 1)
+        delete_post(self.post)
+        delete_user(self.author)
+        run_pending()
+        self.assertFalse(Notification.objects.exists())
+        self.assertFalse(Trend.objects.filter(kind=Trend.POST).exists())
+        self.assertFalse(PostFingerprint.objects.exists())
@@ -0,0 +1,95 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..duplicates import distance, find_duplicate, simhash
+from ..models import Post, PostFingerprint, User
+
+SPAM = ('Купите дешёвые швейцарские часы со скидкой только сегодня, '
+        'доставка по всей России бесплатно, звоните прямо сейчас и '
+        'получите подарок каждому покупателю')
+# Другой регистр, пунктуация и одно заменённое слово.
+SPAM_COPY = ('КУПИТЕ дешёвые швейцарские часы со скидкой только сегодня!!! '
+             'Доставка по всей России бесплатно, звоните прямо сейчас и '
+             'получите подарок любому покупателю')
+OTHER = ('Сегодня в нашей группе обсуждаем новую книгу о путешествиях по '
+         'северу, приходите вечером в библиотеку на встречу с автором')
+
+
+@override_settings(DUPLICATE_POSTS='flag')
+class DuplicatePostsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def publish(self, text):
+        return self.client.post(reverse('posts:post_create'),
+                                {'text': text})
+
+    def test_simhash_close_for_near_copies(self):
+        """Почти копии близки по Хэммингу, разные тексты — далеко."""
+        self.assertLessEqual(distance(simhash(SPAM), simhash(SPAM_COPY)), 3)
+        self.assertGreater(distance(simhash(SPAM), simhash(OTHER)), 3)
+        self.assertIsNone(simhash('Коротко'))
+
+    def test_copy_flagged(self):
+        """Почти копия публикуется и помечается для админки."""
+        self.publish(SPAM)
+        self.publish(SPAM_COPY)
+        self.publish(OTHER)
+        original, copy, other = Post.objects.order_by('pk')
+        self.assertEqual(
+            PostFingerprint.objects.get(post_id=copy.pk).duplicate_of,
+            original.pk,
+        )
+        self.assertIsNone(
+            PostFingerprint.objects.get(post_id=other.pk).duplicate_of
+        )
+
+    @override_settings(DUPLICATE_POSTS='reject')
+    def test_copy_rejected(self):
+        """В режиме reject почти копия не публикуется."""
+        self.publish(SPAM)
+        response = self.publish(SPAM_COPY)
+        self.assertFormError(response, 'form', 'text',
+                             'Почти такой же пост уже опубликован.')
+        self.assertEqual(Post.objects.count(), 1)
+
+    @override_settings(DUPLICATE_POSTS='reject')
+    def test_edit_not_duplicate_of_itself(self):
+        """Правка поста не считается дубликатом его же."""
+        self.publish(SPAM)
+        post = Post.objects.get()
+        response = self.client.post(
+            reverse('posts:post_edit', args=(post.pk,)), {'text': SPAM_COPY}
+        )
+        self.assertRedirects(response,
+                             reverse('posts:post_detail', args=(post.pk,)))
+        self.assertEqual(PostFingerprint.objects.get().simhash,
+                         simhash(SPAM_COPY))
+
+    def test_lookup_is_one_indexed_query(self):
+        """Кандидаты ищутся одним запросом по индексам полос."""
+        self.publish(SPAM)
+        with self.assertNumQueries(1):
+            self.assertIsNotNone(find_duplicate(simhash(SPAM_COPY)))
+
+    def test_backfill(self):
+        """Команда заполняет отпечатки старых постов и помечает копии."""
+        original = Post.objects.create(author=self.user, text=SPAM)
+        copy = Post.objects.create(author=self.user, text=SPAM_COPY)
+        Post.objects.create(author=self.user, text='Коротко')
+        call_command('backfill_fingerprints', pause=0, stdout=StringIO())
+        self.assertEqual(
+            dict(PostFingerprint.objects.values_list('post_id',
+                                                     'duplicate_of')),
+            {original.pk: None, copy.pk: original.pk},
+        )
@@ -0,0 +1,83 @@
+import csv
+import io
+import json
+import shutil
+import tempfile
+import zipfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Comment, Group, Post, User
+from .test_storage import SMALL_GIF
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ExportPostsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug', description='Описание'
+        )
+        cls.post = Post(author=cls.user, group=cls.group,
+                        text='Пост, с запятой')
+        cls.post.image.save('small.gif', ContentFile(SMALL_GIF), save=False)
+        cls.post.save()
+        Post.objects.create(author=cls.user, text='Второй пост')
+        Post.objects.create(
+            author=User.objects.create_user(username='other'),
+            text='Чужой пост'
+        )
+        Comment.objects.create(post=cls.post, author=cls.user, text='Ответ')
+        cls.url = reverse('posts:export_posts', kwargs={'username': 'auth'})
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def download(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_export_contains_only_own_posts(self):
+        """CSV содержит все посты автора и только их."""
+        response, content = self.download(format='csv')
+        self.assertIn('attachment', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(content.decode())))
+        self.assertEqual([row['text'] for row in rows],
+                         ['Пост, с запятой', 'Второй пост'])
+        self.assertEqual(rows[0]['group'], 'test-slug')
+
+    def test_zip_export_with_comments_and_images(self):
+        """Архив содержит посты, комментарии и картинки."""
+        response, content = self.download(format='jsonl', comments='1',
+                                          images='1')
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            posts = [json.loads(line) for line in
+                     archive.read('posts.jsonl').decode().splitlines()]
+            comments = archive.read('comments.jsonl').decode()
+            image = archive.read(f'images/{self.post.image.name}')
+        self.assertEqual(len(posts), 2)
+        self.assertEqual(json.loads(comments)['text'], 'Ответ')
+        self.assertEqual(image, SMALL_GIF)
+
+    def test_export_of_other_user_redirects(self):
+        """Чужую историю выгрузить нельзя."""
+        url = reverse('posts:export_posts', kwargs={'username': 'other'})
+        response = self.client.get(url)
+        self.assertRedirects(
+            response, reverse('posts:profile', kwargs={'username': 'other'})
+        )
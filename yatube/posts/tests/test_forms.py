@@ -1,13 +1,17 @@
+import hashlib
 import shutil
 import tempfile
+from unittest import mock
 
 from django.conf import settings
 from django.utils import timezone
+from django.db.models import F
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
 from ..models import Comment, Post, Group, User
+from ..sharding import get_post_or_404
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -81,12 +85,21 @@ class PostFormTests(TestCase):
         self.assertEqual(post_latest.text, form_data['text'])
         self.assertEqual(post_latest.group.pk, form_data['group'])
         self.assertEqual(post_latest.author, self.user)
+        digest = hashlib.sha256(self.small_gif).hexdigest()
         self.assertTrue(Post.objects.filter(
             group=self.group.pk,
             text=self.post.text,
-            image='posts/small.gif',
+            image=f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif',
         ).exists())
 
+    def test_image_metadata_stored_on_upload(self):
+        """Размеры и цвет картинки сохраняются при загрузке."""
+        self.post.refresh_from_db()
+        self.assertEqual(
+            (self.post.image_width, self.post.image_height), (2, 1)
+        )
+        self.assertRegex(self.post.image_color, r'^#[0-9a-f]{6}$')
+
     def test_text_valid_form_edit_post(self):
         """Валидная форма редактирует запись в Post."""
         form_data = {
@@ -108,6 +121,23 @@ class PostFormTests(TestCase):
         self.assertEqual(post_latest.text, form_data['text'])
         self.assertEqual(post_latest.group.pk, self.group.pk)
 
+    def test_edit_keeps_flushed_views(self):
+        """Редактирование не затирает просмотры, записанные за это время."""
+        def load_then_flush(*args):
+            post = get_post_or_404(*args)
+            Post.objects.filter(pk=post.pk).update(views=F('views') + 5)
+            return post
+
+        with mock.patch('posts.views.get_post_or_404',
+                        side_effect=load_then_flush):
+            self.authorized_client.post(
+                reverse('posts:post_edit', args=(self.post.id,)),
+                data={'text': 'Новый текст'},
+            )
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.text, 'Новый текст')
+        self.assertEqual(post.views, self.post.views + 5)
+
     def test_create_post_guest(self):
         response = self.guest_client.post(
             reverse('posts:post_create'),
@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from ..graph import Adjacency, FollowGraph, follow_graph
+from ..models import Follow, User
+
+SNAPSHOT_DIR = tempfile.mkdtemp()
+SNAPSHOT = os.path.join(SNAPSHOT_DIR, 'graph.bin')
+
+
+class AdjacencyTest(TestCase):
+    def test_changes_over_arrays(self):
+        """Изменения поверх CSR видны сразу и переживают сжатие."""
+        graph = Adjacency.from_pairs([(1, 2), (1, 5), (3, 1)])
+        self.assertEqual(list(graph.neighbours(1)), [2, 5])
+        self.assertEqual(list(graph.neighbours(2)), [])
+        self.assertEqual(list(graph.neighbours(10)), [])
+        self.assertTrue(graph.add(1, 3))
+        self.assertFalse(graph.add(1, 3))
+        self.assertTrue(graph.remove(1, 5))
+        graph.add(7, 1)
+        self.assertEqual(list(graph.neighbours(1)), [2, 3])
+        compacted = graph.compact()
+        self.assertEqual(compacted.pending, 0)
+        for node in range(8):
+            self.assertEqual(list(compacted.neighbours(node)),
+                             list(graph.neighbours(node)))
+            self.assertEqual(graph.degree(node),
+                             len(graph.neighbours(node)))
+
+
+@override_settings(FOLLOW_GRAPH_SNAPSHOT=SNAPSHOT,
+                   WRITE_BEHIND_ENABLED=False)
+class FollowGraphTest(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(SNAPSHOT_DIR, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(username=f'user{number}')
+                      for number in range(5)]
+        me, friend, other_friend, popular, rare = self.users
+        for user, author in [(me, friend), (me, other_friend),
+                             (friend, popular), (other_friend, popular),
+                             (friend, rare)]:
+            Follow.objects.create(user=user, author=author)
+
+    def test_recommends_friends_of_friends(self):
+        """Рекомендации — авторы друзей, по числу общих подписок."""
+        me, _, _, popular, rare = self.users
+        graph = FollowGraph()
+        graph.build()
+        self.assertEqual(graph.recommend(me.pk), [popular.pk, rare.pk])
+        self.assertEqual(graph.recommend(me.pk, 1), [popular.pk])
+
+    def test_follow_views_update_graph(self):
+        """Подписка и отписка через сайт сразу видны в графе."""
+        me, _, _, popular, _ = self.users
+        follow_graph.followers(popular.pk)
+        self.client.force_login(me)
+        self.client.get(reverse('posts:profile_follow',
+                                args=[popular.username]))
+        self.assertIn(me.pk, follow_graph.followers(popular.pk))
+        self.assertNotIn(popular.pk, follow_graph.recommend(me.pk))
+        self.client.get(reverse('posts:profile_unfollow',
+                                args=[popular.username]))
+        self.assertNotIn(popular.pk, follow_graph.following(me.pk))
+
+    def test_unfollow_elsewhere_applied_without_rebuild(self):
+        """Отписки других процессов дочитываются из журнала."""
+        me, friend, _, popular, rare = self.users
+        graph = FollowGraph()
+        graph.build()
+        Follow.objects.filter(user=friend, author=popular).delete()
+        Follow.objects.filter(user=friend, author=rare).delete()
+        Follow.objects.create(user=friend, author=rare)
+        with mock.patch.object(graph, 'build') as build:
+            self.assertEqual(graph.following(friend.pk), [rare.pk])
+            self.assertEqual(graph.follower_count(popular.pk), 1)
+        build.assert_not_called()
+
+    def test_snapshot_catches_up_with_new_follows(self):
+        """Снимок загружается, а подписки после него дочитываются."""
+        me, _, _, popular, rare = self.users
+        graph = FollowGraph()
+        graph.build()
+        graph.save(SNAPSHOT)
+        Follow.objects.create(user=rare, author=me)
+        loaded = FollowGraph()
+        self.assertTrue(loaded.load(SNAPSHOT))
+        self.assertEqual(loaded.followers(me.pk), [rare.pk])
+        self.assertEqual(loaded.followers(popular.pk),
+                         graph.followers(popular.pk))
+
+    def test_follower_page_lists_users(self):
+        """Страница подписчиков показывает их имена."""
+        _, friend, other_friend, popular, _ = self.users
+        response = self.client.get(reverse('posts:followers',
+                                           args=[popular.username]))
+        self.assertEqual(
+            [user.pk for user in response.context['page_obj']],
+            [friend.pk, other_friend.pk],
+        )
+        self.assertContains(response, friend.username)
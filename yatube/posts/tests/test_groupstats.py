@@ -0,0 +1,93 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from core.tasks import run_pending
+
+from ..deletion import delete_post
+from ..groupstats import reconcile
+from ..models import Group, GroupAuthor, GroupStats, Post, User
+
+
+class GroupStatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(title='Первая', slug='first',
+                                         description='Описание')
+        cls.empty = Group.objects.create(title='Вторая', slug='second',
+                                         description='Описание')
+
+    def setUp(self):
+        cache.clear()
+        self.posts = [
+            Post.objects.create(author=self.author, group=self.group,
+                                text=f'Пост {number}')
+            for number in range(3)
+        ]
+        self.latest = Post.objects.create(author=self.other,
+                                          group=self.group, text='Свежий')
+
+    def stats(self, group):
+        return GroupStats.objects.get(group=group)
+
+    def test_counts_follow_posts(self):
+        """Сводка считает посты, последний пост и активных авторов."""
+        stats = self.stats(self.group)
+        self.assertEqual(stats.post_count, 4)
+        self.assertEqual(stats.last_activity, self.latest.pub_date)
+        self.assertEqual(stats.authors, [
+            {'username': 'auth', 'posts': 3},
+            {'username': 'other', 'posts': 1},
+        ])
+
+    def test_move_and_delete_update_stats(self):
+        """Перенос поста в другую группу и удаление меняют сводки."""
+        post = Post.objects.get(pk=self.latest.pk)
+        post.group = self.empty
+        post.save()
+        self.assertEqual(self.stats(self.empty).post_count, 1)
+        stats = self.stats(self.group)
+        self.assertEqual(stats.post_count, 3)
+        self.assertEqual(stats.last_activity, self.posts[-1].pub_date)
+        self.assertEqual(len(stats.authors), 1)
+        post.delete()
+        stats = self.stats(self.empty)
+        self.assertEqual(stats.post_count, 0)
+        self.assertIsNone(stats.last_activity)
+
+    def test_count_not_below_zero(self):
+        """Удаление поста, не попавшего в сводку, не роняет счётчик."""
+        GroupStats.objects.filter(group=self.group).update(post_count=0)
+        GroupAuthor.objects.filter(group=self.group).update(post_count=0)
+        Post.objects.get(pk=self.latest.pk).delete()
+        self.assertEqual(self.stats(self.group).post_count, 0)
+
+    def test_reconcile_fixes_drift(self):
+        """Сверка исправляет сводку после записи в обход сигналов."""
+        Post.objects.filter(pk=self.latest.pk).update(group=self.empty)
+        GroupStats.objects.filter(group=self.group).update(post_count=100)
+        reconcile()
+        self.assertEqual(self.stats(self.group).post_count, 3)
+        self.assertEqual(self.stats(self.empty).post_count, 1)
+
+    def test_hidden_posts_leave_stats(self):
+        """Скрытые до удаления посты сразу уходят из сводок и сверки."""
+        delete_post(self.latest)
+        stats = self.stats(self.group)
+        self.assertEqual(stats.post_count, 3)
+        self.assertEqual(stats.last_activity, self.posts[-1].pub_date)
+        reconcile()
+        self.assertEqual(self.stats(self.group).post_count, 3)
+        run_pending()
+        self.assertEqual(self.stats(self.group).post_count, 3)
+
+    def test_directory_is_one_query(self):
+        """Каталог групп строится одним запросом."""
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('posts:group_index'))
+        self.assertContains(response, self.group.title)
+        self.assertContains(response, self.empty.title)
+        self.assertContains(response, 'auth')
@@ -1,6 +1,9 @@
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
 
-from ..models import Group, Post, User
+from ..models import EXCERPT_LENGTH, Group, Post, User
 
 
 class PostModelTest(TestCase):
@@ -29,3 +32,20 @@ class PostModelTest(TestCase):
         for field, expected_value in expected_object.items():
             with self.subTest(field=field):
                 self.assertEqual(field, expected_value)
+
+    def test_excerpt_is_kept_in_sync_with_text(self):
+        """Анонс пересчитывается при сохранении поста."""
+        post = Post.objects.create(author=self.user, text='а' * 1000)
+        self.assertEqual(len(post.excerpt), EXCERPT_LENGTH)
+        self.assertTrue(post.has_more)
+        post.text = 'Короткий текст'
+        post.save(update_fields=['text'])
+        post.refresh_from_db()
+        self.assertEqual(post.excerpt, 'Короткий текст')
+        self.assertFalse(post.has_more)
+
+    def test_backfill_excerpts(self):
+        Post.objects.filter(pk=self.post.pk).update(excerpt='')
+        call_command('backfill_excerpts', pause=0, stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.excerpt, self.post.text)
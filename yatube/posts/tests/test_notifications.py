@@ -0,0 +1,102 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.tasks import run_pending
+
+from .. import notifications
+from ..models import Follow, Notification, Post, User
+from ..notifications import mark_read, trim, unread_count
+
+
+@override_settings(WRITE_BEHIND_ENABLED=False)
+class NotificationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.readers = [User.objects.create_user(username=f'reader{number}')
+                       for number in range(5)]
+        for reader in cls.readers:
+            Follow.objects.create(user=reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.reader = self.readers[0]
+        self.client.force_login(self.reader)
+
+    def publish(self, text='Новый пост'):
+        author_client = self.client_class()
+        author_client.force_login(self.author)
+        author_client.post(reverse('posts:post_create'), {'text': text})
+        run_pending()
+
+    def test_fan_out_in_batches(self):
+        """Пост рассылается всем подписчикам, пачками по FANOUT_BATCH."""
+        old_batch = notifications.FANOUT_BATCH
+        notifications.FANOUT_BATCH = 2
+        try:
+            self.publish()
+        finally:
+            notifications.FANOUT_BATCH = old_batch
+        post = Post.objects.get(text='Новый пост')
+        self.assertEqual(
+            set(Notification.objects.filter(post_id=post.pk).values_list(
+                'recipient_id', flat=True
+            )),
+            {reader.pk for reader in self.readers},
+        )
+
+    def test_retried_batch_not_duplicated(self):
+        """Повтор пачки после сбоя не дублирует уведомления."""
+        self.publish()
+        post = Post.objects.get(text='Новый пост')
+        notifications.notify_followers(post.pk)
+        self.assertEqual(
+            Notification.objects.filter(post_id=post.pk).count(),
+            len(self.readers),
+        )
+
+    def test_unread_count_in_header(self):
+        """Шапка показывает кешированное число непрочитанных."""
+        self.publish()
+        self.publish('Второй пост')
+        self.assertEqual(unread_count(self.reader.pk), 2)
+        response = self.client.get(reverse('posts:notifications'))
+        self.assertContains(response, 'badge-danger')
+        self.assertContains(response, 'Второй пост')
+
+    def test_mark_read_up_to_seen(self):
+        """Отмечаются прочитанными только показанные уведомления."""
+        self.publish()
+        seen = Notification.objects.get(recipient=self.reader)
+        self.publish('Второй пост')
+        self.client.post(reverse('posts:notifications_read'),
+                         {'up_to': seen.pk})
+        self.assertEqual(unread_count(self.reader.pk), 1)
+        self.assertEqual(mark_read(self.reader.pk), 1)
+        self.assertEqual(unread_count(self.reader.pk), 0)
+
+    def test_trim_keeps_table_bounded(self):
+        """Старые прочитанные и лишние уведомления удаляются."""
+        Notification.objects.bulk_create(
+            Notification(recipient=self.reader, author=self.author,
+                         post_id=number)
+            for number in range(notifications.MAX_PER_USER + 5)
+        )
+        old = Notification.objects.create(recipient=self.readers[1],
+                                          author=self.author, post_id=1,
+                                          is_read=True)
+        Notification.objects.filter(pk=old.pk).update(
+            created=timezone.now() - timedelta(
+                days=notifications.RETENTION_DAYS + 1
+            )
+        )
+        self.assertEqual(trim(), 6)
+        self.assertEqual(
+            Notification.objects.filter(recipient=self.reader).count(),
+            notifications.MAX_PER_USER,
+        )
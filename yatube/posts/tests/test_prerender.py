@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+
+from ..management.commands.prerender import Command
+from ..models import Comment, Group, Post, User
+from ..prerender import render_key, take_dirty
+
+PRERENDER_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(PRERENDER_ENABLED=True, PRERENDER_ROOT=PRERENDER_ROOT,
+                   PRERENDER_PAGES=2, WRITE_BEHIND_ENABLED=False)
+class PrerenderTest(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(PRERENDER_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        shutil.rmtree(PRERENDER_ROOT, ignore_errors=True)
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug', description='Описание'
+        )
+
+    def read(self, *parts):
+        with open(os.path.join(PRERENDER_ROOT, *parts), encoding='utf-8') as f:
+            return f.read()
+
+    def test_full_rebuild_writes_public_pages(self):
+        """Полная пересборка пишет ленты, группы, профили и посты."""
+        Post.objects.bulk_create(
+            Post(author=self.user, group=self.group, text=f'Пост {i}')
+            for i in range(15)
+        )
+        post = Post.objects.latest('pk')
+        call_command('prerender', jobs=1, stdout=StringIO())
+        self.assertIn('Пост 14', self.read('index.html'))
+        self.assertIn('Пост 0', self.read('page-2.html'))
+        self.assertIn('Пост 14',
+                      self.read('group', 'test-slug', 'index.html'))
+        self.assertIn('Пост 14', self.read('profile', 'auth', 'index.html'))
+        self.assertIn('Пост 14',
+                      self.read('posts', str(post.pk), 'index.html'))
+
+    def test_render_ignores_stale_caches(self):
+        """Перерисовка не берёт из кеша фрагменты и запросы."""
+        post = Post.objects.create(author=self.user, text='Первая версия')
+        render_key('index')
+        Post.objects.filter(pk=post.pk).update(text='Вторая версия',
+                                               excerpt='Вторая версия')
+        render_key('index')
+        self.assertIn('Вторая версия', self.read('index.html'))
+
+    def test_changes_regenerate_affected_pages(self):
+        """Изменения перерисовывают только затронутые страницы."""
+        other = Group.objects.create(
+            title='Другая', slug='other', description='Описание'
+        )
+        post = Post.objects.create(
+            author=self.user, group=self.group, text='Старый текст'
+        )
+        self.assertEqual(Command(stdout=StringIO()).process_dirty(), 4)
+        self.assertIn('Старый текст',
+                      self.read('group', 'test-slug', 'index.html'))
+
+        post.text = 'Новый текст'
+        post.group = other
+        post.save()
+        Comment.objects.create(post=post, author=self.user, text='Коммент')
+        keys, _ = take_dirty()
+        self.assertCountEqual(keys, [
+            'index', f'post:{post.pk}', 'profile:auth',
+            'group:test-slug', 'group:other',
+        ])
+        Command(stdout=StringIO()).process_dirty()
+        detail = self.read('posts', str(post.pk), 'index.html')
+        self.assertIn('Новый текст', detail)
+        self.assertIn('Коммент', detail)
+        self.assertIn('Новый текст', self.read('group', 'other', 'index.html'))
+        self.assertNotIn('Новый текст',
+                         self.read('group', 'test-slug', 'index.html'))
+        self.assertFalse(os.path.exists(take_dirty()[1] or ''))
+
+        post_id = post.pk
+        post.delete()
+        Command(stdout=StringIO()).process_dirty()
+        self.assertFalse(os.path.exists(
+            os.path.join(PRERENDER_ROOT, 'posts', str(post_id), 'index.html')
+        ))
@@ -0,0 +1,211 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ..archive import archive_batch
+from ..deletion import delete_user, run_deletion_job
+from ..models import (ArchivedPost, AuthorShard, Comment, Group, IdWorker,
+                      Post, User)
+from ..sharding import (MIN_SHARDED_ID, ShardRouter, hashed_shard, next_id,
+                        shard_for, shard_of_id)
+from ..tasks import generate_thumbnails
+
+SHARDS = ['default', 'other']
+
+
+@override_settings(POST_SHARDS=SHARDS)
+class ShardingTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+
+    def setUp(self):
+        cache.clear()
+        self.router = ShardRouter()
+
+    def test_hash_is_stable_and_spread(self):
+        """Шард автора не меняется между вызовами, авторы делятся поровну."""
+        self.assertEqual(hashed_shard(42), hashed_shard(42))
+        aliases = [hashed_shard(author_id) for author_id in range(1000)]
+        for alias in SHARDS:
+            self.assertGreater(aliases.count(alias), 400)
+
+    def test_id_encodes_shard(self):
+        """По id поста видно, в каком шарде он создан."""
+        first, second = next_id('other'), next_id('other')
+        self.assertLess(first, second)
+        self.assertEqual(shard_of_id(first), 'other')
+        self.assertEqual(shard_of_id(next_id('default')), 'default')
+        self.assertEqual(shard_of_id(MIN_SHARDED_ID - 1), 'default')
+
+    def test_forked_workers_get_distinct_ids(self):
+        """Процессы после fork в одну миллисекунду не выдают один id."""
+        ids = []
+        with mock.patch('time.time', return_value=1700000000.0):
+            for pid in (1001, 1002):
+                with mock.patch('os.getpid', return_value=pid):
+                    ids.append(next_id('other'))
+        self.assertNotEqual(ids[0], ids[1])
+        self.assertEqual(
+            list(IdWorker.objects.filter(
+                pid__in=(1001, 1002)
+            ).values_list('pid', flat=True).order_by('pk')),
+            [1001, 1002],
+        )
+
+    def test_pin_overrides_hash(self):
+        """Закреплённый автор остаётся в своём шарде."""
+        other = next(alias for alias in SHARDS
+                     if alias != hashed_shard(self.user.pk))
+        AuthorShard.objects.create(author_id=self.user.pk, alias=other)
+        self.assertEqual(shard_for(self.user.pk), other)
+
+    def test_router_sends_posts_to_author_shard(self):
+        """Новый пост и комментарий к нему пишутся в шард автора."""
+        post = Post(author=self.user, group=self.group, text='Текст')
+        shard = shard_for(self.user.pk)
+        self.assertEqual(self.router.db_for_write(Post, instance=post),
+                         shard)
+        comment = Comment(post=post, author=self.user, text='Ответ')
+        self.assertEqual(self.router.db_for_write(Comment, instance=comment),
+                         shard)
+        self.assertEqual(self.router.db_for_read(Group), 'default')
+
+    def test_shards_get_only_post_tables(self):
+        """В шарды мигрируются только посты и комментарии."""
+        self.assertTrue(self.router.allow_migrate('other', 'posts', 'post'))
+        self.assertFalse(self.router.allow_migrate('other', 'posts',
+                                                   'follow'))
+        self.assertFalse(self.router.allow_migrate('other', 'auth', 'user'))
+        self.assertIsNone(self.router.allow_migrate('default', 'auth',
+                                                    'user'))
+
+    @override_settings(POST_SHARDS=['default'])
+    def test_single_shard_is_transparent(self):
+        """С одной базой роутер ни во что не вмешивается."""
+        post = Post.objects.create(author=self.user, text='Текст')
+        self.assertLess(post.pk, MIN_SHARDED_ID)
+        self.assertIsNone(self.router.db_for_write(Post, instance=post))
+
+
+TWO_SHARDS = ['default', 'shard1']
+
+
+class TwoShardsTest(TestCase):
+    """Сквозные проверки на двух настоящих базах."""
+
+    databases = {'default', 'shard1'}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Тестовая база shard1 создана до включения шарда, и проверку
+        # внешних ключей на авторов из default для неё никто не снял.
+        cls.constraints = mock.patch.object(
+            connections['shard1'], 'check_constraints',
+            lambda table_names=None: None,
+        )
+        cls.constraints.start()
+        cls.authors = {}
+        number = 0
+        while len(cls.authors) < len(TWO_SHARDS):
+            user = User.objects.create_user(username=f'author{number}')
+            with override_settings(POST_SHARDS=TWO_SHARDS):
+                cls.authors.setdefault(hashed_shard(user.pk), user)
+            number += 1
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.constraints.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_feed_merges_shards_and_detail_finds_post(self):
+        """Лента сливает оба шарда по дате, страница поста находит шард."""
+        with override_settings(POST_SHARDS=TWO_SHARDS):
+            posts = []
+            for alias in TWO_SHARDS * 2:
+                posts.append(Post.objects.create(
+                    author=self.authors[alias], text=f'Пост в {alias}'
+                ))
+            self.assertEqual(
+                Post.objects.using('shard1').count(), 2
+            )
+            response = self.client.get(reverse('posts:index'))
+            self.assertEqual(
+                [post.pk for post in response.context['page_obj']],
+                [post.pk for post in reversed(posts)],
+            )
+            response = self.client.get(reverse(
+                'posts:post_detail', kwargs={'post_id': posts[1].pk}
+            ))
+            self.assertEqual(response.context['post'], posts[1])
+
+    def test_thumbnail_task_finds_post_in_other_shard(self):
+        """Задача миниатюры ищет пост в шарде автора, а не в default."""
+        built = mock.Mock()
+        built.name = 'cache/ab/cd/built.jpg'
+        with override_settings(POST_SHARDS=TWO_SHARDS):
+            post = Post.objects.create(author=self.authors['shard1'],
+                                       text='С картинкой', image='posts/a.gif')
+            with mock.patch('posts.tasks.get_thumbnail', return_value=built):
+                generate_thumbnails(post.pk)
+        self.assertEqual(
+            Post.objects.using('shard1').get(pk=post.pk).thumbnail,
+            built.name,
+        )
+
+    def test_rebalance_moves_author_to_new_shard(self):
+        """После подключения шарда автор переезжает туда с комментариями."""
+        author = self.authors['shard1']
+        post = Post.objects.create(author=author, text='До шардирования')
+        Comment.objects.create(post=post, author=author, text='Ответ')
+        call_command('rebalance_shards', pin=True, stdout=StringIO())
+        with override_settings(POST_SHARDS=TWO_SHARDS):
+            self.assertEqual(shard_for(author.pk), 'default')
+            call_command('rebalance_shards', pause=0, stdout=StringIO())
+            self.assertEqual(shard_for(author.pk), 'shard1')
+            self.assertFalse(Post.all_objects.filter(pk=post.pk).exists())
+            self.assertTrue(Comment.objects.using('shard1').filter(
+                post_id=post.pk
+            ).exists())
+            self.assertFalse(AuthorShard.objects.exists())
+            response = self.client.get(reverse(
+                'posts:post_detail', kwargs={'post_id': post.pk}
+            ))
+            self.assertEqual(response.status_code, 200)
+
+    def test_archive_and_deletion_reach_other_shard(self):
+        """Архивация и удаление автора работают в его шарде."""
+        author = self.authors['shard1']
+        with override_settings(POST_SHARDS=TWO_SHARDS):
+            old = Post.objects.create(author=author, text='Старый')
+            fresh = Post.objects.create(author=author, text='Свежий')
+            Post.objects.using('shard1').filter(pk=old.pk).update(
+                pub_date=timezone.now() - timedelta(days=400)
+            )
+            archive_batch(timezone.now() - timedelta(days=365))
+            self.assertTrue(
+                ArchivedPost.objects.using('shard1').filter(
+                    pk=old.pk
+                ).exists()
+            )
+            job = delete_user(author)
+            run_deletion_job(job.pk)
+            self.assertFalse(Post.all_objects.using('shard1').filter(
+                pk=fresh.pk
+            ).exists())
+            self.assertFalse(ArchivedPost.objects.using('shard1').exists())
+            self.assertFalse(User.objects.filter(pk=author.pk).exists())
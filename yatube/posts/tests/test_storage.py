@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from ..models import ImageBlob, Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, filename):
+        post = Post(author=self.user, text='Пост с картинкой')
+        post.image.save(filename, ContentFile(SMALL_GIF), save=False)
+        post.save()
+        return post
+
+    def test_identical_images_stored_once(self):
+        """Одинаковые картинки хранятся одним файлом."""
+        first = self.create_post('first.gif')
+        second = self.create_post('second.gif')
+        self.assertEqual(first.image.name, second.image.name)
+        directory = os.path.dirname(first.image.path)
+        self.assertEqual(os.listdir(directory), [
+            os.path.basename(first.image.name)
+        ])
+        self.assertEqual(
+            ImageBlob.objects.get(name=first.image.name).refcount, 2
+        )
+
+    def test_delete_releases_reference(self):
+        first = self.create_post('first.gif')
+        second = self.create_post('second.gif')
+        path = first.image.path
+        first.delete()
+        blob = ImageBlob.objects.get(name=second.image.name)
+        self.assertEqual(blob.refcount, 1)
+        second.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.refcount, 0)
+        # Файл без ссылок убирает сборщик, а не удаление поста.
+        self.assertTrue(os.path.exists(path))
+        call_command('gc_media', min_age=0, pause=0, stdout=StringIO())
+        self.assertFalse(ImageBlob.objects.filter(pk=blob.pk).exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_reused_file_survives_gc(self):
+        """Повторная загрузка файла без ссылок защищает его от сборщика."""
+        first = self.create_post('first.gif')
+        path = first.image.path
+        first.delete()
+        os.utime(path, (0, 0))
+        # Файл сохранён повторно, но пост со ссылкой ещё не записан.
+        storage = Post._meta.get_field('image').storage
+        storage.save('posts/again.gif', ContentFile(SMALL_GIF))
+        self.assertGreater(os.path.getmtime(path), 0)
+        call_command('gc_media', min_age=60, pause=0, stdout=StringIO())
+        self.assertTrue(os.path.exists(path))
+
+    def test_gc_media_removes_orphans_only(self):
+        """Сборщик удаляет только файлы без ссылок."""
+        post = self.create_post('kept.gif')
+        orphan = os.path.join(TEMP_MEDIA_ROOT, 'posts', 'orphan.gif')
+        with open(orphan, 'wb') as file:
+            file.write(SMALL_GIF)
+        call_command('gc_media', dry_run=True, min_age=0, stdout=StringIO())
+        self.assertTrue(os.path.exists(orphan))
+        call_command('gc_media', min_age=0, pause=0, stdout=StringIO())
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(post.image.path))
@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import Comment, Follow, Group, Post, Trend, User
+from ..trending import (HALF_LIFE, event_rank, record, trending_groups,
+                        trending_posts, trending_views, trim)
+
+
+class TrendingTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        cls.quiet = Post.objects.create(author=cls.user, text='Тихий пост')
+        cls.hot = Post.objects.create(author=cls.user, group=cls.group,
+                                      text='Обсуждаемый пост')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_scores_add_up_and_decay(self):
+        """События складываются, за HALF_LIFE вклад падает вдвое."""
+        now = timezone.now()
+        record(Trend.POST, self.quiet.pk, 1, now)
+        record(Trend.POST, self.quiet.pk, 1, now)
+        self.assertAlmostEqual(
+            Trend.objects.get(object_id=self.quiet.pk).rank,
+            event_rank(2, now),
+        )
+        self.assertAlmostEqual(
+            event_rank(2, now - timedelta(seconds=HALF_LIFE)),
+            event_rank(1, now),
+        )
+
+    def test_comments_follows_and_views_rank_posts(self):
+        """Комментарии и подписки поднимают пост и группу выше просмотров."""
+        trending_views.increment(self.quiet.pk)
+        trending_views.flush()
+        Comment.objects.create(post=self.hot, author=self.reader,
+                               text='Ответ')
+        Follow.objects.create(user=self.reader, author=self.user)
+        posts = trending_posts()
+        self.assertEqual(posts, [self.hot, self.quiet])
+        # Врезке хватает анонса, полный текст не читается.
+        self.assertIn('text', posts[0].get_deferred_fields())
+        self.assertEqual(trending_groups(), [self.group])
+
+    def test_pages_show_trending_posts(self):
+        """Страница трендов и врезка на главной показывают пост."""
+        Comment.objects.create(post=self.hot, author=self.reader,
+                               text='Ответ')
+        response = self.client.get(reverse('posts:trending'))
+        self.assertEqual(response.context['posts'], [self.hot])
+        self.assertContains(response, self.group.title)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, reverse('posts:trending'))
+
+    def test_trim_drops_faded_scores(self):
+        """Давно затухшие записи удаляются."""
+        record(Trend.POST, self.quiet.pk, 1,
+               timezone.now() - timedelta(seconds=HALF_LIFE * 30))
+        record(Trend.POST, self.hot.pk, 1)
+        self.assertEqual(trim(), 1)
+        self.assertEqual(trending_posts(), [self.hot])
@@ -1,15 +1,19 @@
 import shutil
 import tempfile
+from unittest import mock
 
 from django.conf import settings
 from django.utils import timezone
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
 from django.core.cache import cache
 from django.urls import reverse
 
 from ..models import Post, Group, Comment, Follow, User
 from ..forms import PostForm, CommentForm
+from ..tasks import generate_thumbnails, refresh_feed_counts
+from ..images import thumbnail_size
 
 from posts.views import NUMBERS_OF_POST
 
@@ -225,6 +229,28 @@ class TaskPagesTests(TestCase):
         image = response.context["post"].image
         self.assertEqual(image.read(), self.small_gif)
 
+    def test_thumbnail_from_stored_geometry(self):
+        """Построенная миниатюра выводится без обращения к sorl."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        built = mock.Mock()
+        built.name = 'cache/ab/cd/built.jpg'
+        # Задача ещё не выполнялась — миниатюру строит sorl.
+        with mock.patch('posts.templatetags.thumbnails.get_thumbnail',
+                        return_value=built) as sorl:
+            self.guest_client.get(url)
+        sorl.assert_called_once()
+        with mock.patch('posts.tasks.get_thumbnail', return_value=built):
+            generate_thumbnails(self.post.pk)
+        with mock.patch('posts.templatetags.thumbnails.get_thumbnail') as sorl:
+            response = self.guest_client.get(url)
+        sorl.assert_not_called()
+        self.assertContains(response, 'src="/media/cache/ab/cd/built.jpg"')
+        self.assertContains(response, 'width="350" height="350"')
+        self.assertEqual(thumbnail_size(700, 350), (350, 350))
+        self.assertEqual(
+            thumbnail_size(700, 350, options={'upscale': True}), (350, 175)
+        )
+
     def test_add_comment(self):
         response = self.authorized_client.get(reverse(
             'posts:post_detail', kwargs={'post_id': self.post.id})
@@ -309,6 +335,19 @@ class TaskPagesTests(TestCase):
         text_0_profile = first_object.text
         self.assertEqual(text_0_profile, 'Тестовый пост без группы')
 
+    def test_feeds_defer_full_text(self):
+        """Ленты не загружают полный текст постов."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                post = response.context['page_obj'].object_list[0]
+                self.assertIn('text', post.get_deferred_fields())
+
     def test_cache_index_page(self):
         """Тестирование использование кеширования"""
         cache.clear()
@@ -395,3 +434,31 @@ class PaginatorViewsTest(TestCase):
             len(response.context['page_obj']),
             TEST_NUMBER_OF_POST - NUMBERS_OF_POST
         )
+
+
+class FeedCountsTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.group = Group.objects.create(title='Группа', slug='group',
+                                          description='Описание')
+        Post.objects.create(author=self.user, group=self.group, text='Пост')
+        self.urls = (
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+        )
+
+    def test_refresh_feed_counts_updates_view_counts(self):
+        """Задача пересчитывает ровно те счётчики, что читают ленты."""
+        for url in self.urls:
+            self.client.get(url)
+        Post.objects.create(author=self.user, group=self.group, text='Ещё')
+        refresh_feed_counts(self.user.pk, self.group.pk)
+        with mock.patch('core.paginator.threading.Thread') as thread:
+            for url in self.urls:
+                with self.subTest(url=url):
+                    response = self.client.get(url)
+                    self.assertEqual(
+                        response.context['page_obj'].paginator.count, 2
+                    )
+        thread.assert_not_called()
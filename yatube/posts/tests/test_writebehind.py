@@ -0,0 +1,46 @@
+from django.db import IntegrityError
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from ..models import Comment, Follow, Post, User
+from ..writebehind import WriteBehindQueue, _Write
+
+
+class WriteBehindFlushTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def test_failed_write_does_not_break_batch(self):
+        """Ошибка одной записи не откатывает остальные в пачке."""
+        def broken():
+            raise IntegrityError('сломанная запись')
+
+        batch = [
+            _Write(lambda: Comment.objects.create(
+                post=self.post, author=self.user, text='Первый'
+            )),
+            _Write(broken),
+            _Write(lambda: Comment.objects.create(
+                post=self.post, author=self.user, text='Второй'
+            )),
+        ]
+        WriteBehindQueue().flush(batch)
+        self.assertEqual(Comment.objects.count(), 2)
+        self.assertIsInstance(batch[1].error, IntegrityError)
+        self.assertTrue(all(write.done.is_set() for write in batch))
+
+
+@override_settings(WRITE_BEHIND_ENABLED=True)
+class WriteBehindQueueTest(TransactionTestCase):
+    def test_submit_waits_for_commit(self):
+        """После submit запись уже зафиксирована и видна запросу."""
+        user = User.objects.create_user(username='follower')
+        author = User.objects.create_user(username='auth')
+        WriteBehindQueue().submit(
+            lambda: Follow.objects.get_or_create(user=user, author=author)
+        )
+        self.assertTrue(
+            Follow.objects.filter(user=user, author=author).exists()
+        )
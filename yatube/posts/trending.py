@@ -0,0 +1,144 @@
+"""Популярные посты и группы с экспоненциальным затуханием.
+
+Событие весом ``w`` в момент ``t`` добавляет к популярности
+``w·exp(λ·(t − EPOCH))``, где ``λ = ln 2 / HALF_LIFE``: через
+HALF_LIFE вклад события вдвое меньше, чем у такого же свежего. Сумма
+хранится логарифмом и обновляется одним UPDATE без чтения::
+
+    rank = max(rank, x) + ln(1 + exp(−|rank − x|)),  x = ln w + λ·(t − E)
+
+Список «в тренде» — это первые k строк индекса (kind, -rank).
+"""
+import math
+from datetime import datetime, timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone as django_timezone
+
+from .counters import ViewCounter
+from .models import Comment, Follow, Group, Post, Trend
+from .sharding import for_author, shards
+
+HALF_LIFE = 24 * 60 * 60
+DECAY = math.log(2) / HALF_LIFE
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+VIEW_WEIGHT = 1
+COMMENT_WEIGHT = 5
+FOLLOW_WEIGHT = 10
+TRENDING_POSTS = 20
+TRENDING_GROUPS = 10
+# Записи, затухшие ниже этого веса, удаляются trim_trends.
+MIN_WEIGHT = 0.01
+TRIM_BATCH = 1000
+
+
+def event_rank(weight, when=None):
+    when = when or django_timezone.now()
+    return math.log(weight) + DECAY * (when - EPOCH).total_seconds()
+
+
+def record(kind, object_id, weight, when=None):
+    """Добавляет событие к популярности объекта."""
+    x = event_rank(weight, when)
+    updated = Trend.objects.filter(kind=kind, object_id=object_id).update(
+        rank=Greatest(F('rank'), Value(x))
+        + Ln(Value(1.0) + Exp(-Abs(F('rank') - Value(x))))
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            Trend.objects.create(kind=kind, object_id=object_id, rank=x)
+    except IntegrityError:
+        # Строку успел создать параллельный запрос.
+        record(kind, object_id, weight, when)
+
+
+def record_post(post_id, group_id, weight, when=None):
+    record(Trend.POST, post_id, weight, when)
+    if group_id is not None:
+        record(Trend.GROUP, group_id, weight, when)
+
+
+def record_views(views):
+    """Просмотры {post_id: число}, накопленные счётчиком просмотров."""
+    groups = {}
+    for alias in shards():
+        groups.update(Post.objects.using(alias).filter(
+            pk__in=views
+        ).values_list('pk', 'group_id'))
+    for post_id, count in views.items():
+        if post_id in groups:
+            record_post(post_id, groups[post_id], VIEW_WEIGHT * count)
+
+
+class TrendingViews(ViewCounter):
+    """Просмотры для рейтинга копятся в памяти, как и счётчик просмотров."""
+
+    def write(self, pending):
+        record_views(pending)
+
+
+trending_views = TrendingViews()
+
+
+def _top(kind, limit):
+    return list(Trend.objects.filter(kind=kind).order_by(
+        '-rank'
+    ).values_list('object_id', flat=True)[:limit])
+
+
+def trending_posts(limit=TRENDING_POSTS):
+    """Самые популярные сейчас посты, по убыванию."""
+    # Запас на удалённые и архивные посты, у которых ещё есть строка.
+    ids = _top(Trend.POST, limit * 2)
+    posts = {}
+    for alias in shards():
+        # Авторы и группы лежат в default, join из шарда невозможен.
+        # Списку хватает анонса, как и лентам.
+        posts.update(Post.objects.using(alias).defer('text').prefetch_related(
+            'author', 'group'
+        ).in_bulk(ids))
+    return [posts[pk] for pk in ids if pk in posts][:limit]
+
+
+def trending_groups(limit=TRENDING_GROUPS):
+    ids = _top(Trend.GROUP, limit)
+    groups = Group.objects.in_bulk(ids)
+    return [groups[pk] for pk in ids if pk in groups]
+
+
+def trim(now=None):
+    """Удаляет записи, чья популярность затухла почти до нуля."""
+    stale = Trend.objects.filter(rank__lt=event_rank(MIN_WEIGHT, now))
+    deleted = 0
+    # delete() загружает строки ради сигналов (кеш запросов слушает
+    # удаление любой модели), поэтому пачками.
+    while True:
+        pks = list(stale.values_list('pk', flat=True)[:TRIM_BATCH])
+        if not pks:
+            return deleted
+        deleted += Trend.objects.filter(pk__in=pks).delete()[0]
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        post = instance.post
+        record_post(post.pk, post.group_id, COMMENT_WEIGHT)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    # Подписка поднимает последний пост автора и его группу.
+    if not created:
+        return
+    latest = for_author(Post.objects, instance.author_id).filter(
+        author_id=instance.author_id
+    ).order_by('-pub_date').values_list('pk', 'group_id').first()
+    if latest is not None:
+        record_post(*latest, FOLLOW_WEIGHT)
@@ -4,6 +4,7 @@ from . import views
 app_name = 'posts'
 
 urlpatterns = [
+    path('group/', views.group_index, name='group_index'),
     path('group/<slug:slug>/', views.group_posts, name='group_posts'),
     path('', views.index, name='index'),
     path('profile/<str:username>/', views.profile, name='profile'),
@@ -14,6 +15,28 @@ urlpatterns = [
         'posts/<int:post_id>/comment/', views.add_comment, name='add_comment'
     ),
     path('follow/', views.follow_index, name='follow_index'),
+    path('trending/', views.trending, name='trending'),
+    path('notifications/', views.notifications, name='notifications'),
+    path(
+        'notifications/read/',
+        views.notifications_read,
+        name='notifications_read'
+    ),
+    path(
+        'profile/<str:username>/export/',
+        views.export_posts,
+        name='export_posts'
+    ),
+    path(
+        'profile/<str:username>/followers/',
+        views.follower_list,
+        name='followers'
+    ),
+    path(
+        'profile/<str:username>/following/',
+        views.following_list,
+        name='following'
+    ),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
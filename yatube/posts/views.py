@@ -1,16 +1,37 @@
-from django.shortcuts import redirect, render, get_object_or_404
 from django.core.paginator import Paginator
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+from django.shortcuts import redirect, render
 from django.contrib.auth.decorators import login_required
 
-from .models import Post, Group, Comment, Follow, User
+from core.paginator import (CachedCountPaginator, ChainedSequence,
+                            cached_count)
+from core.querycache import cached_exists, get_object_or_404_cached
+from core.ratelimit import ratelimit
+from core.streaming import render_streaming
+
+from .models import ArchivedPost, Post, Group, Follow, Notification, User
+from .counters import view_counter
+from .duplicates import remember
+from .export import EXPORT_FORMATS, export_files, stream_zip
 from .forms import CommentForm, PostForm
+from .graph import (follower_count, follower_ids, following_count,
+                    following_ids, recommended_ids)
+from .notifications import mark_read, notify_followers
+from .prerender import PRERENDER_HEADER
+from .sharding import (followed_posts, for_author, get_post, get_post_or_404,
+                       scatter, visible_comments)
+from .tasks import generate_thumbnails, refresh_feed_counts
+from .trending import trending_groups, trending_posts, trending_views
+from .writebehind import write_behind
 
 NUMBERS_OF_POST = 10
+NUMBERS_OF_USERS = 20
 
 
 def index(request):
-    post_list = Post.objects.all().order_by('-pub_date')
-    paginator = Paginator(post_list, NUMBERS_OF_POST)
+    post_list = scatter(Post.objects.defer('text').order_by('-pub_date'))
+    paginator = CachedCountPaginator(post_list, NUMBERS_OF_POST)
     title = 'Последние обновления на сайте'
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
@@ -18,75 +39,165 @@ def index(request):
         'title': title,
         'page_obj': page_obj,
     }
-    return render(request, 'posts/index.html', context)
+    return render_streaming(request, 'posts/index.html', context)
+
+
+def group_index(request):
+    # Сводки поддерживаются при записи, поэтому хватает одного запроса.
+    groups = Group.objects.select_related('stats').order_by('title')
+    context = {
+        'title': 'Группы',
+        'groups': groups,
+    }
+    return render(request, 'posts/group_index.html', context)
 
 
 def group_posts(request, slug):
     template = 'posts/group_list.html'
-    group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all().order_by('-pub_date')
-    paginator = Paginator(post_list, NUMBERS_OF_POST)
+    group = get_object_or_404_cached(Group, slug=slug)
+    post_list = scatter(group.posts.defer('text').order_by('-pub_date'))
+    paginator = CachedCountPaginator(post_list, NUMBERS_OF_POST)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     context = {
         'group': group,
         'page_obj': page_obj,
     }
-    return render(request, template, context)
+    return render_streaming(request, template, context)
 
 
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = Post.objects.filter(author=author).order_by('-pub_date')
-    paginator = Paginator(post_list, NUMBERS_OF_POST)
-    post_count = post_list.filter(author_id=author).count()
+    author = get_object_or_404_cached(User, username=username,
+                                      is_active=True)
+    # Архивные посты старше любого горячего, поэтому идут следом.
+    post_list = ChainedSequence(
+        for_author(Post.objects, author.pk).filter(
+            author=author
+        ).defer('text').order_by('-pub_date'),
+        for_author(ArchivedPost.objects, author.pk).filter(
+            author=author
+        ).defer('text').order_by('-pub_date'),
+    )
+    paginator = CachedCountPaginator(post_list, NUMBERS_OF_POST)
+    post_count = paginator.count
     title = f'Профайл пользователя {author}'
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     following = False
+    recommendations = []
     if request.user.is_authenticated:
-        if Follow.objects.filter(author=author, user=request.user).exists():
-            following = True
+        following = cached_exists(
+            Follow.objects.filter(author=author, user=request.user)
+        )
+        if request.user == author:
+            recommendations = _users_in_order(recommended_ids(author.pk))
     context = {
         'title': title,
         'page_obj': page_obj,
         'author': author,
         'post_count': post_count,
-        'following': following
+        'following': following,
+        'follower_count': follower_count(author.pk),
+        'following_count': following_count(author.pk),
+        'recommendations': recommendations,
+    }
+    return render_streaming(request, 'posts/profile.html', context)
+
+
+def _users_in_order(user_ids):
+    """Активные пользователи в порядке id из графа, одним запросом."""
+    users = User.objects.filter(is_active=True).in_bulk(user_ids)
+    return [users[pk] for pk in user_ids if pk in users]
+
+
+def _follow_list(request, username, get_ids, title):
+    author = get_object_or_404_cached(User, username=username,
+                                      is_active=True)
+    paginator = CachedCountPaginator(get_ids(author.pk), NUMBERS_OF_USERS)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    page_obj.object_list = _users_in_order(page_obj.object_list)
+    context = {
+        'title': f'{title} {author}',
+        'author': author,
+        'page_obj': page_obj,
     }
-    return render(request, 'posts/profile.html', context)
+    return render(request, 'posts/follow_list.html', context)
+
+
+def follower_list(request, username):
+    return _follow_list(request, username, follower_ids, 'Подписчики')
+
+
+def following_list(request, username):
+    return _follow_list(request, username, following_ids, 'Подписки')
 
 
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    comments = Comment.objects.filter(post=post).order_by('-created')
+    try:
+        post = get_post(Post, post_id)
+    except Post.DoesNotExist:
+        post = get_post_or_404(ArchivedPost, post_id)
+    archived = isinstance(post, ArchivedPost)
+    views = post.views
+    if not archived:
+        if PRERENDER_HEADER not in request.META:
+            view_counter.increment(post.pk)
+            trending_views.increment(post.pk)
+        views += view_counter.pending(post.pk)
+    # Комментарии удаляемых пользователей скрыты до их удаления.
+    comments = visible_comments(post)
     form = CommentForm(request.POST or None)
     author = post.author
-    post_count = Post.objects.filter(author=author).count()
+    post_count = sum(
+        cached_count(for_author(model.objects, author.pk).filter(
+            author=author
+        )) for model in (Post, ArchivedPost)
+    )
     context = {
         'post': post,
         'author': author,
         'post_count': post_count,
+        'views': views,
+        'archived': archived,
         'form': form,
         'comments': comments
     }
-    return render(request, 'posts/post_detail.html', context)
+    return render_streaming(request, 'posts/post_detail.html', context)
+
+
+def trending(request):
+    context = {
+        'title': 'Сейчас в тренде',
+        'posts': trending_posts(),
+        'groups': trending_groups(),
+    }
+    return render(request, 'posts/trending.html', context)
+
+
+def schedule_post_tasks(post):
+    if post.image:
+        generate_thumbnails.delay(post.pk)
+    refresh_feed_counts.delay(post.author_id, post.group_id)
 
 
 @login_required
+@ratelimit('post')
 def post_create(request):
     form = PostForm(request.POST or None)
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        remember(post, form.fingerprint, form.duplicate_of)
+        schedule_post_tasks(post)
+        notify_followers.delay(post.pk)
         return redirect('posts:profile', username=post.author)
     return render(request, 'posts/create_post.html', {'form': form})
 
 
 @login_required
 def post_edit(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_post_or_404(Post, post_id)
     if request.user != post.author:
         return redirect('posts:post_detail', post_id=post_id)
     form = PostForm(
@@ -96,7 +207,12 @@ def post_edit(request, post_id):
 
     )
     if form.is_valid():
-        form.save()
+        post = form.save(commit=False)
+        # Только поля формы: views за это время мог увеличить сброс
+        # счётчика просмотров, перезаписывать его старым числом нельзя.
+        post.save(update_fields=PostForm.Meta.fields)
+        remember(post, form.fingerprint, form.duplicate_of)
+        schedule_post_tasks(post)
         return redirect('posts:post_detail', post_id=post_id)
     context = {
         'form': form,
@@ -106,23 +222,24 @@ def post_edit(request, post_id):
 
 
 @login_required
+@ratelimit('comment')
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_post_or_404(Post, post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        write_behind.submit(comment.save)
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(
-        author__following__user=request.user
-    ).order_by('-pub_date')
-    paginator = Paginator(post_list, NUMBERS_OF_POST)
+    post_list = followed_posts(
+        Post.objects.defer('text').order_by('-pub_date'), request.user
+    )
+    paginator = CachedCountPaginator(post_list, NUMBERS_OF_POST)
     title = 'Ваши подписки'
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
@@ -130,21 +247,84 @@ def follow_index(request):
         'title': title,
         'page_obj': page_obj
     }
-    return render(request, 'posts/follow.html', context)
+    return render_streaming(request, 'posts/follow.html', context)
+
+
+@login_required
+def notifications(request):
+    notification_list = Notification.objects.filter(
+        recipient=request.user
+    ).select_related('author').order_by('-pk')
+    # Кешированное число CachedCountPaginator живёт, пока не сменится
+    # поколение модели, а рассылка (bulk_create) и прочтение (update)
+    # идут без сигналов и его не меняют: число отставало бы. Счёт по
+    # индексу получателя и так дешёвый.
+    paginator = Paginator(notification_list, NUMBERS_OF_POST)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    page_obj.object_list = list(page_obj.object_list)
+    context = {
+        'title': 'Уведомления',
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/notifications.html', context)
+
+
+@login_required
+@require_POST
+def notifications_read(request):
+    # Только то, что пользователь видел: пришедшее после останется новым.
+    up_to = request.POST.get('up_to', '')
+    mark_read(request.user.pk, int(up_to) if up_to.isdigit() else None)
+    return redirect('posts:notifications')
 
 
 @login_required
+@ratelimit('follow', methods=('GET', 'POST'))
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404_cached(User, username=username)
     user = request.user
     if user != author:
-        Follow.objects.get_or_create(user=user, author=author)
+        write_behind.submit(
+            lambda: Follow.objects.get_or_create(user=user, author=author)
+        )
     return redirect('posts:profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404_cached(User, username=username)
     user = request.user
-    Follow.objects.filter(user=user, author=author).delete()
+    write_behind.submit(
+        lambda: Follow.objects.filter(user=user, author=author).delete()
+    )
     return redirect('posts:profile', username=username)
+
+
+@login_required
+def export_posts(request, username):
+    if request.user.username != username:
+        return redirect('posts:profile', username=username)
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest('Неизвестный формат выгрузки')
+    with_comments = bool(request.GET.get('comments'))
+    with_images = bool(request.GET.get('images'))
+    if with_comments or with_images:
+        # Несколько файлов отдаются одним архивом.
+        response = StreamingHttpResponse(
+            stream_zip(request.user, export_format, with_comments,
+                       with_images),
+            content_type='application/zip',
+        )
+        filename = f'yatube-{username}.zip'
+    else:
+        _, chunks = next(export_files(request.user, export_format, False))
+        response = StreamingHttpResponse(
+            chunks,
+            content_type=('text/csv; charset=utf-8'
+                          if export_format == 'csv'
+                          else 'application/x-ndjson; charset=utf-8'),
+        )
+        filename = f'yatube-{username}-posts.{export_format}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
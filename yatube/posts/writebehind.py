@@ -0,0 +1,98 @@
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# Сколько записей фиксируется одной транзакцией.
+BATCH_SIZE = 50
+# Сколько поток записи ждёт попутчиков для пачки, секунд. Это же
+# верхняя граница добавочной задержки одной записи.
+LINGER = 0.01
+# Сколько запрос ждёт фиксации своей записи, прежде чем сдаться.
+WAIT_TIMEOUT = 30
+
+
+class _Write:
+    def __init__(self, apply):
+        self.apply = apply
+        self.done = threading.Event()
+        self.error = None
+
+
+class WriteBehindQueue:
+    """Групповая фиксация мелких записей в SQLite.
+
+    Запросы кладут записи в очередь процесса, а один поток фиксирует их
+    пачками: много записей — одна блокировка базы и один fsync. Запрос
+    ждёт фиксации своей записи, так что после редиректа пользователь
+    сразу видит результат, а ошибки записи поднимаются в самом запросе.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, linger=LINGER):
+        self.batch_size = batch_size
+        self.linger = linger
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, apply):
+        if (not settings.WRITE_BEHIND_ENABLED
+                or connection.in_atomic_block):
+            # Внутри открытой транзакции запись должна попасть в неё же.
+            return apply()
+        write = _Write(apply)
+        self._ensure_worker()
+        self._queue.put(write)
+        if not write.done.wait(WAIT_TIMEOUT):
+            raise TimeoutError('Write-behind queue did not flush in time')
+        if write.error is not None:
+            raise write.error
+
+    def _ensure_worker(self):
+        # После fork потока в дочернем процессе нет — запускаем заново.
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='write-behind', daemon=True
+                )
+                self._thread.start()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get(timeout=self.linger))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            self.flush(self._next_batch())
+
+    def flush(self, batch):
+        try:
+            with transaction.atomic():
+                for write in batch:
+                    try:
+                        with transaction.atomic():
+                            write.apply()
+                    except Exception as error:
+                        write.error = error
+        except Exception as error:
+            logger.exception('Write-behind batch of %d failed', len(batch))
+            connection.close()
+            for write in batch:
+                write.error = write.error or error
+        finally:
+            for write in batch:
+                write.done.set()
+
+
+write_behind = WriteBehindQueue()
@@ -0,0 +1,18 @@
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.admin import UserAdmin
+
+from posts.admin import BackgroundDeleteMixin
+from posts.deletion import delete_user
+from posts.models import DeletionJob
+
+User = get_user_model()
+
+
+class BackgroundDeleteUserAdmin(BackgroundDeleteMixin, UserAdmin):
+    delete_function = staticmethod(delete_user)
+    deletion_kind = DeletionJob.USER
+
+
+admin.site.unregister(User)
+admin.site.register(User, BackgroundDeleteUserAdmin)
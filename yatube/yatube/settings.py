@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.FirstFastRequestMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,6 +79,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'core.context_processors.year.year',
+                'posts.context_processors.notifications.notifications',
             ],
         },
     },
@@ -93,9 +95,19 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'OPTIONS': {
+            # Ждать освобождения блокировки записи, а не падать сразу.
+            'timeout': 20,
+        },
     }
 }
 
+# Базы с постами и комментариями (см. posts.sharding). Новый шард
+# добавляется и в DATABASES, и сюда — только в конец списка: по номеру
+# в списке шард находится по id поста.
+POST_SHARDS = ['default']
+DATABASE_ROUTERS = ['posts.sharding.ShardRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -137,15 +149,31 @@ STATIC_URL = '/static/'
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
+# collectstatic кладёт сюда статику с хешами в именах и её сжатые копии
+# .gz/.br; в проде её отдаёт core.staticfiles.PrecompressedStaticFiles.
+STATIC_ROOT = os.path.join(BASE_DIR, 'static_collected')
+STATICFILES_STORAGE = 'core.staticfiles.CompressedManifestStaticFilesStorage'
+
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 
-EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+# Письма уходят через очередь фоновых задач (см. core.mail), а
+# исполнитель отправляет их через QUEUED_EMAIL_BACKEND.
+EMAIL_BACKEND = 'core.mail.QueuedEmailBackend'
+QUEUED_EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
+# Кеш общий для всех процессов: веб-воркеров, run_workers и
+# prerender --watch. На нём держатся сброс querycache, счётчики лент,
+# сверка графа подписок, блокировки пересчёта core.cache и ведра
+# core.ratelimit — с кешем в памяти процесса запись в одном воркере не
+# видна остальным. Всё это опирается на атомарные add и incr, поэтому
+# нужен memcached: у файлового кеша и кеша в базе они — чтение и
+# запись по отдельности.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': os.environ.get('MEMCACHED_LOCATION', '127.0.0.1:11211'),
     }
 }
 
@@ -154,3 +182,73 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
+
+# Групповая фиксация комментариев и подписок (см. posts.writebehind).
+WRITE_BEHIND_ENABLED = True
+
+# Фоновый сброс счётчиков просмотров (см. posts.counters).
+VIEW_FLUSH_THREAD = True
+
+# Прогрев процесса при старте WSGI-приложения (см. core.warmup).
+WARMUP_ON_START = True
+# Запрос быстрее этого порога (в секундах) считается «быстрым».
+FAST_REQUEST_THRESHOLD = 0.1
+
+# Отдавать страницы лент потоком (см. core.streaming). В DEBUG выключено:
+# debug toolbar и тестовый клиент работают только с обычным ответом.
+STREAMING_RESPONSES = not DEBUG
+
+# Выполнять фоновые задачи сразу в запросе, без run_workers.
+TASKS_EAGER = False
+
+# Готовые HTML-файлы публичных страниц (см. posts.prerender).
+PRERENDER_ENABLED = False
+PRERENDER_ROOT = os.path.join(BASE_DIR, 'prerendered')
+# Сколько первых страниц каждой ленты пререндерить.
+PRERENDER_PAGES = 3
+
+# Снимок графа подписок (см. posts.graph, snapshot_follow_graph).
+FOLLOW_GRAPH_SNAPSHOT = os.path.join(BASE_DIR, 'follow_graph.bin')
+
+# Что делать с почти дубликатом уже опубликованного поста (см.
+# posts.duplicates): 'reject' — не публиковать, 'flag' — опубликовать и
+# показать в админке, None — не проверять.
+DUPLICATE_POSTS = 'flag'
+
+# Частота записи на пользователя (см. core.ratelimit); IP получает
+# в IP_FACTOR раз больше.
+RATELIMIT_ENABLED = True
+RATE_LIMITS = {
+    'post': '10/m',
+    'comment': '20/m',
+    'follow': '30/m',
+    'signup': '5/h',
+}
+# Одновременных запросов на запись во всех процессах машины и сколько
+# секунд ждать свободного места, прежде чем ответить 503. Места — это
+# файловые замки в WRITE_SLOTS_DIR.
+WRITE_CONCURRENCY = 8
+SHED_TIMEOUT = 2
+WRITE_SLOTS_DIR = os.path.join(BASE_DIR, 'write_slots')
+# Адреса обратных прокси (nginx и т. п.). От них IP клиента берётся
+# из заголовка RATELIMIT_PROXY_HEADER, иначе все посетители за прокси
+# делили бы одно ведро. Остальным заголовок не доверяется: его может
+# подставить кто угодно.
+RATELIMIT_TRUSTED_PROXIES = []
+RATELIMIT_PROXY_HEADER = 'HTTP_X_FORWARDED_FOR'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
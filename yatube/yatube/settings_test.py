@@ -0,0 +1,32 @@
+"""Настройки для тестов: ``manage.py test`` и pytest берут их сами."""
+import os
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES, LOGGING
+
+# Тестам нужен чистый кеш на каждый прогон, а не общий memcached.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Второй шард для сквозных тестов (posts.tests.test_sharding); в
+# POST_SHARDS его включают сами тесты.
+DATABASES = {
+    **DATABASES,
+    'shard1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'shard1.sqlite3'),
+    },
+}
+
+# Поток писал бы в тестовую базу мимо транзакции теста.
+VIEW_FLUSH_THREAD = False
+
+# Замки мест для записи — свои, не рабочего сервера.
+WRITE_SLOTS_DIR = tempfile.mkdtemp(prefix='yatube-write-slots-')
+
+# В консоль — только предупреждения и ошибки.
+LOGGING['loggers']['core']['level'] = 'WARNING'